@@ -0,0 +1,157 @@
+"""
+Native async read path for the catalog, for deployments served through `store_backend.asgi`.
+
+These views use Django's async ORM and take everything else from the sync viewsets: their filter
+backends (`type`, `min_price`, `max_price`, `in_stock`, `ordering`), `?fields=` and the compiled
+ValuesSerializer, so the output matches the sync listing field for field and bad parameters get
+the same 400. Listings use the same cursor as CatalogCursorPagination (a position on the leading
+ordering field plus an offset past ties), so a `next` link from either path can be followed on
+the other. Only forward paging is served here; `previous` is always null.
+"""
+import base64
+from urllib import parse
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+from .fast_serializers import get_values_serializer
+from .fieldsets import requested_fields
+from .views import ProductTypeViewSet, ProductViewSet
+
+
+# CursorPagination.offset_cutoff
+OFFSET_CUTOFF = 1000
+
+
+def encode_cursor(offset, position):
+    tokens = {}
+    if offset:
+        tokens['o'] = str(offset)
+    if position is not None:
+        tokens['p'] = position
+    querystring = parse.urlencode(tokens, doseq=True)
+    return base64.b64encode(querystring.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (offset, position) encoded in a forward cursor, or None if it is not one.
+    """
+    try:
+        tokens = parse.parse_qs(base64.b64decode(cursor.encode('ascii')).decode('ascii'), keep_blank_values=True)
+        offset = int(tokens.get('o', ['0'])[0])
+        if int(tokens.get('r', ['0'])[0]) or offset < 0:
+            return None
+        return min(offset, OFFSET_CUTOFF), tokens.get('p', [None])[0]
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+
+
+def get_page_size(request):
+    page_size = getattr(settings, 'CATALOG_PAGE_SIZE', 50)
+    max_page_size = getattr(settings, 'CATALOG_MAX_PAGE_SIZE', 200)
+    try:
+        requested = int(request.GET.get('page_size', page_size))
+    except ValueError:
+        return page_size
+    return min(requested, max_page_size) if requested > 0 else page_size
+
+
+def not_found(model):
+    return JsonResponse({'detail': f'No {model._meta.object_name} matches the given query.'}, status=404)
+
+
+def position_of(row, ordering):
+    return str(row[ordering[0].lstrip('-')])
+
+
+def next_cursor(page, following, offset, position, page_size, ordering):
+    """
+    The forward cursor CursorPagination.get_next_link builds for `page`, where `following` is
+    the first row after it: the last position in the page that differs from the following row's,
+    plus how many rows to skip past it.
+    """
+    compare = position_of(following, ordering)
+    skip = 0
+    for row in reversed(page):
+        row_position = position_of(row, ordering)
+        if row_position != compare:
+            return encode_cursor(skip, row_position)
+        compare = row_position
+        skip += 1
+    # the whole page shares one position
+    if position is None and not offset:
+        return encode_cursor(page_size, None)
+    return encode_cursor(offset + page_size, position)
+
+
+async def keyset_list(request, viewset):
+    drf_request = Request(request)
+    view = viewset(request=drf_request, action='list', format_kwarg=None)
+    try:
+        values_serializer = get_values_serializer(viewset.serializer_class, requested_fields(drf_request))
+        queryset = viewset.queryset.model.objects.order_by('id')
+        for backend in view.filter_backends:
+            queryset = backend().filter_queryset(drf_request, queryset, view)
+    except ValidationError as exc:
+        return JsonResponse(exc.detail, status=400)
+    ordering = queryset.query.order_by
+
+    page_size = get_page_size(request)
+    offset, position = 0, None
+    cursor = request.GET.get('cursor')
+    if cursor:
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            return JsonResponse({'detail': 'Invalid cursor'}, status=404)
+        offset, position = decoded
+    if position is not None:
+        lookup = 'lt' if ordering[0].startswith('-') else 'gt'
+        try:
+            queryset = queryset.filter(**{f'{ordering[0].lstrip("-")}__{lookup}': position})
+        except ValueError:
+            return JsonResponse({'detail': 'Invalid cursor'}, status=404)
+
+    rows = [row async for row in values_serializer.rows(queryset)[offset:offset + page_size + 1]]
+    page = rows[:page_size]
+    next_url = None
+    if len(rows) > page_size:
+        query = request.GET.copy()
+        query['cursor'] = next_cursor(page, rows[-1], offset, position, page_size, ordering)
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+    return JsonResponse({'next': next_url, 'previous': None, 'results': values_serializer.many(page)})
+
+
+async def detail(request, viewset, pk):
+    try:
+        values_serializer = get_values_serializer(viewset.serializer_class, requested_fields(Request(request)))
+    except ValidationError as exc:
+        return JsonResponse(exc.detail, status=400)
+    model = viewset.queryset.model
+    row = await model.objects.values(*values_serializer.columns).filter(pk=pk).afirst()
+    if row is None:
+        return not_found(model)
+    return JsonResponse(values_serializer.to_representation(row))
+
+
+@require_GET
+async def product_list(request):
+    return await keyset_list(request, ProductViewSet)
+
+
+@require_GET
+async def product_detail(request, pk):
+    return await detail(request, ProductViewSet, pk)
+
+
+@require_GET
+async def product_type_list(request):
+    return await keyset_list(request, ProductTypeViewSet)
+
+
+@require_GET
+async def product_type_detail(request, pk):
+    return await detail(request, ProductTypeViewSet, pk)
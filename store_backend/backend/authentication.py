@@ -0,0 +1,125 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import CacheStats
+
+
+TOKEN_CACHE_DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60,
+    'SHARED_CACHE': None,
+}
+
+
+def get_token_cache_setting(name):
+    return getattr(settings, 'TOKEN_CACHE', {}).get(name, TOKEN_CACHE_DEFAULTS[name])
+
+
+class TokenCache:
+    """
+    Thread-safe in-process LRU of token key -> Token (with its user), with a TTL per entry.
+    If TOKEN_CACHE['SHARED_CACHE'] names a Django cache alias, that cache replaces the local LRU,
+    so an invalidation in one process (user saved, token deleted) takes effect in all of them.
+
+    Invalidation hangs off post_save/post_delete (see signals.py). Bulk writes such as
+    `CustomerUser.objects.filter(...).update(is_active=False)` send no signals, so the affected
+    tokens keep authenticating until their TTL runs out unless the caller invalidates them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.stats = CacheStats()
+
+    def shared_cache(self):
+        alias = get_token_cache_setting('SHARED_CACHE')
+        return caches[alias] if alias else None
+
+    def shared_key(self, key):
+        return f'auth:token:{key}'
+
+    def get(self, key):
+        shared = self.shared_cache()
+        if shared is not None:
+            token = shared.get(self.shared_key(key))
+            self.stats.record(hit=token is not None)
+            return token
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, token = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats.record(hit=True)
+                    return token
+                del self._entries[key]
+        self.stats.record(hit=False)
+        return None
+
+    def set(self, key, token):
+        shared = self.shared_cache()
+        if shared is not None:
+            shared.set(self.shared_key(key), token, timeout=get_token_cache_setting('TTL'))
+        else:
+            self._store(key, token)
+
+    def _store(self, key, token):
+        expires_at = time.monotonic() + get_token_cache_setting('TTL')
+        with self._lock:
+            self._entries[key] = (expires_at, token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > get_token_cache_setting('MAX_ENTRIES'):
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        shared = self.shared_cache()
+        if shared is not None:
+            shared.delete_many([self.shared_key(key) for key in keys])
+
+    def invalidate_user(self, user_id):
+        """
+        Drops every cached token belonging to `user_id` from the local LRU. Shared entries
+        are dropped by the caller, which knows the user's token keys.
+        """
+        with self._lock:
+            stale = [key for key, (_, token) in self._entries.items() if token.user_id == user_id]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.stats.reset()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that skips the token+user query for recently seen tokens.
+    Each request gets its own copy of the cached user, so views can mutate request.user safely.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token.user, token
@@ -0,0 +1,109 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .models import Product, ProductType
+
+
+WORDS = (
+    'laptop phone tablet chair desk lamp cable charger monitor keyboard mouse speaker headphones '
+    'camera lens tripod printer router switch battery backpack bottle kettle blender toaster '
+    'wireless portable compact premium classic modern ergonomic waterproof rechargeable smart'
+).split()
+
+
+@contextmanager
+def rollback():
+    """
+    Runs the block in a transaction that is always rolled back, so benchmarks can seed
+    data into the configured database without leaving anything behind.
+    """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@contextmanager
+def shared_connection(alias=DEFAULT_DB_ALIAS):
+    """
+    Lets worker threads started with `use_connection` run on this thread's connection, so the
+    requests they make see rows seeded inside `rollback()`. Their queries are serialized on that
+    one connection. Test clients send the request signals, whose close_old_connections would
+    close it mid-transaction, so that is a no-op within the block.
+    """
+    connection = connections[alias]
+    connection.inc_thread_sharing()
+    connection.close_if_unusable_or_obsolete = lambda: None
+    try:
+        yield connection
+    finally:
+        del connection.close_if_unusable_or_obsolete
+        connection.dec_thread_sharing()
+
+
+def use_connection(connection):
+    """
+    Thread pool initializer that points the worker thread at `connection`.
+    """
+    connections[connection.alias] = connection
+
+
+def seed_catalog(rows, types=10, batch_size=5000, seed=0):
+    """
+    Bulk-creates `types` product types and `rows` products with pseudo-random text.
+    Returns the list of created product types.
+    """
+    rng = random.Random(seed)
+    product_types = ProductType.objects.bulk_create(
+        [ProductType(name=f'Type {i}') for i in range(types)])
+    for start in range(0, rows, batch_size):
+        Product.objects.bulk_create([
+            Product(
+                name=' '.join(rng.choices(WORDS, k=3) + [f'sku{index:07d}']),
+                description=' '.join(rng.choices(WORDS, k=60)),
+                type=rng.choice(product_types),
+                price=rng.randint(1, 5000),
+                ammount=rng.randint(0, 50),
+            )
+            for index in range(start, min(start + batch_size, rows))
+        ])
+    return product_types
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    Summarizes a list of durations (seconds) as milliseconds.
+    """
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+
+def measure(fn, repeat):
+    """
+    Calls `fn` `repeat` times and returns the latency summary.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def format_summary(label, summary):
+    return (f"{label:<24} n={summary['count']:<5} mean={summary['mean_ms']:8.2f}ms "
+            f"p50={summary['p50_ms']:8.2f}ms p95={summary['p95_ms']:8.2f}ms p99={summary['p99_ms']:8.2f}ms")
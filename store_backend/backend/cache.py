@@ -0,0 +1,170 @@
+import hashlib
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import Signal
+from rest_framework import status
+from rest_framework.response import Response
+
+from .db_router import response_is_cacheable
+
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_VERSION_KEY = 'catalog:version'
+
+# Sent after every catalog version bump, i.e. once a catalog write has committed.
+catalog_changed = Signal()
+
+
+class CacheStats:
+    """Process-wide hit/miss counters for the catalog response cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+catalog_cache_stats = CacheStats()
+
+
+class CacheLockTimeout(Exception):
+    """A cache lock could not be acquired within the allowed wait."""
+
+
+@contextmanager
+def cache_lock(cache, key, timeout, wait=0.0, poll=0.01):
+    """
+    Holds the lock `key` in `cache` for the duration of the block. The lock is taken with the
+    atomic `cache.add`, retried for up to `wait` seconds, and expires after `timeout` seconds in
+    case its holder dies. Only the holder releases it, so a holder that overran `timeout` does not
+    delete a lock someone else has since taken. Raises CacheLockTimeout if it cannot be acquired.
+    """
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while not cache.add(key, owner, timeout=timeout):
+        if time.monotonic() >= deadline:
+            raise CacheLockTimeout(key)
+        time.sleep(poll)
+    try:
+        yield
+    finally:
+        if cache.get(key) == owner:
+            cache.delete(key)
+
+
+def get_catalog_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version_cache():
+    """
+    The cache holding the catalog version: CATALOG_VERSION_CACHE if set, so that a bump reaches
+    every process, else the (per-process) catalog cache itself.
+    """
+    alias = getattr(settings, 'CATALOG_VERSION_CACHE', None)
+    return caches[alias] if alias else get_catalog_cache()
+
+
+def get_catalog_version():
+    """
+    Returns the current catalog version, initialising it on first use.
+    """
+    cache = get_catalog_version_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidates every cached catalog response in O(1) by moving to a new version.
+    Old entries are never read again and age out through the cache's TTL/LRU eviction.
+    """
+    cache = get_catalog_version_cache()
+    try:
+        version = cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.incr(CATALOG_VERSION_KEY)
+    catalog_changed.send(sender=None, version=version)
+    return version
+
+
+def invalidate_catalog_on_commit():
+    """
+    Bumps the catalog version once the current transaction commits, so a concurrent
+    reader can never cache pre-write data under the new version.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+class CachedCatalogMixin:
+    """
+    Read-through cache for list/retrieve on catalog viewsets.
+    Keys carry the catalog version, and every write through the viewset bumps it.
+    """
+
+    def get_cache_key(self, request):
+        digest = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+        return f'catalog:{get_catalog_version()}:{self.basename}:{self.action}:{digest}'
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        cache = get_catalog_cache()
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            catalog_cache_stats.record(hit=True)
+            return Response(data)
+
+        catalog_cache_stats.record(hit=False)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and response_is_cacheable():
+            cache.set(key, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_catalog_on_commit()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_catalog_on_commit()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_catalog_on_commit()
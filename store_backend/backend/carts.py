@@ -0,0 +1,222 @@
+from contextlib import contextmanager
+
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Func, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from .models import Cart, CartItem, Product
+
+
+# Largest value a cart's stored item_count and total may reach: the IntegerField range that is
+# safe on every database Django supports.
+MAX_CART_TOTAL = 2**31 - 1
+
+
+def adjust_cart_totals(cart_id, quantities):
+    """
+    Adds {product_id: ammount delta} to the cart's stored totals with a single F() UPDATE.
+    The total delta is priced in SQL from the products' current prices, so a price change that
+    commits between validation and the write cannot make the stored total drift.
+    The UPDATE only applies while both totals stay within MAX_CART_TOTAL; otherwise this raises
+    a ValidationError, and the caller's transaction rolls the item write back with it.
+    Call it in the same transaction as the item write it accounts for.
+    """
+    quantities = {product_id: delta for product_id, delta in quantities.items() if delta}
+    if not quantities:
+        return
+    price_delta = Product.objects.filter(id__in=quantities).order_by().annotate(value=Func(
+        Case(*[When(id=product_id, then=F('price') * delta) for product_id, delta in quantities.items()]),
+        function='SUM')).values('value')[:1]
+    item_count = F('item_count') + sum(quantities.values())
+    total = F('total') + Coalesce(Subquery(price_delta), 0)
+    updated = (Cart.objects.alias(new_item_count=item_count, new_total=total)
+               .filter(pk=cart_id, new_item_count__lte=MAX_CART_TOTAL, new_total__lte=MAX_CART_TOTAL)
+               .update(item_count=item_count, total=total))
+    if not updated and Cart.objects.filter(pk=cart_id).exists():
+        raise ValidationError({'cart': [f'Cart totals cannot exceed {MAX_CART_TOTAL}.']})
+
+
+def add_cart_items(cart_id, quantities):
+    """
+    Adds {product_id: ammount} to the cart with a single INSERT ... ON CONFLICT (cart, product)
+    DO UPDATE statement: new products get a line, products already in the cart have the ammount
+    added to their existing line. Returns the affected lines as unsaved-looking CartItem
+    instances (id, cart_id, product_id and the resulting ammount).
+    The caller updates the cart totals in the same transaction.
+    """
+    if not quantities:
+        return []
+    connection = connections[router.db_for_write(CartItem)]
+    quote = connection.ops.quote_name
+    table = quote(CartItem._meta.db_table)
+    cart, product, ammount = (quote(CartItem._meta.get_field(name).column) for name in ('cart', 'product', 'ammount'))
+    values = ', '.join(['(%s, %s, %s)'] * len(quantities))
+    params = [value for product_id, quantity in quantities.items() for value in (cart_id, product_id, quantity)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({cart}, {product}, {ammount}) VALUES {values} '
+            f'ON CONFLICT ({cart}, {product}) DO UPDATE SET {ammount} = {table}.{ammount} + excluded.{ammount} '
+            f'RETURNING id, {product}, {ammount}',
+            params,
+        )
+        rows = cursor.fetchall()
+    return [CartItem(id=pk, cart_id=cart_id, product_id=product_id, ammount=quantity)
+            for pk, product_id, quantity in rows]
+
+
+def lock_cart_items(item_ids):
+    """
+    Returns {item id: (cart_id, product_id, ammount)} for the items in `item_ids`, read by a no-op
+    UPDATE ... RETURNING so the rows are write-locked (on SQLite, the database) until the
+    transaction ends and a concurrent add cannot change them before the caller's write.
+    Call it inside that transaction, before the item write whose total delta it prices.
+    """
+    if not item_ids:
+        return {}
+    connection = connections[router.db_for_write(CartItem)]
+    quote = connection.ops.quote_name
+    table = quote(CartItem._meta.db_table)
+    cart, product, ammount = (quote(CartItem._meta.get_field(name).column) for name in ('cart', 'product', 'ammount'))
+    placeholders = ', '.join(['%s'] * len(item_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {ammount} = {ammount} WHERE id IN ({placeholders}) '
+            f'RETURNING id, {cart}, {product}, {ammount}',
+            list(item_ids),
+        )
+        return {pk: (cart_id, product_id, quantity) for pk, cart_id, product_id, quantity in cursor.fetchall()}
+
+
+def delete_cart_items(item_ids):
+    """
+    Deletes the items in `item_ids` with a single DELETE ... RETURNING and returns the removed
+    lines as (cart_id, product_id, ammount), as they were at the moment of the delete.
+    The caller updates the cart totals in the same transaction.
+    """
+    if not item_ids:
+        return []
+    connection = connections[router.db_for_write(CartItem)]
+    quote = connection.ops.quote_name
+    table = quote(CartItem._meta.db_table)
+    cart, product, ammount = (quote(CartItem._meta.get_field(name).column) for name in ('cart', 'product', 'ammount'))
+    placeholders = ', '.join(['%s'] * len(item_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN ({placeholders}) RETURNING {cart}, {product}, {ammount}',
+            list(item_ids),
+        )
+        return cursor.fetchall()
+
+
+def computed_cart_totals():
+    """
+    Returns {'item_count': ..., 'total': ...} expressions that compute a cart's totals from its items.
+    """
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    return {
+        'item_count': Coalesce(Subquery(items.annotate(value=Sum('ammount')).values('value')), 0),
+        'total': Coalesce(Subquery(items.annotate(value=Sum(F('ammount') * F('product__price'))).values('value')), 0),
+    }
+
+
+def refresh_cart_totals(carts):
+    """
+    Recomputes the stored totals of every cart in the `carts` queryset in one UPDATE.
+    """
+    return carts.update(**computed_cart_totals())
+
+
+def reconcile_cart_totals(batch_size=1000, fix=True):
+    """
+    Compares every cart's stored totals with totals computed from its items, walking carts in
+    primary-key batches, and (with `fix`) rewrites the drifted ones.
+    Returns {'checked': int, 'drifted': [{'cart', 'item_count', 'total', 'expected_item_count',
+    'expected_total'}, ...]}.
+    """
+    expected = {f'expected_{name}': expression for name, expression in computed_cart_totals().items()}
+    checked, drifted = 0, []
+    last_pk = 0
+    while True:
+        batch = list(Cart.objects.filter(pk__gt=last_pk).order_by('pk').annotate(**expected)
+                     .values('pk', 'item_count', 'total', *expected)[:batch_size])
+        if not batch:
+            break
+        checked += len(batch)
+        last_pk = batch[-1]['pk']
+        batch_drift = [row for row in batch
+                       if (row['item_count'], row['total']) != (row['expected_item_count'], row['expected_total'])]
+        if fix and batch_drift:
+            refresh_cart_totals(Cart.objects.filter(pk__in=[row['pk'] for row in batch_drift]))
+        drifted.extend({'cart': row.pop('pk'), **row} for row in batch_drift)
+    return {'checked': checked, 'drifted': drifted}
+
+
+@contextmanager
+def cart_totals_refreshed(items):
+    """
+    Recomputes the totals of the carts holding `items` (a CartItem queryset) once the block has
+    run, for writes that change items or prices without going through the item paths, such as
+    product price changes and cascading deletes.
+    """
+    cart_ids = set(items.values_list('cart_id', flat=True))
+    yield
+    if cart_ids:
+        refresh_cart_totals(Cart.objects.filter(pk__in=cart_ids))
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Applies a list of validated add/update/remove operations to `cart` atomically.
+    The caller is responsible for checking that the cart belongs to the requesting user.
+    Referenced items and products are loaded with one query each, and writes go through a
+    single delete, bulk_update and upsert (adds to a product already in the cart increment its
+    line) plus one UPDATE of the cart's stored totals, priced inside the transaction. The total
+    deltas use the updated lines' ammounts as locked by the transaction and the removed lines'
+    ammounts as deleted, not the ones loaded for validation.
+    """
+    item_ids = {operation['item'] for operation in operations if 'item' in operation}
+    product_ids = {operation['product'] for operation in operations if operation['op'] == 'add'}
+
+    items = CartItem.objects.filter(cart=cart, id__in=item_ids).in_bulk()
+    existing = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+
+    errors = {}
+    to_add, to_update, to_delete = {}, {}, set()
+    for index, operation in enumerate(operations):
+        if operation['op'] == 'add':
+            if operation['product'] not in existing:
+                errors[index] = {'product': [f"Product {operation['product']} does not exist."]}
+                continue
+            to_add[operation['product']] = to_add.get(operation['product'], 0) + operation['ammount']
+            continue
+
+        item = items.get(operation['item'])
+        if item is None or item.pk in to_delete:
+            errors[index] = {'item': [f"Item {operation['item']} is not in this cart."]}
+            continue
+        if operation['op'] == 'update':
+            item.ammount = operation['ammount']
+            to_update[item.pk] = item
+        else:
+            to_update.pop(item.pk, None)
+            to_delete.add(item.pk)
+
+    if errors:
+        raise ValidationError({'operations': errors})
+
+    with transaction.atomic():
+        deltas = dict(to_add)
+        current = lock_cart_items(list(to_update))
+        gone = [pk for pk in to_update if current.get(pk, (None,))[0] != cart.pk]
+        if gone:
+            raise ValidationError({'operations': [f'Item {pk} was removed from this cart.' for pk in gone]})
+        for pk, item in to_update.items():
+            _, product_id, ammount = current[pk]
+            deltas[product_id] = deltas.get(product_id, 0) + item.ammount - ammount
+        for _, product_id, ammount in delete_cart_items(list(to_delete)):
+            deltas[product_id] = deltas.get(product_id, 0) - ammount
+        if to_update:
+            CartItem.objects.bulk_update(to_update.values(), ['ammount'])
+        add_cart_items(cart.pk, to_add)
+        adjust_cart_totals(cart.pk, deltas)
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db import transaction
+
+from .fast_serializers import get_values_serializer
+from .models import CatalogChange, Product, ProductType
+from .serializers import ProductSerializer, ProductTypeSerializer
+
+
+CHANGE_FEED_DEFAULTS = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 1000,
+    'RETENTION_DAYS': 30,
+}
+
+CHANGE_SERIALIZERS = {
+    CatalogChange.PRODUCT: (Product, ProductSerializer),
+    CatalogChange.PRODUCT_TYPE: (ProductType, ProductTypeSerializer),
+}
+
+
+def get_change_feed_setting(name):
+    return getattr(settings, 'CHANGE_FEED', {}).get(name, CHANGE_FEED_DEFAULTS[name])
+
+
+class ChangesCompacted(Exception):
+    """The requested position predates the retained change log; the consumer must resync."""
+
+
+def change_feed_page(since, limit):
+    """
+    Returns up to `limit` changes after sequence number `since`, oldest first, as
+    {'results': [...], 'next_since': int, 'has_more': bool}. Creates and updates carry the
+    object's current representation (None if it has since been deleted; its tombstone follows).
+    Raises ChangesCompacted if entries after `since` have been trimmed by compaction.
+    """
+    changes = list(CatalogChange.objects.filter(seq__gt=since).order_by('seq')[:limit + 1])
+    if changes and changes[0].op == CatalogChange.COMPACTED:
+        raise ChangesCompacted(changes[0].seq)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    current = {}
+    for kind, (model, serializer_class) in CHANGE_SERIALIZERS.items():
+        ids = {change.object_id for change in changes if change.kind == kind and change.op != CatalogChange.DELETE}
+        if ids:
+            fast = get_values_serializer(serializer_class)
+            current[kind] = {row['id']: fast.to_representation(row)
+                             for row in fast.rows(model.objects.filter(id__in=ids).order_by())}
+
+    return {
+        'results': [{
+            'seq': change.seq,
+            'kind': change.kind,
+            'object_id': change.object_id,
+            'op': change.op,
+            'data': None if change.op == CatalogChange.DELETE else current[change.kind].get(change.object_id),
+        } for change in changes],
+        'next_since': changes[-1].seq if changes else since,
+        'has_more': has_more,
+    }
+
+
+def compact_changes(before):
+    """
+    Trims change log entries created before `before`. The newest trimmed entry is kept as a
+    COMPACTED marker so readers asking for anything older can be told to resync.
+    Returns the number of rows deleted.
+    """
+    with transaction.atomic():
+        last = (CatalogChange.objects.filter(created_at__lt=before).exclude(op=CatalogChange.COMPACTED)
+                .order_by('-seq').values_list('seq', flat=True).first())
+        if last is None:
+            return 0
+        deleted, _ = CatalogChange.objects.filter(seq__lt=last).delete()
+        CatalogChange.objects.filter(seq=last).update(op=CatalogChange.COMPACTED)
+    return deleted
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .cache import invalidate_catalog_on_commit
+from .models import Cart, CartItem, Order, OrderLine, Product
+
+
+class InsufficientStock(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Not enough stock to complete the order.'
+    default_code = 'insufficient_stock'
+
+
+def checkout_cart(cart):
+    """
+    Turns the cart into an order and empties it, all in one transaction.
+
+    Stock is taken with one conditional `UPDATE ... SET ammount = ammount - n WHERE ammount >= n`
+    per product, in product id order. The row only changes if enough stock is left at the
+    moment of the write, so parallel checkouts can never oversell and no table lock is needed.
+    If any product is short the whole transaction rolls back and InsufficientStock is raised.
+    """
+    with transaction.atomic():
+        # Write first, so that on SQLite the transaction takes the write lock up front
+        # (waiting on the busy timeout) instead of failing on a read-to-write upgrade.
+        order = Order.objects.create(user_id=cart.user_id)
+
+        lines = list(CartItem.objects
+                     .filter(cart=cart)
+                     .values('product_id', 'product__name', 'product__price', quantity=F('ammount'))
+                     .order_by('product_id'))
+        lines = [line for line in lines if line['quantity'] > 0]
+        if not lines:
+            raise ValidationError({'cart': ['Cart is empty.']})
+
+        now = timezone.now()
+        for line in lines:
+            taken = (Product.objects
+                     .filter(pk=line['product_id'], ammount__gte=line['quantity'])
+                     .update(ammount=F('ammount') - line['quantity'], updated_at=now))
+            if not taken:
+                raise InsufficientStock({
+                    'detail': InsufficientStock.default_detail,
+                    'product': line['product_id'],
+                })
+
+        OrderLine.objects.bulk_create([
+            OrderLine(order=order, product_id=line['product_id'], name=line['product__name'],
+                      price=line['product__price'], ammount=line['quantity'])
+            for line in lines
+        ])
+        order.total = sum(line['product__price'] * line['quantity'] for line in lines)
+        order.save(update_fields=['total'])
+        CartItem.objects.filter(cart=cart).delete()
+        Cart.objects.filter(pk=cart.pk).update(item_count=0, total=0)
+        invalidate_catalog_on_commit()
+    return order
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .guest_carts import DATABASE_CACHE_BACKENDS, PER_PROCESS_CACHE_BACKENDS, get_guest_cart_setting
+from .throttling import get_auth_throttle_setting
+
+
+@register()
+def check_guest_cart_cache(app_configs, **kwargs):
+    """
+    Guest carts kept in a cache must live in one every worker process can see, or they vanish or
+    fork between requests served by different workers. The database cache is rejected too: it
+    turns every cart change into several write transactions.
+    """
+    alias = get_guest_cart_setting('CACHE')
+    if alias is None:
+        return []
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None:
+        return [Error(f"GUEST_CARTS['CACHE'] names the cache alias {alias!r}, which is not in CACHES.",
+                      id='backend.E001')]
+    if backend in PER_PROCESS_CACHE_BACKENDS:
+        return [Error(f"GUEST_CARTS['CACHE'] uses {backend}, which is not shared between processes.",
+                      hint='Point it at a shared cache such as Redis or Memcached, or unset it to keep '
+                           'guest carts in the cookie.',
+                      id='backend.E001')]
+    if backend in DATABASE_CACHE_BACKENDS:
+        return [Error(f"GUEST_CARTS['CACHE'] uses {backend}, which writes to the database on every cart change.",
+                      hint='Point it at Redis or Memcached, or unset it to keep guest carts in the cookie.',
+                      id='backend.E001')]
+    return []
+
+
+@register()
+def check_auth_throttle_cache(app_configs, **kwargs):
+    """
+    Per-process token buckets multiply every auth throttle limit by the number of worker
+    processes, so more than one worker needs a shared AUTH_THROTTLE['SHARED_CACHE'].
+    """
+    if getattr(settings, 'WORKER_PROCESSES', 1) <= 1 or not get_auth_throttle_setting('RATES'):
+        return []
+    alias = get_auth_throttle_setting('SHARED_CACHE')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND') if alias else None
+    if backend is None or backend in PER_PROCESS_CACHE_BACKENDS:
+        return [Error(f"AUTH_THROTTLE['SHARED_CACHE'] is not a cache shared between the "
+                      f"{settings.WORKER_PROCESSES} worker processes, so each throttle limit is multiplied by "
+                      f"{settings.WORKER_PROCESSES}.",
+                      hint='Set STORE_REDIS_URL, or point SHARED_CACHE at another shared cache alias.',
+                      id='backend.E002')]
+    return []
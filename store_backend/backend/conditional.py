@@ -0,0 +1,96 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+from .cache import get_catalog_cache
+from .db_router import response_is_cacheable
+from .models import CatalogChange
+
+
+class ConditionalCatalogMixin:
+    """
+    ETag / Last-Modified support for catalog list/retrieve.
+    List validators come from the newest catalog change log entry, so deletes and writes to
+    any row move them; detail validators come from the row's `updated_at`. Both are one
+    indexed lookup, and `If-None-Match`/`If-Modified-Since` are answered with 304 before the
+    serializer runs. Meant to sit in front of CachedCatalogMixin, whose versioned keys also
+    cache the validators so a warm conditional GET does not touch the database. Responses read
+    from a replica carry no validators, as the replica may be behind the primary's change log.
+    """
+
+    def get_list_validators(self):
+        """
+        Returns (last_modified, marker) for the whole catalog from the newest change log entry.
+        Falls back to the newest `updated_at` and row count while the log is empty (e.g. on
+        databases without the logging triggers).
+        """
+        latest = CatalogChange.objects.order_by('-seq').values_list('seq', 'created_at').first()
+        if latest is not None:
+            seq, last_modified = latest
+            return last_modified, f'seq:{seq}'
+        stats = self.filter_queryset(self.get_queryset()).aggregate(
+            last_modified=Max('updated_at'), count=Count('pk'))
+        return stats['last_modified'], stats['count']
+
+    def get_detail_validators(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        last_modified = self.get_queryset().filter(**lookup).values_list('updated_at', flat=True).first()
+        return last_modified, 1 if last_modified is not None else 0
+
+    def get_validators(self, request):
+        """
+        Returns (etag, last_modified) for the current request, or (None, None) if the
+        requested object does not exist.
+        """
+        cache = get_catalog_cache()
+        key = self.get_cache_key(request) + ':validators'
+        validators = cache.get(key)
+        if validators is None:
+            if self.action == 'list':
+                last_modified, count = self.get_list_validators()
+            else:
+                last_modified, count = self.get_detail_validators()
+            if not count:
+                last_modified = None
+            validators = (last_modified, count)
+            if response_is_cacheable():
+                cache.set(key, validators)
+
+        last_modified, count = validators
+        if self.action != 'list' and last_modified is None:
+            return None, None
+        fingerprint = '|'.join([
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+            last_modified.isoformat() if last_modified else '',
+            str(count),
+        ])
+        etag = quote_etag(hashlib.sha1(fingerprint.encode()).hexdigest())
+        return etag, last_modified
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            return not_modified
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and response_is_cacheable():
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
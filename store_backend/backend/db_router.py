@@ -0,0 +1,217 @@
+"""
+Read/write splitting for catalog traffic.
+
+Only safe requests handled by a view with ReplicaReadsMixin (the product and product-type
+viewsets) may read catalog models from a replica; everything else, including cart, order and auth
+traffic, stays on the primary. A request that writes is pinned to the primary for the rest of
+the request, and ReplicaRoutingMiddleware sets a short-lived cookie so the same client keeps
+reading from the primary until replicas have had time to catch up. Replicas whose catalog is
+further behind the primary than REPLICATION['MAX_LAG_SECONDS'] are skipped. Responses built from
+replica reads are never written to the shared catalog cache, since a replica can always be a
+write behind the catalog version the entry would be stored under.
+"""
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.utils import DatabaseError
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+
+
+REPLICATION_DEFAULTS = {
+    'STICKY_SECONDS': 5,
+    'STICKY_COOKIE': 'db_primary',
+    'MAX_LAG_SECONDS': 2,
+    'LAG_CHECK_INTERVAL': 1,
+}
+
+CATALOG_MODELS = {'backend.product', 'backend.producttype', 'backend.productsearchindex'}
+
+
+def get_replication_setting(name):
+    return getattr(settings, 'REPLICATION', {}).get(name, REPLICATION_DEFAULTS[name])
+
+
+class RoutingState:
+    """Per-request routing decisions."""
+
+    def __init__(self, pinned=False):
+        self.replica_reads = False
+        self.pinned = pinned
+        self.wrote = False
+        self.used_replica = False
+
+
+routing_state = ContextVar('db_routing_state', default=None)
+
+
+def allow_replica_reads():
+    state = routing_state.get()
+    if state is not None:
+        state.replica_reads = True
+
+
+def response_is_cacheable():
+    """
+    False if the current request read from a replica, in which case its response must not be
+    stored in a shared cache or given validators.
+    """
+    state = routing_state.get()
+    return state is None or not state.used_replica
+
+
+class ReplicaLagMonitor:
+    """
+    Estimates replica lag from the replicated catalog change log: a replica is as far behind as
+    the oldest change (write or delete) it has not applied yet. Each replica is rechecked at most
+    every REPLICATION['LAG_CHECK_INTERVAL'] seconds, and on every catalog version bump.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def measure(self, alias):
+        """
+        Returns the replica's lag in seconds, or None if it cannot be reached.
+        """
+        from .models import CatalogChange
+        try:
+            applied = CatalogChange.objects.using(alias).order_by('-seq').values_list('seq', flat=True).first()
+            missing = (CatalogChange.objects.using(DEFAULT_DB_ALIAS).filter(seq__gt=applied or 0)
+                       .order_by('seq').values_list('created_at', flat=True).first())
+        except DatabaseError:
+            return None
+        if missing is None:
+            return 0.0
+        return max((timezone.now() - missing).total_seconds(), 0.0)
+
+    def lag(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            checked = self._checked.get(alias)
+        if checked is not None and now - checked[0] < get_replication_setting('LAG_CHECK_INTERVAL'):
+            return checked[1]
+        lag = self.measure(alias)
+        with self._lock:
+            self._checked[alias] = (now, lag)
+        return lag
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+
+lag_monitor = ReplicaLagMonitor()
+
+
+class CatalogReplicaRouter:
+    """
+    Routes catalog reads from replica-enabled views to settings.REPLICA_DATABASES (round-robin)
+    and every other query to the primary.
+    """
+
+    def __init__(self):
+        self._cycle_lock = threading.Lock()
+        self._cycle = None
+        self._cycle_aliases = None
+
+    def next_replicas(self, aliases):
+        with self._cycle_lock:
+            if self._cycle_aliases != aliases:
+                self._cycle_aliases = list(aliases)
+                self._cycle = itertools.cycle(range(len(aliases)))
+            start = next(self._cycle)
+        return aliases[start:] + aliases[:start]
+
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        replicas = list(getattr(settings, 'REPLICA_DATABASES', []))
+        if (state is None or not state.replica_reads or state.pinned or not replicas
+                or model._meta.label_lower not in CATALOG_MODELS):
+            return DEFAULT_DB_ALIAS
+
+        max_lag = get_replication_setting('MAX_LAG_SECONDS')
+        for alias in self.next_replicas(replicas):
+            if max_lag is None:
+                state.used_replica = True
+                return alias
+            lag = lag_monitor.lag(alias)
+            if lag is not None and lag <= max_lag:
+                state.used_replica = True
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.pinned = True
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Gives each request fresh routing state and carries read-your-writes stickiness across
+    requests with a cookie. Works in both sync and async stacks, so it does not push async
+    views back onto a thread under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            routing_state.reset(token)
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            routing_state.reset(token)
+
+    def start(self, request):
+        return routing_state.set(RoutingState(pinned=get_replication_setting('STICKY_COOKIE') in request.COOKIES))
+
+    def finish(self, response):
+        if routing_state.get().wrote:
+            response.set_cookie(get_replication_setting('STICKY_COOKIE'), '1',
+                                max_age=get_replication_setting('STICKY_SECONDS'), httponly=True, samesite='Lax')
+        return response
+
+
+class ReplicaReadsMixin:
+    """
+    Lets the view's catalog reads be served by a replica for safe (read-only) requests.
+    Unsafe requests read from the primary, so validation sees the data they are about to change.
+    Actions listed in `primary_read_actions` always read from the primary, for responses that
+    combine catalog rows with data that is only ever read from the primary (the change log).
+    """
+    primary_read_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS and getattr(self, 'action', None) not in self.primary_read_actions:
+            allow_replica_reads()
+        super().initial(request, *args, **kwargs)
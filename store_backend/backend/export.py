@@ -0,0 +1,73 @@
+import csv
+import json
+import zlib
+
+from .fast_serializers import get_values_serializer
+from .serializers import ProductSerializer
+
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+
+class LineBuffer:
+    """File-like object for csv.writer that hands back each written line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def iter_csv(rows, fields):
+    writer = csv.writer(LineBuffer())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
+
+
+def iter_bytes(lines):
+    """
+    Groups text lines into ~64KB byte chunks. The first line goes out on its own so the
+    client gets its first byte as soon as the first rows are read.
+    """
+    buffer, size, first = [], 0, True
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if first or size >= FLUSH_BYTES:
+            yield b''.join(buffer)
+            buffer, size, first = [], 0, False
+    if buffer:
+        yield b''.join(buffer)
+
+
+def iter_gzip(chunks):
+    """
+    Compresses a byte stream on the fly into a single gzip member, flushing after every chunk.
+    """
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def stream_products(queryset, export_format, compress=False, fields=None):
+    """
+    Yields the export body for `queryset` as bytes, reading values() rows shaped like
+    ProductSerializer output (restricted to `fields` if given) through a chunked iterator so
+    memory stays flat regardless of catalog size.
+    """
+    fast = get_values_serializer(ProductSerializer, fields)
+    rows = map(fast.to_representation, fast.rows(queryset).iterator(chunk_size=CHUNK_SIZE))
+    lines = iter_csv(rows, fast.keys) if export_format == 'csv' else iter_ndjson(rows)
+    chunks = iter_bytes(lines)
+    return iter_gzip(chunks) if compress else chunks
@@ -0,0 +1,89 @@
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.response import Response
+
+
+# Serializer fields whose to_representation is the identity on the value the database returns
+# (str for CharField, int for IntegerField, the related id for PrimaryKeyRelatedField).
+PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.PrimaryKeyRelatedField)
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for a flat ModelSerializer: rows come from `QuerySet.values()` and are
+    turned into representation dicts with a field mapping compiled once per serializer class,
+    skipping model instantiation and per-field to_representation. Output is identical to the
+    serializer's own `.data`, key order included.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        serializer = serializer_class(fields=fields) if fields is not None else serializer_class()
+        model = serializer.Meta.model
+        mapping = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if not isinstance(field, PASSTHROUGH_FIELDS) or field.source == '*' or '.' in field.source:
+                raise ImproperlyConfigured(
+                    f'{serializer_class.__name__}.{name} cannot be served from values() rows.')
+            mapping.append((name, model._meta.get_field(field.source).name))
+
+        self.keys = tuple(name for name, _ in mapping)
+        self.columns = tuple(column for _, column in mapping)
+        self.mapping = tuple(mapping)
+        self.identity = self.keys == self.columns
+
+    def rows(self, queryset):
+        """
+        Narrows `queryset` to the columns the representation needs, as dict rows. The primary
+        key and ordering columns are kept as well so cursor pagination can read positions.
+        """
+        model = queryset.model
+        extra = [model._meta.pk.name] + [name.lstrip('-') for name in queryset.query.order_by
+                                         if isinstance(name, str)]
+        columns = list(dict.fromkeys(self.columns + tuple(extra)))
+        return queryset.values(*columns)
+
+    def to_representation(self, row):
+        if self.identity and len(row) == len(self.keys):
+            return row
+        return {key: row[column] for key, column in self.mapping}
+
+    def many(self, rows):
+        rows = list(rows)
+        if self.identity and (not rows or len(rows[0]) == len(self.keys)):
+            return rows
+        mapping = self.mapping
+        return [{key: row[column] for key, column in mapping} for row in rows]
+
+
+_compiled = {}
+
+
+def get_values_serializer(serializer_class, fields=None):
+    """
+    Returns the compiled ValuesSerializer for `serializer_class` (optionally restricted to
+    `fields`), compiling it on first use.
+    """
+    key = (serializer_class, fields)
+    values_serializer = _compiled.get(key)
+    if values_serializer is None:
+        values_serializer = _compiled[key] = ValuesSerializer(serializer_class, fields)
+    return values_serializer
+
+
+class FastListMixin:
+    """
+    Serves `list` through the ValuesSerializer fast path for the view's serializer class.
+    """
+
+    def get_values_serializer(self):
+        return get_values_serializer(self.get_serializer_class())
+
+    def list(self, request, *args, **kwargs):
+        fast = self.get_values_serializer()
+        rows = fast.rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(fast.many(page))
+        return Response(fast.many(rows))
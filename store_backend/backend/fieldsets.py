@@ -0,0 +1,59 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from .fast_serializers import get_values_serializer
+
+
+FIELDS_PARAM = 'fields'
+
+
+def requested_fields(request):
+    """
+    Returns the field names asked for with `?fields=a,b` as a tuple, or None when the
+    parameter is absent or the request is not a read.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    value = request.query_params.get(FIELDS_PARAM)
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    return fields or None
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin that keeps only the fields passed as `fields=` or requested with
+    `?fields=` on a read request. Unknown names are rejected with a 400.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            fields = requested_fields(self.context.get('request'))
+        if fields is None:
+            return
+        unknown = [name for name in fields if name not in self.fields]
+        if unknown:
+            raise serializers.ValidationError({FIELDS_PARAM: [f'Unknown field: {name}.' for name in unknown]})
+        for name in [name for name in self.fields if name not in fields]:
+            self.fields.pop(name)
+
+
+class SparseFieldsetViewMixin:
+    """
+    Viewset mixin that narrows the SQL to the columns behind the requested fields: `only()`
+    for instance reads, and a matching ValuesSerializer for the FastListMixin path.
+    """
+
+    def get_sparse_fields(self):
+        return requested_fields(self.request)
+
+    def get_values_serializer(self):
+        return get_values_serializer(self.get_serializer_class(), self.get_sparse_fields())
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.get_sparse_fields() is None:
+            return queryset
+        return queryset.only(*self.get_values_serializer().columns)
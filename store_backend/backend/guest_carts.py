@@ -0,0 +1,210 @@
+"""
+Guest carts for anonymous shoppers.
+
+By default the contents live in the signed cookie itself, so browsing and filling a cart never
+touches the database and needs no shared state between worker processes. When the shopper logs
+in or registers, the guest cart is merged into their database cart with one bulk upsert and the
+cookie is cleared.
+
+Setting GUEST_CARTS['CACHE'] to a cache alias moves the contents into a cache entry keyed by a
+random token carried in the cookie instead. That cache must be shared by every worker process and
+must not be the database cache (the `backend.E001` system check enforces both), and writes to one
+cart are serialized by a short `cache.add` lock so concurrent requests do not lose each other's
+updates. Cookie carts have no lock: concurrent writes from one browser keep the last response's
+cookie.
+"""
+import secrets
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .cache import CacheLockTimeout, cache_lock
+from .carts import add_cart_items, adjust_cart_totals
+from .models import Cart, Product
+
+
+GUEST_CART_DEFAULTS = {
+    'CACHE': None,
+    'COOKIE': 'guest_cart',
+    'TTL': 7 * 24 * 60 * 60,
+    'MAX_ITEMS': 100,
+    'MAX_QUANTITY': 1000,
+    'LOCK_TIMEOUT': 5,
+    'LOCK_WAIT': 2,
+}
+COOKIE_SALT = 'backend.guest_carts'
+# Cookies holding the contents use their own salt, so a token cookie never unsigns as contents.
+CONTENTS_COOKIE_SALT = 'backend.guest_carts.contents'
+# Cache backends that keep entries inside one process and so cannot hold guest carts.
+PER_PROCESS_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+# Cache backends that write database rows on every cart change (plus culling scans).
+DATABASE_CACHE_BACKENDS = {
+    'django.core.cache.backends.db.DatabaseCache',
+}
+
+
+def get_guest_cart_setting(name):
+    return getattr(settings, 'GUEST_CARTS', {}).get(name, GUEST_CART_DEFAULTS[name])
+
+
+class GuestCartBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The cart is being updated by another request, please retry.'
+    default_code = 'guest_cart_busy'
+
+
+def stores_in_cookie():
+    return get_guest_cart_setting('CACHE') is None
+
+
+class GuestCart:
+    """
+    A guest cart: {product_id: ammount}, loaded from and saved to the signed cookie or, when
+    GUEST_CARTS['CACHE'] is set, the guest cart cache. `found` is True when the request carried
+    a valid guest cart cookie.
+    """
+
+    def __init__(self, token=None, items=None, found=False):
+        self.token = token
+        self.items = items or {}
+        self.found = found or token is not None
+        self.modified = False
+
+    @staticmethod
+    def token_from_request(request):
+        value = request.COOKIES.get(get_guest_cart_setting('COOKIE'))
+        if not value:
+            return None
+        try:
+            return signing.get_cookie_signer(salt=COOKIE_SALT).unsign(value)
+        except signing.BadSignature:
+            return None
+
+    @staticmethod
+    def items_from_request(request):
+        value = request.COOKIES.get(get_guest_cart_setting('COOKIE'))
+        if not value:
+            return None
+        try:
+            items = signing.get_cookie_signer(salt=CONTENTS_COOKIE_SALT).unsign_object(
+                value, max_age=get_guest_cart_setting('TTL'))
+        except signing.BadSignature:
+            return None
+        # JSON object keys are strings
+        return {int(product_id): ammount for product_id, ammount in items.items()}
+
+    @classmethod
+    def from_request(cls, request):
+        if stores_in_cookie():
+            items = cls.items_from_request(request)
+            return cls(items=items, found=items is not None)
+        token = cls.token_from_request(request)
+        if token is None:
+            return cls()
+        return cls(token, cls.cache().get(cls.cache_key(token)))
+
+    @classmethod
+    @contextmanager
+    def for_update(cls, request):
+        """
+        Loads the request's guest cart while holding its lock, so a read-modify-write in the
+        block (including `save`) cannot interleave with another request's. A new cart needs no
+        lock, as nobody else knows its token yet, and neither does a cookie cart, which no other
+        request can change. Raises GuestCartBusy if the lock is not free within
+        GUEST_CARTS['LOCK_WAIT'] seconds.
+        """
+        if stores_in_cookie():
+            yield cls.from_request(request)
+            return
+        token = cls.token_from_request(request)
+        if token is None:
+            yield cls()
+            return
+        try:
+            with cache_lock(cls.cache(), cls.cache_key(token) + ':lock', timeout=get_guest_cart_setting('LOCK_TIMEOUT'),
+                            wait=get_guest_cart_setting('LOCK_WAIT')):
+                yield cls(token, cls.cache().get(cls.cache_key(token)))
+        except CacheLockTimeout:
+            raise GuestCartBusy()
+
+    @staticmethod
+    def cache():
+        return caches[get_guest_cart_setting('CACHE')]
+
+    @staticmethod
+    def cache_key(token):
+        return f'guest-cart:{token}'
+
+    @property
+    def item_count(self):
+        return sum(self.items.values())
+
+    def as_dict(self):
+        return {
+            'items': [{'product': product, 'ammount': ammount} for product, ammount in self.items.items()],
+            'item_count': self.item_count,
+        }
+
+    def add(self, product_id, ammount):
+        self.set(product_id, self.items.get(product_id, 0) + ammount)
+
+    def set(self, product_id, ammount):
+        if ammount <= 0:
+            self.items.pop(product_id, None)
+        else:
+            self.items[product_id] = ammount
+        self.modified = True
+
+    def is_full(self, product_id):
+        return product_id not in self.items and len(self.items) >= get_guest_cart_setting('MAX_ITEMS')
+
+    def exceeds_max_quantity(self, product_id, ammount):
+        return self.items.get(product_id, 0) + ammount > get_guest_cart_setting('MAX_QUANTITY')
+
+    def save(self, response):
+        """
+        Stores the contents and (re)sets the cookie on `response`, sliding the expiry.
+        """
+        ttl = get_guest_cart_setting('TTL')
+        if stores_in_cookie():
+            value = signing.get_cookie_signer(salt=CONTENTS_COOKIE_SALT).sign_object(self.items, compress=True)
+        else:
+            if self.token is None:
+                self.token = secrets.token_urlsafe(24)
+            self.cache().set(self.cache_key(self.token), self.items, timeout=ttl)
+            value = signing.get_cookie_signer(salt=COOKIE_SALT).sign(self.token)
+        response.set_cookie(get_guest_cart_setting('COOKIE'), value, max_age=ttl, httponly=True, samesite='Lax')
+
+    def discard(self, response):
+        if self.token is not None and not stores_in_cookie():
+            self.cache().delete(self.cache_key(self.token))
+        response.delete_cookie(get_guest_cart_setting('COOKIE'), samesite='Lax')
+
+
+def merge_guest_cart(guest_cart, user):
+    """
+    Moves the guest cart's items into the user's most recent cart (created if needed) with one
+    bulk upsert: quantities for products already in the cart are added to their line, new
+    products get a line. Products deleted in the meantime are dropped, and quantities are capped
+    at GUEST_CARTS['MAX_QUANTITY'] (carts saved before a lower limit may hold more). Returns the
+    cart, or None if there was nothing to merge.
+    """
+    existing = set(Product.objects.filter(id__in=guest_cart.items).values_list('id', flat=True))
+    if not existing:
+        return None
+    max_quantity = get_guest_cart_setting('MAX_QUANTITY')
+    quantities = {product_id: min(ammount, max_quantity)
+                  for product_id, ammount in guest_cart.items.items() if product_id in existing}
+    with transaction.atomic():
+        cart = Cart.objects.filter(user=user).order_by('-id').first() or Cart.objects.create(user=user)
+        add_cart_items(cart.pk, quantities)
+        adjust_cart_totals(cart.pk, quantities)
+    return cart
@@ -0,0 +1,211 @@
+import csv
+import io
+import json
+import re
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .cache import invalidate_catalog_on_commit
+from .carts import cart_totals_refreshed
+from .models import CartItem, Product, ProductType
+
+
+UPDATE_FIELDS = ('name', 'description', 'type', 'price', 'ammount', 'updated_at')
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_ERRORS = 100
+# Stands in for a row with bytes that are not valid UTF-8 (see open_text).
+UNDECODABLE = object()
+# A trailing '.0' is allowed on integer strings, as in DRF's IntegerField.
+INTEGRAL_SUFFIX = re.compile(r'\.0*$')
+
+
+def detect_format(filename, default='csv'):
+    """
+    Returns 'csv' or 'jsonl' based on the file extension.
+    """
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def iter_rows(stream, fmt):
+    """
+    Lazily yields (line_number, row) pairs from a text stream, one row in memory at a time.
+    Rows that are not valid UTF-8 are yielded as (line_number, UNDECODABLE), other rows that
+    cannot be decoded as (line_number, None).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            if any(has_undecodable_bytes(text) for text in [*row, *row.values()] if isinstance(text, str)):
+                row = UNDECODABLE
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            if has_undecodable_bytes(line):
+                yield line_number, UNDECODABLE
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None
+                continue
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def has_undecodable_bytes(text):
+    """
+    True if `text` holds the lone surrogates that the 'surrogateescape' error handler
+    substitutes for bytes that are not valid UTF-8.
+    """
+    return any('\udc80' <= char <= '\udcff' for char in text)
+
+
+def to_text(value):
+    """
+    Returns a string field's value, accepting what the serializer's CharField accepts: strings
+    and numbers. Raises ValueError for anything else (lists, objects, booleans).
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(value)
+    return str(value)
+
+
+def to_integer(value):
+    """
+    Returns an integer field's value, or None if it is missing. Integral floats and numeric
+    strings are accepted, as by the serializer's IntegerField; fractions, booleans and other
+    types raise ValueError instead of being truncated.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    if isinstance(value, str):
+        return int(INTEGRAL_SUFFIX.sub('', value.strip()))
+    raise ValueError(value)
+
+
+def build_product(row, type_ids):
+    """
+    Builds an unsaved Product from a row, running the same field validators as the model.
+    Raises ValidationError with a field -> messages mapping on bad input.
+    """
+    if row is UNDECODABLE:
+        raise ValidationError({'row': ['Row is not valid UTF-8.']})
+    if row is None:
+        raise ValidationError({'row': ['Row could not be parsed.']})
+
+    errors = {}
+    values = {}
+    for field in ('name', 'description'):
+        try:
+            values[field] = to_text(row.get(field))
+        except ValueError:
+            errors[field] = ['Not a valid string.']
+    for field in ('id', 'price', 'ammount'):
+        try:
+            values[field] = to_integer(row.get(field))
+        except ValueError:
+            errors[field] = ['A valid integer is required.']
+
+    product = Product(**{field: value for field, value in values.items() if field != 'id'})
+    if values.get('id') is not None:
+        product.pk = values['id']
+
+    try:
+        product.clean_fields(exclude=['type', 'updated_at', *errors])
+    except ValidationError as exc:
+        errors.update(exc.message_dict)
+
+    try:
+        type_id = to_integer(row.get('type'))
+    except ValueError:
+        type_id = None
+    if type_id is None:
+        errors['type'] = ['A valid product type id is required.']
+    else:
+        if type_id not in type_ids:
+            errors['type'] = [f'Product type {type_id} does not exist.']
+        product.type_id = type_id
+
+    if errors:
+        raise ValidationError(errors)
+    return product
+
+
+def write_batch(products):
+    """
+    Upserts a batch of products in one transaction, keyed on the primary key, and refreshes
+    the totals of carts holding any of the updated products.
+    """
+    existing = CartItem.objects.filter(product_id__in=[product.id for product in products if product.id])
+    with transaction.atomic(), cart_totals_refreshed(existing):
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=UPDATE_FIELDS,
+        )
+        invalidate_catalog_on_commit()
+
+
+def import_products(stream, fmt, batch_size=DEFAULT_BATCH_SIZE, max_errors=DEFAULT_MAX_ERRORS, on_error=None):
+    """
+    Streams products from `stream` into the database in batches and returns a report:
+    {'imported': int, 'failed': int, 'errors': [{'line': int, 'errors': {...}}]}.
+    Only the first `max_errors` failures are kept in `errors` (`failed` counts all of them);
+    `on_error`, if given, is called with every failure as it happens.
+    Memory use is bounded by the batch size and `max_errors`, not by the size of the input.
+    """
+    type_ids = set(ProductType.objects.values_list('id', flat=True))
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+    rows = iter_rows(stream, fmt)
+
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+
+        batch = []
+        for line_number, row in chunk:
+            try:
+                batch.append(build_product(row, type_ids))
+            except ValidationError as exc:
+                error = {'line': line_number, 'errors': exc.message_dict}
+                report['failed'] += 1
+                if len(report['errors']) < max_errors:
+                    report['errors'].append(error)
+                if on_error is not None:
+                    on_error(error)
+
+        if batch:
+            write_batch(batch)
+            report['imported'] += len(batch)
+
+    return report
+
+
+def open_text(binary_file, encoding='utf-8'):
+    """
+    Wraps an uploaded (binary) file so it can be read line by line as text. Bytes that are not
+    valid UTF-8 are kept as lone surrogates, so iter_rows can reject just the rows holding them.
+    """
+    return io.TextIOWrapper(binary_file, encoding=encoding, errors='surrogateescape', newline='')
@@ -0,0 +1,241 @@
+import heapq
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+
+logger = logging.getLogger('backend.requests')
+
+REQUEST_TIMING_DEFAULTS = {
+    'ENABLED': False,
+    'SLOW_REQUEST_MS': 500,
+    'SLOWEST_QUERIES': 3,
+}
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended.
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+current_timer = ContextVar('current_request_timer', default=None)
+
+
+def get_request_timing_setting(name):
+    return getattr(settings, 'REQUEST_TIMING', {}).get(name, REQUEST_TIMING_DEFAULTS[name])
+
+
+class RequestTimer:
+    """
+    Collects query count, DB time, serializer time and the slowest queries for one request.
+    Installed as an execute wrapper on every database alias (primary and replicas), so it sees
+    every query the request runs.
+    """
+
+    def __init__(self, keep_slowest):
+        self.keep_slowest = keep_slowest
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += duration
+            if len(self.slowest) < self.keep_slowest:
+                heapq.heappush(self.slowest, (duration, sql))
+            elif self.slowest and duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, sql))
+
+    def slowest_queries(self):
+        return sorted(self.slowest, reverse=True)
+
+
+class RouteHistograms:
+    """Process-wide, thread-safe latency histograms keyed by 'METHOD view-name'."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, route, duration_ms, queries, db_ms):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'count': 0, 'sum_ms': 0.0, 'queries': 0, 'db_ms': 0.0,
+                    'buckets': [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+                }
+            stats['count'] += 1
+            stats['sum_ms'] += duration_ms
+            stats['queries'] += queries
+            stats['db_ms'] += db_ms
+            for index, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+                if duration_ms <= bound:
+                    break
+            else:
+                index = len(HISTOGRAM_BUCKETS_MS)
+            stats['buckets'][index] += 1
+
+    def snapshot(self):
+        labels = [f'le_{bound}' for bound in HISTOGRAM_BUCKETS_MS] + ['le_inf']
+        with self._lock:
+            return {
+                route: {
+                    'count': stats['count'],
+                    'sum_ms': stats['sum_ms'],
+                    'queries': stats['queries'],
+                    'db_ms': stats['db_ms'],
+                    'buckets': dict(zip(labels, stats['buckets'])),
+                }
+                for route, stats in self._routes.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+route_histograms = RouteHistograms()
+
+
+def install_serializer_timing():
+    """
+    Wraps BaseSerializer.data so time spent building representations is charged to the
+    current request's timer. Nested serializers run inside the outer `.data` call and are
+    only counted once.
+    """
+    data_property = BaseSerializer.data
+    if getattr(data_property, 'timed', False):
+        return
+
+    def timed_data(self):
+        timer = current_timer.get()
+        if timer is None:
+            return data_property.fget(self)
+        timer.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return data_property.fget(self)
+        finally:
+            timer.serializer_depth -= 1
+            if not timer.serializer_depth:
+                timer.serializer_time += time.perf_counter() - start
+
+    timed = property(timed_data)
+    timed.fget.timed = True
+    BaseSerializer.data = timed
+
+
+@contextmanager
+def timing(timer):
+    """
+    Charges queries on every database alias, and serializer work, to `timer` within the block.
+    """
+    token = current_timer.set(timer)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            yield
+    finally:
+        current_timer.reset(token)
+
+
+class RequestTimingMiddleware:
+    """
+    Records per-request SQL count, DB time, serializer time and view time (the rest of the
+    request's Python time) when REQUEST_TIMING['ENABLED'] is set. Emits them as a Server-Timing
+    header, logs requests slower than REQUEST_TIMING['SLOW_REQUEST_MS'] with their slowest
+    queries, and feeds per-route histograms served by the staff-only /metrics/ endpoint.
+    Streaming responses are measured until their last chunk: the header (sent first) covers the
+    view up to the first byte, while the log and histograms include the queries run while
+    streaming. Works in both sync and async stacks, so async views stay on the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_request_timing_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        install_serializer_timing()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timer = RequestTimer(get_request_timing_setting('SLOWEST_QUERIES'))
+        start = time.perf_counter()
+        with timing(timer):
+            response = self.get_response(request)
+        return self.finish(request, response, timer, start)
+
+    async def __acall__(self, request):
+        timer = RequestTimer(get_request_timing_setting('SLOWEST_QUERIES'))
+        start = time.perf_counter()
+        with timing(timer):
+            response = await self.get_response(request)
+        return self.finish(request, response, timer, start)
+
+    def finish(self, request, response, timer, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = timer.db_time * 1000
+        serializer_ms = timer.serializer_time * 1000
+        view_ms = max(total_ms - db_ms - serializer_ms, 0.0)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.2f};desc="{timer.queries} queries"',
+            f'serializer;dur={serializer_ms:.2f}',
+            f'view;dur={view_ms:.2f}',
+            f'total;dur={total_ms:.2f}',
+        ])
+
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.timed_stream(request, response.streaming_content, timer, start)
+        else:
+            self.record(request, timer, total_ms)
+        return response
+
+    def timed_stream(self, request, content, timer, start):
+        """
+        Yields `content` chunk by chunk with the timer installed around each chunk (chunks may be
+        produced on different threads), and records the request once the stream ends or is closed.
+        """
+        chunks = iter(content)
+        try:
+            while True:
+                with timing(timer):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.record(request, timer, (time.perf_counter() - start) * 1000)
+
+    def record(self, request, timer, total_ms):
+        db_ms = timer.db_time * 1000
+        match = getattr(request, 'resolver_match', None)
+        route = f"{request.method} {match.view_name if match else 'unresolved'}"
+        route_histograms.observe(route, total_ms, timer.queries, db_ms)
+
+        if total_ms >= get_request_timing_setting('SLOW_REQUEST_MS'):
+            logger.warning(
+                'Slow request %s %s: %.1fms, %d queries (%.1fms in DB). Slowest queries: %s',
+                request.method, request.get_full_path(), total_ms, timer.queries, db_ms,
+                [f'{duration * 1000:.1f}ms {sql}' for duration, sql in timer.slowest_queries()],
+            )
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+from backend.benchmarks import format_summary, rollback, seed_catalog, shared_connection, summarize, use_connection
+from backend.cache import CATALOG_CACHE_ALIAS
+from backend.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Compares the sync DRF catalog viewsets driven through the WSGI handler by a thread '
+            'pool with the native async views driven through the ASGI handler by an event loop, '
+            'at the same concurrency. Both run in-process against the configured database (seeded '
+            'if empty, rolled back afterwards) over one shared connection, with the catalog '
+            'response cache disabled, since only the sync viewsets use it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64)
+
+    def handle(self, *args, **options):
+        # Requests run concurrently, so clearing the cache before each one (as bench_endpoints
+        # does) would not keep the sync side cold; swap in a dummy cache instead.
+        cold_caches = {**settings.CACHES, CATALOG_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with rollback(), shared_connection() as connection:
+            if not Product.objects.exists():
+                self.stdout.write(f"Seeding {options['rows']} products...")
+                seed_catalog(options['rows'])
+            ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:500])
+            paths = [path for pk in ids for path in (f'/products/{pk}/', '/products/?page_size=50')]
+            async_paths = ['/async' + path for path in paths]
+
+            with override_settings(ALLOWED_HOSTS=['testserver'], CACHES=cold_caches):
+                self.report('sync (WSGI)', self.run_sync(paths, options, connection))
+                self.report('async (ASGI)', self.run_async(async_paths, options))
+
+    def report(self, label, result):
+        samples, elapsed = result
+        self.stdout.write(format_summary(label, summarize(samples)))
+        self.stdout.write(f"{'':<24} throughput={len(samples) / elapsed:8.1f} req/s")
+
+    def run_sync(self, paths, options, connection):
+        def call(index):
+            client = Client()
+            start = time.perf_counter()
+            response = client.get(paths[index % len(paths)])
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency'], initializer=use_connection,
+                                initargs=(connection,)) as pool:
+            samples = list(pool.map(call, range(options['requests'])))
+        return samples, time.perf_counter() - start
+
+    def run_async(self, paths, options):
+        async def main():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def call(index):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.get(paths[index % len(paths)])
+                    assert response.status_code == 200, response.status_code
+                    return time.perf_counter() - start
+
+            start = time.perf_counter()
+            samples = await asyncio.gather(*(call(index) for index in range(options['requests'])))
+            return samples, time.perf_counter() - start
+
+        # Run from this thread, so the async ORM's thread-sensitive calls use its connection.
+        return async_to_sync(main)()
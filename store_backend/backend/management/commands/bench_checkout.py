@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+
+from backend.benchmarks import format_summary, summarize
+from backend.checkout import InsufficientStock, checkout_cart
+from backend.models import Cart, CartItem, CustomerUser, Product, ProductType
+
+
+class Command(BaseCommand):
+    help = ('Runs parallel checkouts that compete for a few products against the configured '
+            'database and reports checkout latency and throughput. More buyers than stock, so '
+            'some checkouts must be refused; fails if any product is oversold. Seeded rows are '
+            'deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200)
+        parser.add_argument('--products', type=int, default=5)
+        parser.add_argument('--stock', type=int, default=20, help='Initial stock of each product.')
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        product_type = ProductType.objects.create(name='Checkout benchmark')
+        products = Product.objects.bulk_create([
+            Product(name=f'Checkout benchmark {index}', type=product_type, price=100, ammount=options['stock'])
+            for index in range(options['products'])
+        ])
+        buyers = CustomerUser.objects.bulk_create([
+            CustomerUser(username=f'checkout-bench-{product_type.id}-{index}') for index in range(options['buyers'])
+        ])
+        carts = Cart.objects.bulk_create([Cart(user=buyer, item_count=1, total=100) for buyer in buyers])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=products[index % len(products)], ammount=1) for index, cart in enumerate(carts)
+        ])
+        try:
+            outcomes = self.run(carts, options)
+            stock = options['products'] * options['stock']
+            sold = stock - Product.objects.filter(type=product_type).aggregate(left=Sum('ammount'))['left']
+            expected = sum(min(len(carts[index::len(products)]), options['stock']) for index in range(len(products)))
+            if sold != expected or outcomes['ok'] != expected:
+                raise CommandError(f"Sold {sold} units in {outcomes['ok']} checkouts, expected {expected}.")
+        finally:
+            CustomerUser.objects.filter(id__in=[buyer.id for buyer in buyers]).delete()
+            product_type.delete()
+
+    def run(self, carts, options):
+        outcomes = {'ok': 0, 'short': 0}
+        lock = threading.Lock()
+
+        def buy(cart):
+            start = time.perf_counter()
+            try:
+                checkout_cart(cart)
+                outcome = 'ok'
+            except InsufficientStock:
+                outcome = 'short'
+            finally:
+                connections.close_all()
+            duration = time.perf_counter() - start
+            with lock:
+                outcomes[outcome] += 1
+            return duration
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            samples = list(pool.map(buy, carts))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(format_summary('checkout', summarize(samples)))
+        self.stdout.write(f"{'':<24} throughput={len(samples) / elapsed:8.1f} checkouts/s "
+                          f"ok={outcomes['ok']} short={outcomes['short']}")
+        return outcomes
@@ -0,0 +1,208 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from backend.benchmarks import format_summary, rollback, seed_catalog, summarize
+from backend.cache import get_catalog_cache
+from backend.models import Cart, CartItem, CustomerUser, Product
+
+
+DATA_SIZES = {
+    'small': 100,
+    'medium': 5_000,
+    'large': 50_000,
+}
+PASSWORDS = ('bench-Passw0rd-a', 'bench-Passw0rd-b')
+
+
+def product_types_list(ctx, i):
+    return 'get', '/product-types/', None
+
+
+def product_types_detail(ctx, i):
+    return 'get', f"/product-types/{ctx['type_id']}/", None
+
+
+def products_list(ctx, i):
+    return 'get', '/products/?page_size=50', None
+
+
+def products_detail(ctx, i):
+    return 'get', f"/products/{ctx['product_ids'][i % len(ctx['product_ids'])]}/", None
+
+
+def cart_list(ctx, i):
+    return 'get', '/cart/', None
+
+
+def cart_detail(ctx, i):
+    return 'get', f"/cart/{ctx['cart_id']}/", None
+
+
+def cart_items_list(ctx, i):
+    return 'get', '/cart-items/', None
+
+
+def cart_items_detail(ctx, i):
+    return 'get', f"/cart-items/{ctx['item_id']}/", None
+
+
+def user_register(ctx, i):
+    data = {'username': f"bench-new-{ctx['size']}-{i}", 'email': f'bench{i}@example.com', 'password': PASSWORDS[0],
+            'first_name': 'Bench', 'last_name': 'User'}
+    return 'post', '/user/register/', data
+
+
+def user_login(ctx, i):
+    return 'post', '/user/login/', {'username': ctx['username'], 'password': ctx['password']}
+
+
+def user_change_password(ctx, i):
+    old, new = ctx['password'], PASSWORDS[(PASSWORDS.index(ctx['password']) + 1) % 2]
+    ctx['password'] = new
+    return 'post', '/user/change-password/', {'old_password': old, 'new_password': new, 'confirm_new_password': new}
+
+
+# (name, request builder, uses password hashing)
+ENDPOINTS = [
+    ('product-types-list', product_types_list, False),
+    ('product-types-detail', product_types_detail, False),
+    ('products-list', products_list, False),
+    ('products-detail', products_detail, False),
+    ('cart-list', cart_list, False),
+    ('cart-detail', cart_detail, False),
+    ('cart-items-list', cart_items_list, False),
+    ('cart-items-detail', cart_items_detail, False),
+    ('user-register', user_register, True),
+    ('user-login', user_login, True),
+    ('user-change-password', user_change_password, True),
+]
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks every router endpoint at small/medium/large catalog sizes inside a '
+            'rolled-back transaction, writes latency percentiles, throughput, SQL query counts and '
+            'peak Python memory to a JSON file, and optionally flags regressions against a baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(DATA_SIZES), default=list(DATA_SIZES))
+        parser.add_argument('--endpoints', nargs='+', choices=[name for name, _, _ in ENDPOINTS])
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--auth-repeat', type=int, default=3,
+                            help='Repeats for endpoints that hash passwords.')
+        parser.add_argument('--output', default='bench_results.json')
+        parser.add_argument('--compare', help='Baseline results file to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed relative p95 latency increase before flagging a regression.')
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint for endpoint in ENDPOINTS
+                     if not options['endpoints'] or endpoint[0] in options['endpoints']]
+        results = {}
+        # every request comes from one client, so the auth throttles would cut the run short
+        with override_settings(ALLOWED_HOSTS=['testserver'], AUTH_THROTTLE={'RATES': {}}):
+            for size in options['sizes']:
+                results[size] = self.run_size(size, endpoints, options)
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        self.stdout.write(f"\nResults written to {options['output']}")
+
+        if options['compare']:
+            regressions = self.compare(results, options['compare'], options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(f'REGRESSION {regression}')
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def run_size(self, size, endpoints, options):
+        self.stdout.write(f'\n== {size} ({DATA_SIZES[size]} products)')
+        results = {}
+        with rollback():
+            ctx = self.seed(size)
+            for name, builder, hashes in endpoints:
+                repeat = options['auth_repeat'] if hashes else options['repeat']
+                results[name] = self.measure(ctx, builder, repeat)
+                self.stdout.write(format_summary(name, results[name]) +
+                                  f" qps={results[name]['throughput_rps']:.1f} queries={results[name]['queries']}"
+                                  f" peak={results[name]['peak_memory_kb']:.0f}KB")
+        return results
+
+    def seed(self, size):
+        seed_catalog(DATA_SIZES[size])
+        user = CustomerUser.objects.create_user(username=f'bench-{size}', password=PASSWORDS[0])
+        token = Token.objects.create(user=user)
+        cart = Cart.objects.create(user=user)
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:100])
+        items = CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_id=product_id, ammount=1) for product_id in product_ids[:10]])
+        return {
+            'size': size,
+            'client': Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+            'username': user.username,
+            'password': PASSWORDS[0],
+            'type_id': Product.objects.values_list('type_id', flat=True).first(),
+            'product_ids': product_ids,
+            'cart_id': cart.id,
+            'item_id': items[0].id,
+        }
+
+    def request(self, ctx, builder, i):
+        method, path, data = builder(ctx, i)
+        client = ctx['client']
+        if method == 'get':
+            response = client.get(path)
+        else:
+            response = client.post(path, data, content_type='application/json')
+        if response.status_code >= 400:
+            raise CommandError(f'{method.upper()} {path} returned {response.status_code}')
+        return response
+
+    def measure(self, ctx, builder, repeat):
+        # Every request runs against a cold catalog cache, so catalog timings track the dataset
+        # size rather than cache hits. The clear is kept out of the samples.
+        cache = get_catalog_cache()
+        samples = []
+        for i in range(repeat):
+            cache.clear()
+            start = time.perf_counter()
+            self.request(ctx, builder, i)
+            samples.append(time.perf_counter() - start)
+
+        # One extra instrumented request for query count and peak memory, kept out of the timings.
+        cache.clear()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            self.request(ctx, builder, repeat)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        summary = summarize(samples)
+        summary.update({
+            'throughput_rps': repeat / sum(samples),
+            'queries': len(queries.captured_queries),
+            'peak_memory_kb': peak / 1024,
+        })
+        return summary
+
+    def compare(self, results, baseline_path, threshold):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = []
+        for size, endpoints in results.items():
+            for name, current in endpoints.items():
+                previous = baseline.get(size, {}).get(name)
+                if previous is None:
+                    continue
+                if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                    regressions.append(f"{size}/{name}: p95 {previous['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+                if current['queries'] > previous['queries']:
+                    regressions.append(f"{size}/{name}: queries {previous['queries']} -> {current['queries']}")
+        return regressions
@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from backend.benchmarks import format_summary, rollback, seed_catalog, shared_connection, summarize, use_connection
+from backend.models import Product
+from backend.throttling import token_buckets
+
+
+class Command(BaseCommand):
+    help = ('Measures catalog read latency on its own, then during a credential-stuffing flood '
+            'against /user/login/ with throttling disabled and with the configured AUTH_THROTTLE '
+            'rates. Everything runs in-process against the configured database (seeded if empty, '
+            'rolled back afterwards) over one shared connection.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--requests', type=int, default=500, help='Catalog requests per phase.')
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--attackers', type=int, default=16)
+        parser.add_argument('--ips', type=int, default=1, help='Distinct attacker IPs.')
+        parser.add_argument('--warmup', type=float, default=15.0,
+                            help='Seconds the flood runs before catalog latency is measured.')
+
+    def handle(self, *args, **options):
+        unthrottled = {**settings.AUTH_THROTTLE, 'RATES': {}}
+        # Every failed login is logged as a warning; keep the report readable.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with rollback(), shared_connection() as connection:
+            if not Product.objects.exists():
+                self.stdout.write(f"Seeding {options['rows']} products...")
+                seed_catalog(options['rows'])
+            ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:500])
+            paths = [path for pk in ids for path in (f'/products/{pk}/', '/products/?page_size=50')]
+
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                self.phase('catalog only', paths, options, connection, flood=False)
+                with override_settings(AUTH_THROTTLE=unthrottled):
+                    self.phase('flood, no throttle', paths, options, connection, flood=True)
+                token_buckets.clear()
+                self.phase('flood, throttled', paths, options, connection, flood=True)
+
+    def phase(self, label, paths, options, connection, flood):
+        stop = threading.Event()
+        statuses = {}
+        lock = threading.Lock()
+
+        def attack(worker):
+            client = Client(REMOTE_ADDR=f"203.0.113.{worker % options['ips'] + 1}")
+            attempt = 0
+            while not stop.is_set():
+                attempt += 1
+                response = client.post('/user/login/', {'username': f'victim{worker}-{attempt}', 'password': 'guess'},
+                                       content_type='application/json')
+                with lock:
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        def read(index):
+            client = Client()
+            start = time.perf_counter()
+            response = client.get(paths[index % len(paths)])
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - start
+
+        attackers = ThreadPoolExecutor(max_workers=options['attackers'], initializer=use_connection,
+                                       initargs=(connection,))
+        if flood:
+            for worker in range(options['attackers']):
+                attackers.submit(attack, worker)
+            time.sleep(options['warmup'])
+        try:
+            with ThreadPoolExecutor(max_workers=options['readers'], initializer=use_connection,
+                                    initargs=(connection,)) as pool:
+                samples = list(pool.map(read, range(options['requests'])))
+        finally:
+            stop.set()
+            attackers.shutdown()
+
+        self.stdout.write(format_summary(label, summarize(samples)))
+        if flood:
+            self.stdout.write(f"{'':<24} login responses (incl. warmup): "
+                              + ', '.join(f'{code}={count}' for code, count in sorted(statuses.items())))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from backend.benchmarks import format_summary, measure, rollback, seed_catalog
+from backend.models import Product
+from backend.search import build_match_query, search_products
+
+
+class Command(BaseCommand):
+    help = ('Compares FTS5 product search against naive icontains scans on a seeded catalog '
+            '(rolled back afterwards). Each sample fetches one page plus the total count, as the '
+            'search endpoint does.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--query', action='append', dest='queries',
+                            help='Search text to benchmark (repeatable).')
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or ['wireless charger', 'ergonomic chair', 'lapt', 'sku0012345']
+        page_size = options['page_size']
+
+        with rollback():
+            self.stdout.write(f"Seeding {options['rows']} products...")
+            seed_catalog(options['rows'])
+
+            for text in queries:
+                match_query = build_match_query(text)
+                terms = text.split()
+                condition = Q()
+                for term in terms:
+                    condition &= Q(name__icontains=term) | Q(description__icontains=term)
+
+                def fts():
+                    hits = search_products(match_query)
+                    hits.count()
+                    list(hits[:page_size])
+
+                def icontains():
+                    products = Product.objects.filter(condition).order_by('id')
+                    products.count()
+                    list(products[:page_size])
+
+                self.stdout.write(f'\nquery: {text!r}')
+                self.stdout.write(format_summary('fts5', measure(fts, options['repeat'])))
+                self.stdout.write(format_summary('icontains', measure(icontains, options['repeat'])))
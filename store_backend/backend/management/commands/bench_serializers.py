@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from backend.benchmarks import format_summary, measure, rollback, seed_catalog
+from backend.fast_serializers import get_values_serializer
+from backend.models import Product
+from backend.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compares ProductSerializer against the values() fast path on a seeded catalog '
+            '(rolled back afterwards). Each sample loads and serializes one page of products, '
+            'and checks that both paths render the same bytes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        fast = get_values_serializer(ProductSerializer)
+        renderer = JSONRenderer()
+
+        with rollback():
+            self.stdout.write(f"Seeding {options['rows']} products...")
+            seed_catalog(options['rows'])
+            page = Product.objects.order_by('id')[:page_size]
+
+            def model_serializer():
+                return renderer.render(ProductSerializer(page, many=True).data)
+
+            def values_serializer():
+                return renderer.render(fast.many(fast.rows(page)))
+
+            if model_serializer() != values_serializer():
+                self.stderr.write('Outputs differ!')
+                return
+
+            for label, func in (('model_serializer', model_serializer), ('values', values_serializer)):
+                summary = measure(func, options['repeat'])
+                self.stdout.write(format_summary(label, summary))
+                self.stdout.write(f"  {summary['mean_ms'] * 1000 / page_size:.1f} us/row")
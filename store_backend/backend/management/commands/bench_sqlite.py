@@ -0,0 +1,84 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.utils import ConnectionHandler, OperationalError
+
+from backend.benchmarks import format_summary, summarize
+from store_backend.database import SQLITE_PROFILES, sqlite_database
+
+
+class Command(BaseCommand):
+    help = ('Runs concurrent reader and writer threads against a scratch SQLite file for each '
+            'database profile and reports throughput and latency. Every operation is treated as '
+            'one request: the connection is released the way Django does at request end, so '
+            'CONN_MAX_AGE is exercised too.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20_000)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--profiles', nargs='+', choices=list(SQLITE_PROFILES), default=list(SQLITE_PROFILES))
+
+    def handle(self, *args, **options):
+        for profile in options['profiles']:
+            with tempfile.TemporaryDirectory() as directory:
+                self.run_profile(profile, os.path.join(directory, 'bench.sqlite3'), options)
+
+    def run_profile(self, profile, path, options):
+        handler = ConnectionHandler({'default': sqlite_database(path, profile)})
+        setup = handler['default']
+        with setup.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, price INTEGER NOT NULL, ammount INTEGER NOT NULL)')
+            cursor.executemany('INSERT INTO item (price, ammount) VALUES (%s, %s)',
+                               [(index % 5000, 1000) for index in range(options['rows'])])
+        setup.close()
+
+        deadline = time.perf_counter() + options['seconds']
+        samples = {'read': [], 'write': []}
+        errors = {'read': 0, 'write': 0}
+        lock = threading.Lock()
+
+        def worker(kind, seed):
+            rng = random.Random(seed)
+            local = []
+            failed = 0
+            while time.perf_counter() < deadline:
+                connection = handler['default']
+                start = time.perf_counter()
+                try:
+                    with connection.cursor() as cursor:
+                        if kind == 'read':
+                            low = rng.randrange(5000)
+                            cursor.execute('SELECT id, price, ammount FROM item WHERE price BETWEEN %s AND %s LIMIT 50',
+                                           [low, low + 10])
+                            cursor.fetchall()
+                        else:
+                            cursor.execute('UPDATE item SET ammount = ammount - 1 WHERE id = %s AND ammount > 0',
+                                           [rng.randrange(1, options['rows'] + 1)])
+                    local.append(time.perf_counter() - start)
+                except OperationalError:
+                    failed += 1
+                connection.close_if_unusable_or_obsolete()
+            handler['default'].close()
+            with lock:
+                samples[kind].extend(local)
+                errors[kind] += failed
+
+        threads = [threading.Thread(target=worker, args=('read', index)) for index in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=('write', 1000 + index)) for index in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.stdout.write(f'\n== {profile}')
+        for kind in ('read', 'write'):
+            if samples[kind]:
+                self.stdout.write(format_summary(kind, summarize(samples[kind])))
+            self.stdout.write(f"{'':<24} throughput={len(samples[kind]) / options['seconds']:8.1f} ops/s "
+                              f"errors={errors[kind]}")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from backend.snapshots import brotli, build_snapshots, rebuild_changed_snapshots
+
+
+class Command(BaseCommand):
+    help = ('Materializes the paginated product listing of each product type into static JSON '
+            'snapshots with precompressed variants, served at /snapshots/products/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', type=int, action='append', dest='types',
+                            help='Product type id to rebuild (repeatable, default: all).')
+        parser.add_argument('--changed', action='store_true',
+                            help='Only rebuild product types changed since the last full or --changed build.')
+
+    def handle(self, *args, **options):
+        if options['changed']:
+            built = rebuild_changed_snapshots()
+        else:
+            built = build_snapshots(options['types'])
+        encodings = 'json, gzip' + (', brotli' if brotli is not None else '')
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {sum(built.values())} pages for {len(built)} product types ({encodings}).'))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.changes import compact_changes, get_change_feed_setting
+
+
+class Command(BaseCommand):
+    help = ('Trims catalog change feed entries older than the retention window. Consumers whose '
+            'position falls in the trimmed range get a 410 and must resync.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Retention in days (default: CHANGE_FEED["RETENTION_DAYS"]).')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else get_change_feed_setting('RETENTION_DAYS')
+        removed = compact_changes(timezone.now() - timedelta(days=days))
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} change feed entries older than {days} days.'))
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.importing import DEFAULT_BATCH_SIZE, detect_format, import_products
+
+
+class Command(BaseCommand):
+    help = 'Streams products from a CSV or JSONL file into the catalog using batched upserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to a .csv or .jsonl file.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from extension).')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], encoding='utf-8', errors='surrogateescape', newline='') as stream:
+                report = import_products(stream, fmt, batch_size=options['batch_size'], max_errors=0,
+                                         on_error=lambda error: self.stderr.write(json.dumps(error)))
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['imported']} products, {report['failed']} rows failed."))
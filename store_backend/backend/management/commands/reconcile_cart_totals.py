@@ -0,0 +1,22 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from backend.carts import reconcile_cart_totals
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the stored item count and total of every cart from its items, in batches, '
+            'and reports the carts whose stored values had drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        report = reconcile_cart_totals(batch_size=options['batch_size'], fix=not options['dry_run'])
+        for row in report['drifted']:
+            self.stderr.write(json.dumps(row))
+        verb = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {report['checked']} carts, {verb} drift in {len(report['drifted'])}."))
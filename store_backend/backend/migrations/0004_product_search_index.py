@@ -0,0 +1,72 @@
+# Generated by Django 5.1 on 2026-10-18 18:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+FTS_FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE backend_product_fts USING fts5(
+        name, description, content='backend_product', content_rowid='id', tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER backend_product_fts_ai AFTER INSERT ON backend_product BEGIN
+        INSERT INTO backend_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER backend_product_fts_ad AFTER DELETE ON backend_product BEGIN
+        INSERT INTO backend_product_fts(backend_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER backend_product_fts_au AFTER UPDATE OF name, description ON backend_product BEGIN
+        INSERT INTO backend_product_fts(backend_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO backend_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO backend_product_fts(backend_product_fts) VALUES ('rebuild')",
+]
+
+FTS_REVERSE_SQL = [
+    'DROP TRIGGER IF EXISTS backend_product_fts_au',
+    'DROP TRIGGER IF EXISTS backend_product_fts_ad',
+    'DROP TRIGGER IF EXISTS backend_product_fts_ai',
+    'DROP TABLE IF EXISTS backend_product_fts',
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='backend.product')),
+                ('name', models.CharField(max_length=128)),
+                ('description', models.CharField(max_length=4096)),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'backend_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(run_sqlite(FTS_FORWARD_SQL), run_sqlite(FTS_REVERSE_SQL)),
+    ]
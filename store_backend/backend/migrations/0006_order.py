@@ -0,0 +1,36 @@
+# Generated by Django 5.1 on 2026-10-18 18:28
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('total', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(limit_value=0, message='Total cannot be negative!')])),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128)),
+                ('price', models.IntegerField(validators=[django.core.validators.MinValueValidator(limit_value=0, message='Price cannot be negative!')])),
+                ('ammount', models.IntegerField(validators=[django.core.validators.MinValueValidator(limit_value=0, message='Ammount cannot be negative!')])),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='backend.order')),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='backend.product')),
+            ],
+        ),
+    ]
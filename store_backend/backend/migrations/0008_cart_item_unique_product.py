@@ -0,0 +1,40 @@
+# Generated by Django 5.1 on 2026-10-18 18:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """
+    Folds duplicate (cart, product) lines into the oldest one, summing their ammounts.
+    Cart totals are unchanged, since the sum over the cart's lines stays the same.
+    """
+    CartItem = apps.get_model('backend', 'CartItem')
+    duplicates = (CartItem.objects.values('cart_id', 'product_id')
+                  .annotate(lines=Count('id'), keep=Min('id'), ammount=Sum('ammount'))
+                  .filter(lines__gt=1))
+    for line in list(duplicates):
+        CartItem.objects.filter(pk=line['keep']).update(ammount=line['ammount'])
+        (CartItem.objects.filter(cart_id=line['cart_id'], product_id=line['product_id'])
+         .exclude(pk=line['keep']).delete())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_cart_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='cart_item_unique_product'),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='cart',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='backend.cart'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.1 on 2026-10-18 18:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+CHANGES_FORWARD_SQL = [
+    """
+    CREATE TRIGGER backend_product_changes_ai AFTER INSERT ON backend_product BEGIN
+        INSERT INTO backend_catalogchange(kind, object_id, op, created_at)
+        VALUES ('product', new.id, 'create', strftime('%Y-%m-%d %H:%M:%f', 'now'));
+    END
+    """,
+    """
+    CREATE TRIGGER backend_product_changes_au AFTER UPDATE ON backend_product BEGIN
+        INSERT INTO backend_catalogchange(kind, object_id, op, created_at)
+        VALUES ('product', new.id, 'update', strftime('%Y-%m-%d %H:%M:%f', 'now'));
+    END
+    """,
+    """
+    CREATE TRIGGER backend_product_changes_ad AFTER DELETE ON backend_product BEGIN
+        INSERT INTO backend_catalogchange(kind, object_id, op, created_at)
+        VALUES ('product', old.id, 'delete', strftime('%Y-%m-%d %H:%M:%f', 'now'));
+    END
+    """,
+    """
+    CREATE TRIGGER backend_producttype_changes_ai AFTER INSERT ON backend_producttype BEGIN
+        INSERT INTO backend_catalogchange(kind, object_id, op, created_at)
+        VALUES ('product_type', new.id, 'create', strftime('%Y-%m-%d %H:%M:%f', 'now'));
+    END
+    """,
+    """
+    CREATE TRIGGER backend_producttype_changes_au AFTER UPDATE ON backend_producttype BEGIN
+        INSERT INTO backend_catalogchange(kind, object_id, op, created_at)
+        VALUES ('product_type', new.id, 'update', strftime('%Y-%m-%d %H:%M:%f', 'now'));
+    END
+    """,
+    """
+    CREATE TRIGGER backend_producttype_changes_ad AFTER DELETE ON backend_producttype BEGIN
+        INSERT INTO backend_catalogchange(kind, object_id, op, created_at)
+        VALUES ('product_type', old.id, 'delete', strftime('%Y-%m-%d %H:%M:%f', 'now'));
+    END
+    """,
+]
+
+CHANGES_REVERSE_SQL = [
+    'DROP TRIGGER IF EXISTS backend_product_changes_ai',
+    'DROP TRIGGER IF EXISTS backend_product_changes_au',
+    'DROP TRIGGER IF EXISTS backend_product_changes_ad',
+    'DROP TRIGGER IF EXISTS backend_producttype_changes_ai',
+    'DROP TRIGGER IF EXISTS backend_producttype_changes_au',
+    'DROP TRIGGER IF EXISTS backend_producttype_changes_ad',
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_cart_item_unique_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('product_type', 'Product type')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('op', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('compacted', 'Compacted')], max_length=16)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(run_sqlite(CHANGES_FORWARD_SQL), run_sqlite(CHANGES_REVERSE_SQL)),
+    ]
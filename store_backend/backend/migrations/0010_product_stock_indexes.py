@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_catalog_change'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['type', 'ammount'], name='product_type_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('ammount__gt', 0)), fields=['id'], name='product_in_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('ammount__lte', 0)), fields=['id'], name='product_out_of_stock_idx'),
+        ),
+        # On SQLite, AlterField would rebuild backend_product and drop the search and change-log
+        # triggers on it, so the now redundant type_id index is dropped directly.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='product',
+                    name='type',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='backend.producttype'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    'DROP INDEX "backend_product_type_id_998f8488"',
+                    'CREATE INDEX "backend_product_type_id_998f8488" ON "backend_product" ("type_id")',
+                ),
+            ],
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MaxLengthValidator, MinValueValidator
 from django.contrib.auth.models import AbstractUser
 
@@ -11,6 +12,7 @@ class CustomerUser(AbstractUser):
 class ProductType(models.Model):
     name = models.CharField(max_length=128, blank=False, validators=[
         MaxLengthValidator(limit_value=128, message='Product type name is too long!')])
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 
 class Product(models.Model):
@@ -18,19 +20,96 @@ class Product(models.Model):
         MaxLengthValidator(limit_value=128, message='Product name is too long!')])
     description = models.CharField(max_length=4096, blank=True, validators=[
         MaxLengthValidator(limit_value=4096, message='Product description is too long!')])
-    type = models.ForeignKey(ProductType, on_delete=models.CASCADE, null=False)
+    # Indexed by the composite (type, ...) indexes below, whose leading column serves type lookups.
+    type = models.ForeignKey(ProductType, on_delete=models.CASCADE, null=False, db_index=False)
     price = models.IntegerField(blank=False, validators=[
         MinValueValidator(limit_value=0, message='Price cannot be negative!')])
     ammount = models.IntegerField(blank=False, validators=[
         MinValueValidator(limit_value=0, message='Ammount cannot be negative!')])
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['type', 'price', 'id'], name='product_type_price_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['type', 'ammount'], name='product_type_stock_idx'),
+            models.Index(fields=['id'], name='product_in_stock_idx', condition=models.Q(ammount__gt=0)),
+            models.Index(fields=['id'], name='product_out_of_stock_idx', condition=models.Q(ammount__lte=0)),
+        ]
 
 
 class Cart(models.Model):
     user = models.ForeignKey(CustomerUser, on_delete=models.CASCADE, null=False)
+    # Denormalized from the cart's items and kept up to date by backend.carts on every item write;
+    # `manage.py reconcile_cart_totals` recomputes them and reports drift.
+    item_count = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
 
 
 class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=False)
     ammount = models.IntegerField(blank=False, validators=[
         MinValueValidator(limit_value=0, message='Ammount cannot be negative!')])
-    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, blank=False)
\ No newline at end of file
+    # Indexed by the (cart, product) unique constraint, whose leading column serves cart lookups.
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, blank=False, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='cart_item_unique_product'),
+        ]
+
+
+class ProductSearchIndex(models.Model):
+    """
+    Read-only view of the `backend_product_fts` FTS5 table. The table and the triggers that
+    keep it in sync with `backend_product` are created in migration 0004.
+    """
+    product = models.OneToOneField(Product, on_delete=models.DO_NOTHING, primary_key=True,
+                                   db_column='rowid', related_name='+')
+    name = models.CharField(max_length=128)
+    description = models.CharField(max_length=4096)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'backend_product_fts'
+
+
+class CatalogChange(models.Model):
+    """
+    Append-only change log for products and product types, read through `/products/changes/`.
+    Rows are written by the SQLite triggers created in migration 0009, so every write (including
+    bulk upserts, cascading deletes and checkout stock updates) is logged in its own transaction.
+    `seq` is AUTOINCREMENT and therefore never reused. `compact_catalog_changes` replaces the
+    trimmed prefix with a single COMPACTED marker row.
+    """
+    PRODUCT = 'product'
+    PRODUCT_TYPE = 'product_type'
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    COMPACTED = 'compacted'
+
+    seq = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=16, choices=[(PRODUCT, 'Product'), (PRODUCT_TYPE, 'Product type')])
+    object_id = models.BigIntegerField()
+    op = models.CharField(max_length=16, choices=[
+        (CREATE, 'Create'), (UPDATE, 'Update'), (DELETE, 'Delete'), (COMPACTED, 'Compacted')])
+    created_at = models.DateTimeField(default=timezone.now)
+
+
+class Order(models.Model):
+    user = models.ForeignKey(CustomerUser, on_delete=models.CASCADE, null=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    total = models.IntegerField(default=0, validators=[
+        MinValueValidator(limit_value=0, message='Total cannot be negative!')])
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
+    name = models.CharField(max_length=128)
+    price = models.IntegerField(validators=[
+        MinValueValidator(limit_value=0, message='Price cannot be negative!')])
+    ammount = models.IntegerField(validators=[
+        MinValueValidator(limit_value=0, message='Ammount cannot be negative!')])
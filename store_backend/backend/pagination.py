@@ -0,0 +1,19 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CatalogCursorPagination(CursorPagination):
+    """Keyset pagination over the primary key, so every page costs the same as the first one."""
+
+    ordering = 'id'
+    page_size = getattr(settings, 'CATALOG_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'CATALOG_MAX_PAGE_SIZE', 200)
+
+
+class SearchPagination(PageNumberPagination):
+    """Page numbers for relevance-ranked search results, which have no stable keyset to seek on."""
+
+    page_size = getattr(settings, 'CATALOG_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'CATALOG_MAX_PAGE_SIZE', 200)
@@ -0,0 +1,13 @@
+import pytest
+
+from .query_budgets import query_budget as query_budget_context
+
+
+@pytest.fixture
+def query_budget(db):
+    """
+    Context manager fixture: `with query_budget('ProductViewSet', 'list', data_size): ...` fails
+    the test if the block's queries on any database exceed the budget declared in
+    backend/query_budgets.py.
+    """
+    return query_budget_context
@@ -0,0 +1,127 @@
+"""
+Maximum number of SQL queries each viewset action may run, across every database alias. The
+tests in backend/tests.py assert each budget at every size in QUERY_BUDGET_DATA_SIZES (products
+in the catalog and items in the cart), and that the count does not change between sizes.
+Budgets must not depend on the data size, with the one documented exception of checkout, whose
+budget is a function of the size; any other action that needs more queries as the data grows
+has an N+1 and should be fixed, not re-budgeted.
+
+The `query_budget` pytest fixture (backend.pytest_plugin) enforces these in backend/tests.py.
+Catalog budgets assume a cold response cache. Guest cart budgets are measured with the default
+cookie storage, which runs no queries of its own. Writes that keep cart totals in step run in
+atomic(), which the tests' outer transaction turns into a SAVEPOINT/RELEASE pair (two queries).
+"""
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+QUERY_BUDGET_DATA_SIZES = (20, 40)
+
+QUERY_BUDGETS = {
+    'ProductTypeViewSet': {
+        'list': 2,
+        'create': 1,
+        'retrieve': 2,
+        'update': 2,
+        'partial_update': 2,
+        'destroy': 10,
+    },
+    'ProductViewSet': {
+        'list': 2,
+        'create': 2,
+        'retrieve': 2,
+        'update': 7,
+        'partial_update': 6,
+        'destroy': 8,
+        'search': 2,
+        'changes': 3,
+        'export': 1,
+        'bulk_import': 4,
+        'cache_stats': 0,
+    },
+    'CartViewSet': {
+        'list': 1,
+        'create': 3,
+        'retrieve': 1,
+        'update': 3,
+        'partial_update': 3,
+        'destroy': 3,
+        'details': 2,
+        'badge': 1,
+        'batch': 12,
+        # One conditional stock UPDATE per cart line is inherent to the oversell guarantee.
+        'checkout': lambda data_size: data_size + 10,
+    },
+    'CartItemViewSet': {
+        'list': 1,
+        'create': 6,
+        'retrieve': 1,
+        'update': 8,
+        'partial_update': 6,
+        'destroy': 5,
+    },
+    'UserViewSet': {
+        'list': 1,
+        'create': 2,
+        'retrieve': 1,
+        'update': 2,
+        'partial_update': 1,
+        'destroy': 10,
+        'register': 6,
+        'login': 13,
+        'change_password': 8,
+        'auth_cache_stats': 0,
+        'get_username': 0,
+    },
+    'MetricsViewSet': {
+        'list': 0,
+    },
+    'GuestCartViewSet': {
+        'list': 0,
+        'create': 1,
+        'update': 0,
+        'destroy': 0,
+    },
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def budget_scales_with_data(viewset, action):
+    return callable(QUERY_BUDGETS.get(viewset, {}).get(action))
+
+
+def get_query_budget(viewset, action, data_size=QUERY_BUDGET_DATA_SIZES[0]):
+    try:
+        budget = QUERY_BUDGETS[viewset][action]
+    except KeyError:
+        raise KeyError(f'No query budget declared for {viewset}.{action} in backend/query_budgets.py')
+    return budget(data_size) if callable(budget) else budget
+
+
+@contextmanager
+def query_budget(viewset, action, data_size=QUERY_BUDGET_DATA_SIZES[0]):
+    """
+    Fails with QueryBudgetExceeded if the block runs more queries, on all database aliases
+    together, than the budget for `viewset.action` at `data_size`, listing the captured SQL.
+    Yields the list of captured queries ({'alias', 'sql'}), filled in as the block runs.
+    """
+    budget = get_query_budget(viewset, action, data_size)
+    captured = []
+
+    def recorder(alias):
+        def record(execute, sql, params, many, context):
+            captured.append({'alias': alias, 'sql': sql})
+            return execute(sql, params, many, context)
+        return record
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder(connection.alias)))
+        yield captured
+    if len(captured) > budget:
+        queries = '\n'.join(f"  {index}. [{query['alias']}] {query['sql']}" for index, query in enumerate(captured, 1))
+        raise QueryBudgetExceeded(
+            f'{viewset}.{action} ran {len(captured)} queries at data size {data_size}, budget is {budget}:\n{queries}')
@@ -0,0 +1,30 @@
+import re
+
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from .models import ProductSearchIndex
+
+
+def build_match_query(text):
+    """
+    Turns free text into an FTS5 MATCH expression. Every term is quoted so user input can
+    never inject FTS operators, and the last term is a prefix match for autocomplete.
+    Returns None if the text has no searchable terms.
+    """
+    terms = re.findall(r'\w+', text or '')
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_products(match_query):
+    """
+    Returns index hits for `match_query` ordered by bm25 relevance, with products joined in.
+    """
+    return (ProductSearchIndex.objects
+            .filter(RawSQL('backend_product_fts MATCH %s', (match_query,), output_field=BooleanField()))
+            .select_related('product')
+            .order_by('rank', 'product_id'))
@@ -2,19 +2,22 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth import authenticate
 
-from .models import ProductType, Product, Cart, CartItem, CustomerUser
+from .carts import MAX_CART_TOTAL
+from .fieldsets import SparseFieldsetMixin
+from .guest_carts import get_guest_cart_setting
+from .models import ProductType, Product, Cart, CartItem, CustomerUser, Order, OrderLine
 
 
 CustomerUser = get_user_model()
 
 
-class ProductTypeSerializer(serializers.ModelSerializer):
+class ProductTypeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductType
         fields = ['id', 'name']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'type', 'price', 'ammount']
@@ -23,16 +26,107 @@ class ProductSerializer(serializers.ModelSerializer):
 class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
-        fields = ['id', 'user']
+        fields = ['id', 'user', 'item_count', 'total']
+        read_only_fields = ['item_count', 'total']
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartBadgeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Cart
+        fields = ['id', 'item_count', 'total']
+
+
+class CartItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'ammount', 'cart']
+        extra_kwargs = {'ammount': {'max_value': MAX_CART_TOTAL}}
+
+
+class CartItemAddSerializer(CartItemSerializer):
+    """
+    Input for adding to a cart. Adding a product that already has a line is allowed (it
+    increments that line), so the (cart, product) uniqueness validator is dropped.
+    """
+    class Meta(CartItemSerializer.Meta):
+        validators = []
+
+
+class CartItemDetailSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_price = serializers.IntegerField(source='product.price', read_only=True)
+    line_total = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product', 'product_name', 'product_price', 'ammount', 'line_total']
+
+
+class CartDetailSerializer(serializers.ModelSerializer):
+    """
+    Cart with nested items and its stored totals. Expects the queryset built by
+    `CartViewSet.get_queryset` for the `details` action (prefetched items).
+    """
+    items = CartItemDetailSerializer(many=True, read_only=True, source='cartitem_set')
+
+    class Meta:
+        model = Cart
+        fields = ['id', 'user', 'items', 'item_count', 'total']
+
+
+class CartItemOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'update', 'remove'])
+    item = serializers.IntegerField(required=False)
+    product = serializers.IntegerField(required=False)
+    ammount = serializers.IntegerField(required=False, min_value=0, max_value=MAX_CART_TOTAL)
+
+    REQUIRED_FIELDS = {
+        'add': ('product', 'ammount'),
+        'update': ('item', 'ammount'),
+        'remove': ('item',),
+    }
+
+    def validate(self, data):
+        missing = [field for field in self.REQUIRED_FIELDS[data['op']] if field not in data]
+        if missing:
+            raise serializers.ValidationError({field: ['This field is required.'] for field in missing})
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartItemOperationSerializer(many=True, allow_empty=False)
+
+
+def validate_guest_cart_quantity(value):
+    max_quantity = get_guest_cart_setting('MAX_QUANTITY')
+    if value > max_quantity:
+        raise serializers.ValidationError(f'Ensure this value is less than or equal to {max_quantity}.')
+
+
+class GuestCartItemSerializer(serializers.Serializer):
+    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    ammount = serializers.IntegerField(min_value=1, validators=[validate_guest_cart_quantity])
+
+
+class GuestCartItemUpdateSerializer(serializers.Serializer):
+    ammount = serializers.IntegerField(min_value=0, validators=[validate_guest_cart_quantity])
+
+
+class OrderLineSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderLine
+        fields = ['id', 'product', 'name', 'price', 'ammount']
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    lines = OrderLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'user', 'created_at', 'total', 'lines']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomerUser
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'phone_number', 'delivery_address')
@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .cache import catalog_changed
+from .db_router import lag_monitor
+from .models import CustomerUser
+from .snapshots import on_catalog_changed
+
+
+@receiver(post_save, sender=CustomerUser)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """
+    Any change to a user (password, is_active, profile) evicts their cached tokens.
+    """
+    token_cache.invalidate_user(instance.pk)
+    if token_cache.shared_cache() is not None:
+        token_cache.invalidate(*Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(catalog_changed)
+def invalidate_catalog_snapshots(sender, **kwargs):
+    on_catalog_changed()
+
+
+@receiver(catalog_changed)
+def recheck_replica_lag(sender, **kwargs):
+    """
+    A replica measured as caught up just before this write no longer is.
+    """
+    lag_monitor.reset()
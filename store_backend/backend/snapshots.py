@@ -0,0 +1,396 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from rest_framework.test import APIRequestFactory
+
+from .models import CatalogChange, Product, ProductType
+from .views import ProductViewSet
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip variants are written
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, where snapshot_lock uses msvcrt instead
+    fcntl = None
+    import msvcrt
+
+
+logger = logging.getLogger('backend.snapshots')
+
+GENERATION_FILE = 'GENERATION'
+BUILT_SEQ_FILE = 'BUILT_SEQ'
+LOCK_FILE = '.lock'
+MANIFEST_FILE = 'manifest.json'
+IDS_FILE = 'ids.json'
+SNAPSHOT_PARAMS = {'type', 'cursor'}
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Past this many logged changes an incremental rebuild just rebuilds every type.
+MAX_INCREMENTAL_CHANGES = 10000
+
+SNAPSHOT_DEFAULTS = {
+    'REBUILD_ON_WRITE': False,
+    'REBUILD_DELAY': 5,
+}
+
+live_product_list = ProductViewSet.as_view({'get': 'list'})
+
+
+def snapshot_settings():
+    return settings.CATALOG_SNAPSHOTS
+
+
+def get_snapshot_setting(name):
+    return snapshot_settings().get(name, SNAPSHOT_DEFAULTS[name])
+
+
+def snapshot_root():
+    return os.path.join(snapshot_settings()['ROOT'], 'products')
+
+
+def page_name(cursor):
+    return hashlib.sha1((cursor or '').encode()).hexdigest()
+
+
+def write_atomic(path, content):
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(content)
+    os.replace(tmp_path, path)
+
+
+def read_root_file(name):
+    try:
+        with open(os.path.join(snapshot_root(), name)) as fh:
+            return fh.read()
+    except FileNotFoundError:
+        return None
+
+
+def read_generation():
+    return read_root_file(GENERATION_FILE)
+
+
+def latest_change_seq():
+    return CatalogChange.objects.order_by('-seq').values_list('seq', flat=True).first() or 0
+
+
+@contextmanager
+def snapshot_lock():
+    """
+    Serializes snapshot builds between threads and processes sharing ROOT, so two rebuilds never
+    remove each other's build directories.
+    """
+    root = snapshot_root()
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), 'w') as fh:
+        lock_file(fh)
+        try:
+            yield
+        finally:
+            unlock_file(fh)
+
+
+def lock_file(fh):
+    if fcntl is not None:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:  # LK_LOCK gives up after about 10 seconds; a build can take longer
+            continue
+
+
+def unlock_file(fh):
+    if fcntl is not None:
+        fcntl.flock(fh, fcntl.LOCK_UN)
+    else:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def mark_stale():
+    """
+    Moves snapshots to a new generation so every existing manifest stops matching. Does nothing
+    until snapshots have been built once.
+    """
+    root = snapshot_root()
+    if not os.path.isdir(root):
+        return None
+    generation = uuid.uuid4().hex
+    write_atomic(os.path.join(root, GENERATION_FILE), generation.encode())
+    return generation
+
+
+def render_live_page(product_type_id, cursor):
+    """
+    Renders one page of the live product listing for `product_type_id`, with pagination links
+    pointing back at the snapshot endpoint under CATALOG_SNAPSHOTS['BASE_URL'].
+    Returns (content, next_cursor).
+    """
+    base_url = urlparse(snapshot_settings()['BASE_URL'])
+    params = {'type': product_type_id}
+    if cursor:
+        params['cursor'] = cursor
+    request = APIRequestFactory().get(reverse('ProductSnapshots'), params, HTTP_HOST=base_url.netloc,
+                                      secure=base_url.scheme == 'https')
+    response = live_product_list(request)
+    response.render()
+    next_url = response.data['next']
+    next_cursor = parse_qs(urlparse(next_url).query)['cursor'][0] if next_url else None
+    return response.content, next_cursor
+
+
+def build_type_snapshot(product_type_id, generation):
+    """
+    Writes every page of the listing for one product type (plus compressed variants) into a
+    fresh build directory, then points the type's manifest at it and removes older builds.
+    Returns the number of pages written.
+    """
+    type_dir = os.path.join(snapshot_root(), f'type-{product_type_id}')
+    build = uuid.uuid4().hex
+    build_dir = os.path.join(type_dir, build)
+    os.makedirs(build_dir)
+
+    pages = 0
+    ids = []
+    cursor = None
+    while True:
+        content, next_cursor = render_live_page(product_type_id, cursor)
+        ids.extend(item['id'] for item in json.loads(content)['results'])
+        path = os.path.join(build_dir, page_name(cursor) + '.json')
+        write_atomic(path, content)
+        write_atomic(path + '.gz', gzip.compress(content, mtime=0))
+        if brotli is not None:
+            write_atomic(path + '.br', brotli.compress(content))
+        pages += 1
+        if next_cursor is None:
+            break
+        cursor = next_cursor
+
+    write_atomic(os.path.join(build_dir, IDS_FILE), json.dumps(ids).encode())
+    manifest = {'generation': generation, 'build': build, 'pages': pages}
+    write_atomic(os.path.join(type_dir, MANIFEST_FILE), json.dumps(manifest).encode())
+    for entry in os.listdir(type_dir):
+        if entry not in (build, MANIFEST_FILE) and os.path.isdir(os.path.join(type_dir, entry)):
+            shutil.rmtree(os.path.join(type_dir, entry), ignore_errors=True)
+    return pages
+
+
+def read_manifest(product_type_id):
+    try:
+        with open(os.path.join(snapshot_root(), f'type-{product_type_id}', MANIFEST_FILE)) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def snapshot_ids(product_type_id, manifest):
+    try:
+        with open(os.path.join(snapshot_root(), f'type-{product_type_id}', manifest['build'], IDS_FILE)) as fh:
+            return set(json.load(fh))
+    except FileNotFoundError:
+        return None
+
+
+def built_type_ids():
+    return {int(entry[len('type-'):]) for entry in os.listdir(snapshot_root()) if entry.startswith('type-')}
+
+
+def build_snapshots(product_type_ids=None):
+    """
+    Builds snapshots for the given product types (all of them by default) and returns
+    {type_id: pages}. Snapshots of product types that no longer exist are removed.
+    """
+    with snapshot_lock():
+        generation = read_generation() or mark_stale()
+        seq = latest_change_seq()
+        built = _build(product_type_ids, generation)
+        if product_type_ids is None:
+            write_atomic(os.path.join(snapshot_root(), BUILT_SEQ_FILE), str(seq).encode())
+        return built
+
+
+def _build(product_type_ids, generation):
+    root = snapshot_root()
+    existing = set(ProductType.objects.values_list('id', flat=True))
+    if product_type_ids is None:
+        product_type_ids = sorted(existing)
+        for type_id in built_type_ids() - existing:
+            shutil.rmtree(os.path.join(root, f'type-{type_id}'), ignore_errors=True)
+    return {type_id: build_type_snapshot(type_id, generation)
+            for type_id in product_type_ids if type_id in existing}
+
+
+def affected_type_ids(since, seq):
+    """
+    Returns the product types whose listings changed between change log positions `since` and
+    `seq`, or None if every type has to be rebuilt. A product counts against its current type
+    and against any type whose snapshot still lists it, which covers moves and deletes.
+    """
+    changes = CatalogChange.objects.filter(seq__gt=since, seq__lte=seq)
+    if changes.count() > MAX_INCREMENTAL_CHANGES or changes.filter(op=CatalogChange.COMPACTED).exists():
+        return None
+    type_ids, product_ids = set(), set()
+    for kind, object_id in changes.values_list('kind', 'object_id'):
+        (type_ids if kind == CatalogChange.PRODUCT_TYPE else product_ids).add(object_id)
+    if product_ids:
+        type_ids.update(Product.objects.filter(id__in=product_ids).values_list('type_id', flat=True))
+        for type_id in built_type_ids() - type_ids:
+            manifest = read_manifest(type_id)
+            ids = snapshot_ids(type_id, manifest) if manifest else None
+            if ids is None or ids & product_ids:
+                type_ids.add(type_id)
+    return type_ids
+
+
+def rebuild_changed_snapshots():
+    """
+    Rebuilds only the product types affected by catalog changes since the last build and moves
+    the other types' manifests to the current generation. Falls back to a full build when there
+    is no previous build to compare against. Returns {type_id: pages} for the rebuilt types.
+    """
+    with snapshot_lock():
+        since = read_root_file(BUILT_SEQ_FILE)
+        generation = read_generation() or mark_stale()
+        seq = latest_change_seq()
+        type_ids = affected_type_ids(int(since), seq) if since is not None else None
+        if type_ids is None:
+            built = _build(None, generation)
+        else:
+            existing = set(ProductType.objects.values_list('id', flat=True))
+            built = _build(sorted(type_ids), generation)
+            for type_id in built_type_ids():
+                if type_id not in existing:
+                    shutil.rmtree(os.path.join(snapshot_root(), f'type-{type_id}'), ignore_errors=True)
+                elif type_id not in type_ids:
+                    manifest = read_manifest(type_id)
+                    if manifest is not None:
+                        manifest['generation'] = generation
+                        write_atomic(os.path.join(snapshot_root(), f'type-{type_id}', MANIFEST_FILE),
+                                     json.dumps(manifest).encode())
+        write_atomic(os.path.join(snapshot_root(), BUILT_SEQ_FILE), str(seq).encode())
+        return built
+
+
+class SnapshotRebuilder:
+    """
+    Coalesces catalog writes into one rebuild of the affected types, run on a background thread
+    REBUILD_DELAY seconds after the first write, so requests and import batches never rebuild
+    snapshots themselves. Writes landing during a rebuild schedule the next one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def schedule(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(get_snapshot_setting('REBUILD_DELAY'), self.run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def run(self):
+        with self._lock:
+            self._timer = None
+        try:
+            rebuild_changed_snapshots()
+        except Exception:
+            logger.exception('Catalog snapshot rebuild failed')
+        finally:
+            connection.close()
+
+    def cancel(self):
+        """
+        Drops a pending rebuild. Returns True if one was pending.
+        """
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        return timer is not None
+
+
+snapshot_rebuilder = SnapshotRebuilder()
+
+
+def on_catalog_changed(**kwargs):
+    """
+    Post-write trigger: invalidates existing snapshots at once and, if REBUILD_ON_WRITE is set,
+    schedules a debounced background rebuild of the affected types.
+    """
+    if mark_stale() is not None and get_snapshot_setting('REBUILD_ON_WRITE'):
+        snapshot_rebuilder.schedule()
+
+
+def find_snapshot(product_type_id, cursor, accept_encoding):
+    """
+    Returns (path, encoding, etag) of the freshest matching snapshot file, or None when there
+    is no snapshot for the page or it predates the last catalog write.
+    """
+    type_dir = os.path.join(snapshot_root(), f'type-{product_type_id}')
+    manifest = read_manifest(product_type_id)
+    if manifest is None or manifest['generation'] != read_generation():
+        return None
+
+    name = page_name(cursor)
+    path = os.path.join(type_dir, manifest['build'], name + '.json')
+    etag = quote_etag(f"{manifest['build']}-{name}")
+    for encoding, suffix in ENCODINGS:
+        if encoding in accept_encoding and os.path.exists(path + suffix):
+            return path + suffix, encoding, etag
+    return path, None, etag
+
+
+def product_snapshot(request):
+    """
+    Serves the product listing for `?type=` from prebuilt snapshot files (no ORM or serializer
+    work), falling back to the live ProductViewSet list when the snapshot is missing or stale.
+    """
+    params = request.GET
+    snapshot = None
+    if request.method in ('GET', 'HEAD') and set(params) <= SNAPSHOT_PARAMS and params.get('type', '').isdigit():
+        snapshot = find_snapshot(int(params['type']), params.get('cursor'),
+                                 request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if snapshot is None:
+        response = live_product_list(request)
+        response['X-Catalog-Snapshot'] = 'miss'
+        return response
+
+    path, encoding, etag = snapshot
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            with open(path, 'rb') as fh:
+                content = fh.read()
+        except FileNotFoundError:  # a concurrent rebuild removed the build directory
+            response = live_product_list(request)
+            response['X-Catalog-Snapshot'] = 'miss'
+            return response
+        response = HttpResponse(content, content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+    response['X-Catalog-Snapshot'] = 'hit'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -1,3 +1,12 @@
+import csv
+import gzip
+import io
+import itertools
+import json
+import logging
+import threading
+from datetime import timedelta
+
 import pytest
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -5,6 +14,56 @@ from django.contrib.auth.models import User
 import backend.models as models
 from rest_framework.authtoken.models import Token
 from django.urls import reverse
+from django.db import connection, connections
+from django.db.utils import ConnectionHandler
+from django.test import AsyncClient, RequestFactory
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from urllib.parse import parse_qs, urlparse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from backend.management.commands.bench_endpoints import ENDPOINTS as BENCH_ENDPOINTS
+from django.utils import timezone
+
+from backend.pagination import CatalogCursorPagination
+from backend.benchmarks import rollback
+from backend.cache import CATALOG_VERSION_KEY, cache_lock, get_catalog_cache, catalog_cache_stats
+from backend.checks import check_auth_throttle_cache, check_guest_cart_cache
+from backend.importing import import_products
+from backend.checkout import InsufficientStock, checkout_cart
+from backend.authentication import TokenCache, token_cache
+from backend.instrumentation import RequestTimingMiddleware, route_histograms
+from backend.query_budgets import QUERY_BUDGET_DATA_SIZES, QUERY_BUDGETS, budget_scales_with_data
+from backend.urls import router
+from backend.db_router import ReplicaRoutingMiddleware, lag_monitor, routing_state
+from store_backend.database import sqlite_database
+from backend.snapshots import (SnapshotRebuilder, build_snapshots, read_manifest, rebuild_changed_snapshots,
+                               snapshot_rebuilder)
+from backend.throttling import take_token, token_buckets
+from backend.guest_carts import GuestCart, merge_guest_cart
+from backend.carts import (add_cart_items, adjust_cart_totals, cart_totals_refreshed, delete_cart_items,
+                           lock_cart_items, reconcile_cart_totals, refresh_cart_totals)
+from django.http import HttpResponse
+from backend.fast_serializers import ValuesSerializer, get_values_serializer
+from backend.serializers import CartDetailSerializer, ProductSerializer, ProductTypeSerializer
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import caches
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from backend.filters import ProductFilterBackend
+
+
+def clear_process_caches():
+    get_catalog_cache().clear()
+    catalog_cache_stats.reset()
+    token_cache.clear()
+    token_buckets.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_catalog_cache():
+    clear_process_caches()
 
 
 @pytest.fixture
@@ -52,7 +111,9 @@ def cart(customer_user):
 
 @pytest.fixture
 def cart_item(cart, product):
-    return models.CartItem.objects.create(cart=cart, product=product, ammount=1)
+    item = models.CartItem.objects.create(cart=cart, product=product, ammount=1)
+    refresh_cart_totals(models.Cart.objects.filter(pk=cart.pk))
+    return item
 
 
 @pytest.mark.django_db
@@ -128,6 +189,650 @@ class TestProductViewSet:
         assert response.status_code == status.HTTP_204_NO_CONTENT
         assert models.Product.objects.count() == 0
 
+    def test_list_products_is_cursor_paginated(self, api_client, product_type):
+        models.Product.objects.bulk_create([
+            models.Product(name=f'Product {i}', type=product_type, price=i, ammount=1) for i in range(5)
+        ])
+        url = reverse('Products-list')
+        response = api_client.get(url, {'page_size': 2})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['results']) == 2
+        assert 'page=' not in response.data['next']
+
+        seen = [item['id'] for item in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            response = api_client.get(next_url)
+            seen.extend(item['id'] for item in response.data['results'])
+            next_url = response.data['next']
+        assert seen == sorted(models.Product.objects.values_list('id', flat=True))
+
+    def test_list_products_page_size_is_capped(self, api_client, product_type, monkeypatch):
+        monkeypatch.setattr(CatalogCursorPagination, 'max_page_size', 2)
+        models.Product.objects.bulk_create([
+            models.Product(name=f'Product {i}', type=product_type, price=i, ammount=1) for i in range(3)
+        ])
+        url = reverse('Products-list')
+        response = api_client.get(url, {'page_size': 10_000})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['results']) == 2
+        assert response.data['next'] is not None
+
+
+@pytest.mark.django_db
+class TestProductFiltering:
+    @pytest.fixture
+    def catalog(self, product_type):
+        other_type = models.ProductType.objects.create(name='Furniture')
+        return models.Product.objects.bulk_create([
+            models.Product(name='Phone', type=product_type, price=300, ammount=5),
+            models.Product(name='Cable', type=product_type, price=10, ammount=0),
+            models.Product(name='Monitor', type=product_type, price=200, ammount=2),
+            models.Product(name='TV', type=product_type, price=900, ammount=1),
+            models.Product(name='Chair', type=other_type, price=150, ammount=3),
+        ])
+
+    def test_filter_by_type_price_and_stock(self, api_client, catalog, product_type):
+        response = api_client.get(reverse('Products-list'), {
+            'type': product_type.id, 'min_price': 5, 'max_price': 500, 'in_stock': 'true', 'ordering': 'price',
+        })
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['name'] for item in response.data['results']] == ['Phone', 'Monitor']
+
+    def test_ordering_by_price_pages_through_cursor(self, api_client, catalog):
+        url = reverse('Products-list')
+        response = api_client.get(url, {'ordering': 'price', 'page_size': 2})
+        names = [item['name'] for item in response.data['results']]
+        while response.data['next']:
+            response = api_client.get(response.data['next'])
+            names.extend(item['name'] for item in response.data['results'])
+        assert names == ['Cable', 'Chair', 'Monitor', 'Phone', 'TV']
+
+    def test_ordering_outside_whitelist_is_ignored(self, api_client, catalog):
+        response = api_client.get(reverse('Products-list'), {'ordering': 'description'})
+        assert [item['id'] for item in response.data['results']] == sorted(product.id for product in catalog)
+
+    def test_invalid_filter_value(self, api_client):
+        response = api_client.get(reverse('Products-list'), {'min_price': 'cheap'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_filters_use_composite_index(self, product_type):
+        plan = models.Product.objects.filter(
+            type=product_type, price__gte=10, price__lte=100, ammount__gt=0).order_by('price', 'id').explain()
+        assert 'product_type_price_idx' in plan
+        plan = models.Product.objects.filter(price__gte=10).order_by('price', 'id').explain()
+        assert 'product_price_idx' in plan
+
+    @pytest.mark.parametrize('params, ordering', [
+        ({**type_filter, **price_filter, **stock_filter}, ordering)
+        for type_filter, price_filter, stock_filter, ordering in itertools.product(
+            [{}, {'type': 1}], [{}, {'min_price': 10}, {'max_price': 100}, {'min_price': 10, 'max_price': 100}],
+            [{}, {'in_stock': 'true'}, {'in_stock': 'false'}], [('id',), ('price', 'id')])
+        if (type_filter or price_filter or stock_filter)
+        # a lone one-sided price bound in id order walks the primary key (see ProductFilterBackend)
+        and not (len(price_filter) == 1 and not type_filter and not stock_filter and ordering == ('id',))
+    ])
+    def test_every_filter_combination_is_index_backed(self, params, ordering):
+        request = Request(RequestFactory().get('/', params))
+        queryset = ProductFilterBackend().filter_queryset(request, models.Product.objects.all(), None)
+        for page in (queryset, queryset.filter(id__gt=1)):  # first page, and a later one behind a cursor
+            plan = page.order_by(*ordering).explain()
+            steps = [line for line in plan.splitlines() if 'backend_product' in line]
+            assert steps and all('USING' in line for line in steps), plan
+
+
+@pytest.mark.django_db
+class TestFastSerializers:
+    @pytest.mark.parametrize('serializer_class', [ProductSerializer, ProductTypeSerializer])
+    def test_output_is_byte_identical(self, serializer_class, product):
+        models.Product.objects.create(name='Cable', description='', type=product.type, price=10, ammount=0)
+        queryset = serializer_class.Meta.model.objects.order_by('id')
+        fast = get_values_serializer(serializer_class)
+        renderer = JSONRenderer()
+        assert renderer.render(fast.many(fast.rows(queryset))) == \
+            renderer.render(serializer_class(queryset, many=True).data)
+
+    def test_list_pages_match_model_serializer(self, api_client, product_type):
+        models.Product.objects.bulk_create(
+            models.Product(name=f'Item {i}', type=product_type, price=i % 3, ammount=i) for i in range(5))
+        response = api_client.get(reverse('Products-list'), {'ordering': 'price', 'page_size': 2})
+        results = response.data['results']
+        while response.data['next']:
+            response = api_client.get(response.data['next'])
+            results.extend(response.data['results'])
+        expected = models.Product.objects.order_by('price', 'id')
+        assert results == ProductSerializer(expected, many=True).data
+
+    def test_nested_serializer_is_rejected(self):
+        with pytest.raises(ImproperlyConfigured):
+            ValuesSerializer(CartDetailSerializer)
+
+
+@pytest.mark.django_db
+class TestSparseFieldsets:
+    def select_sql(self, queries):
+        return ' '.join(query['sql'] for query in queries if query['sql'].startswith('SELECT'))
+
+    def test_product_list_prunes_keys_and_columns(self, api_client, product):
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(reverse('Products-list'), {'fields': 'id,name,price'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'] == [{'id': product.id, 'name': 'Laptop', 'price': 1000}]
+        assert '"description"' not in self.select_sql(queries)
+
+    def test_ordering_column_is_kept_for_the_cursor(self, api_client, product_type):
+        models.Product.objects.bulk_create(
+            models.Product(name=f'Item {i}', type=product_type, price=10 - i, ammount=1) for i in range(3))
+        response = api_client.get(reverse('Products-list'), {'fields': 'name', 'ordering': 'price', 'page_size': 2})
+        names = [item['name'] for item in response.data['results']]
+        assert response.data['results'][0].keys() == {'name'}
+        response = api_client.get(response.data['next'])
+        names.extend(item['name'] for item in response.data['results'])
+        assert names == ['Item 2', 'Item 1', 'Item 0']
+
+    def test_product_retrieve_uses_only(self, api_client, product):
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(reverse('Products-detail', args=[product.id]), {'fields': 'name'})
+        assert response.data == {'name': 'Laptop'}
+        assert '"description"' not in self.select_sql(queries)
+
+    def test_product_type_cart_item_and_user(self, api_client, cart_item, customer_user):
+        response = api_client.get(reverse('ProductTypes-list'), {'fields': 'name'})
+        assert response.data['results'] == [{'name': 'Electronics'}]
+        response = api_client.get(reverse('CartItems-list'), {'fields': 'product,ammount'})
+        assert response.data == [{'product': cart_item.product_id, 'ammount': 1}]
+        response = api_client.get(reverse('User-detail', args=[customer_user.id]), {'fields': 'username'})
+        assert response.data == {'username': 'testuser'}
+
+    def test_export_honours_fields(self, api_client, product):
+        response = api_client.get(reverse('Products-export'), {'export_format': 'csv', 'fields': 'id,name'})
+        assert b''.join(response.streaming_content).decode().splitlines() == ['id,name', f'{product.id},Laptop']
+
+    def test_unknown_field_is_rejected(self, api_client, product):
+        response = api_client.get(reverse('Products-list'), {'fields': 'name,secret'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data == {'fields': ['Unknown field: secret.']}
+
+    def test_writes_ignore_fields(self, api_client, product_type):
+        url = reverse('Products-list') + '?fields=id'
+        response = api_client.post(url, {'name': 'Desk', 'description': '', 'type': product_type.id,
+                                          'price': 5, 'ammount': 1}, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['name'] == 'Desk'
+
+
+@pytest.mark.django_db
+class TestAsyncCatalog:
+    def get(self, path, **params):
+        return async_to_sync(AsyncClient().get)(path, params)
+
+    def test_async_list_matches_sync_list(self, api_client, product_type):
+        models.Product.objects.bulk_create([
+            models.Product(name=f'Product {i}', type=product_type, price=i, ammount=1) for i in range(5)
+        ])
+        sync_page = api_client.get(reverse('Products-list'), {'page_size': 2}).json()
+        async_page = self.get(reverse('AsyncProducts-list'), page_size=2).json()
+        assert async_page['results'] == sync_page['results']
+
+        cursor = parse_qs(urlparse(async_page['next']).query)['cursor'][0]
+        sync_next = api_client.get(reverse('Products-list'), {'page_size': 2, 'cursor': cursor}).json()
+        async_next = self.get(reverse('AsyncProducts-list'), page_size=2, cursor=cursor).json()
+        assert async_next['results'] == sync_next['results']
+
+    def test_async_filters_and_ordering_match_sync(self, api_client, product_type):
+        other_type = models.ProductType.objects.create(name='Books')
+        models.Product.objects.bulk_create([
+            models.Product(name=f'Product {i}', type=product_type if i % 3 else other_type, price=i // 2 * 10,
+                           ammount=i % 4) for i in range(12)
+        ])
+        params = {'type': product_type.id, 'min_price': 10, 'in_stock': 'true', 'ordering': 'price',
+                  'fields': 'id,price', 'page_size': 2}
+        sync_results, async_results = [], []
+        for get, results in ((lambda query: api_client.get(reverse('Products-list'), query).json(), sync_results),
+                             (lambda query: self.get(reverse('AsyncProducts-list'), **query).json(), async_results)):
+            page = get(params)
+            results.extend(page['results'])
+            while page['next']:
+                page = get({**params, 'cursor': parse_qs(urlparse(page['next']).query)['cursor'][0]})
+                results.extend(page['results'])
+        assert async_results == sync_results
+        assert [row['price'] for row in async_results] == [10, 20, 30, 50, 50]
+        assert list(async_results[0]) == ['id', 'price']
+
+    def test_async_rejects_bad_parameters_like_sync(self, api_client):
+        for params in ({'min_price': 'cheap'}, {'fields': 'id,colour'}):
+            response = self.get(reverse('AsyncProducts-list'), **params)
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+            assert response.json() == api_client.get(reverse('Products-list'), params).json()
+
+    def test_async_detail(self, api_client, product, product_type):
+        response = self.get(reverse('AsyncProducts-detail', args=[product.id]))
+        assert response.json() == api_client.get(reverse('Products-detail', args=[product.id])).json()
+        response = self.get(reverse('AsyncProductTypes-detail', args=[product_type.id]))
+        assert response.json() == {'id': product_type.id, 'name': 'Electronics'}
+
+    def test_async_detail_not_found(self):
+        assert self.get(reverse('AsyncProducts-detail', args=[999])).status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestCatalogCache:
+    def test_repeated_list_is_served_from_cache(self, api_client, product, django_assert_num_queries):
+        url = reverse('Products-list')
+        first = api_client.get(url)
+        with django_assert_num_queries(0):
+            second = api_client.get(url)
+        assert second.status_code == status.HTTP_200_OK
+        assert second.data == first.data
+        assert catalog_cache_stats.snapshot()['hits'] == 1
+        assert catalog_cache_stats.snapshot()['misses'] == 1
+
+    def test_update_invalidates_cached_retrieve(self, api_client, product, django_capture_on_commit_callbacks):
+        url = reverse('Products-detail', args=[product.id])
+        assert api_client.get(url).data['price'] == 1000
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.patch(url, {'price': 900}, format='json')
+        assert api_client.get(url).data['price'] == 900
+
+    def test_product_type_delete_invalidates_product_list(self, api_client, product, product_type,
+                                                          django_capture_on_commit_callbacks):
+        url = reverse('Products-list')
+        assert len(api_client.get(url).data['results']) == 1
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.delete(reverse('ProductTypes-detail', args=[product_type.id]))
+        assert len(api_client.get(url).data['results']) == 0
+
+    def test_version_in_shared_cache_invalidates_every_process(self, api_client, product, settings):
+        settings.CATALOG_VERSION_CACHE = 'default'
+        caches['default'].delete(CATALOG_VERSION_KEY)
+        url = reverse('Products-detail', args=[product.id])
+        assert api_client.get(url).data['price'] == 1000
+        # a write committed by another process: the row changes and the shared version moves
+        models.Product.objects.filter(pk=product.pk).update(price=900)
+        caches['default'].incr(CATALOG_VERSION_KEY)
+        assert api_client.get(url).data['price'] == 900
+        assert get_catalog_cache().get(CATALOG_VERSION_KEY) is None
+
+    def test_cache_stats_is_staff_only(self, api_client, customer_user):
+        url = reverse('Products-cache-stats')
+        assert api_client.get(url).status_code == status.HTTP_403_FORBIDDEN
+        customer_user.is_staff = True
+        customer_user.save()
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data) == {'hits', 'misses', 'hit_rate'}
+
+
+@pytest.mark.django_db
+class TestCatalogConditionalGet:
+    def test_list_returns_validators(self, api_client, product):
+        response = api_client.get(reverse('Products-list'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'].startswith('"')
+        assert 'Last-Modified' in response
+
+    def test_if_none_match_returns_not_modified(self, api_client, product):
+        url = reverse('Products-detail', args=[product.id])
+        etag = api_client.get(url)['ETag']
+        get_catalog_cache().clear()
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b''
+
+    def test_if_modified_since_returns_not_modified(self, api_client, product_type):
+        url = reverse('ProductTypes-list')
+        last_modified = api_client.get(url)['Last-Modified']
+        response = api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_deleting_older_product_moves_last_modified(self, api_client, product, product_type,
+                                                        django_capture_on_commit_callbacks):
+        newest = models.Product.objects.create(name='Newer', type=product_type, price=10, ammount=1)
+        models.CatalogChange.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        url = reverse('Products-list')
+        last_modified = api_client.get(url)['Last-Modified']
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.delete(reverse('Products-detail', args=[product.id]))
+        response = api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == status.HTTP_200_OK
+        assert [row['id'] for row in response.data['results']] == [newest.id]
+
+    def test_write_changes_etag(self, api_client, product, django_capture_on_commit_callbacks):
+        url = reverse('Products-list')
+        etag = api_client.get(url)['ETag']
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.patch(reverse('Products-detail', args=[product.id]), {'price': 1}, format='json')
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    def test_missing_product_is_not_found(self, api_client):
+        response = api_client.get(reverse('Products-detail', args=[999]))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestProductExport:
+    @pytest.fixture
+    def catalog(self, product_type):
+        other_type = models.ProductType.objects.create(name='Furniture')
+        return models.Product.objects.bulk_create([
+            models.Product(name='Phone', description='Says "hi", loudly', type=product_type, price=300, ammount=5),
+            models.Product(name='Chair', type=other_type, price=150, ammount=3),
+        ])
+
+    def test_export_ndjson_streams_rows(self, api_client, catalog):
+        response = api_client.get(reverse('Products-export'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        assert response['Content-Type'] == 'application/x-ndjson'
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        assert rows == api_client.get(reverse('Products-list')).json()['results']
+
+    def test_export_csv_filtered_by_type(self, api_client, catalog, product_type):
+        response = api_client.get(reverse('Products-export'), {'export_format': 'csv', 'type': product_type.id})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        assert [row['name'] for row in rows] == ['Phone']
+        assert rows[0]['description'] == 'Says "hi", loudly'
+
+    def test_export_gzip(self, api_client, catalog):
+        response = api_client.get(reverse('Products-export'), {'gzip': '1'})
+        assert response['Content-Encoding'] == 'gzip'
+        body = gzip.decompress(b''.join(response.streaming_content))
+        assert len(body.splitlines()) == 2
+
+    def test_export_rejects_unknown_format(self, api_client):
+        response = api_client.get(reverse('Products-export'), {'export_format': 'xml'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestCatalogChanges:
+    def feed(self, api_client, **params):
+        response = api_client.get(reverse('Products-changes'), params)
+        assert response.status_code == status.HTTP_200_OK, response.data
+        return response.data
+
+    def test_writes_are_logged_with_current_data_and_tombstones(self, api_client, product_type):
+        since = self.feed(api_client)['next_since']
+        product = api_client.post(reverse('Products-list'), {'name': 'Desk', 'description': '', 'type': product_type.id,
+                                                             'price': 5, 'ammount': 1}, format='json').data
+        api_client.patch(reverse('Products-detail', args=[product['id']]), {'price': 7}, format='json')
+        page = self.feed(api_client, since=since)
+        assert [(change['op'], change['object_id']) for change in page['results']] == [
+            ('create', product['id']), ('update', product['id'])]
+        assert page['results'][1]['data'] == {**product, 'price': 7}
+
+        api_client.delete(reverse('ProductTypes-detail', args=[product_type.id]))
+        page = self.feed(api_client, since=page['next_since'])
+        assert [(change['kind'], change['op'], change['data']) for change in page['results']] == [
+            ('product', 'delete', None), ('product_type', 'delete', None)]
+
+    def test_bulk_and_stock_writes_are_logged(self, api_client, cart, cart_item, product):
+        since = self.feed(api_client)['next_since']
+        models.Product.objects.bulk_create([models.Product(id=product.id, name='Laptop 2', type=product.type,
+                                                           price=1, ammount=10)],
+                                           update_conflicts=True, unique_fields=['id'], update_fields=['name'])
+        api_client.post(reverse('Cart-checkout', args=[cart.id]))
+        page = self.feed(api_client, since=since)
+        assert [change['op'] for change in page['results']] == ['update', 'update']
+        assert page['results'][-1]['data']['ammount'] == 9
+
+    def test_pages_are_bounded(self, api_client, product_type):
+        since = self.feed(api_client)['next_since']
+        models.Product.objects.bulk_create(
+            models.Product(name=f'Item {i}', type=product_type, price=i, ammount=1) for i in range(5))
+        first = self.feed(api_client, since=since, limit=3)
+        assert len(first['results']) == 3 and first['has_more']
+        second = self.feed(api_client, since=first['next_since'], limit=3)
+        assert len(second['results']) == 2 and not second['has_more']
+
+    def test_compaction_forces_resync(self, api_client, product_type):
+        since = self.feed(api_client)['next_since']
+        models.Product.objects.create(name='Old', type=product_type, price=1, ammount=1)
+        out = io.StringIO()
+        call_command('compact_catalog_changes', '--days', '0', stdout=out)
+        assert 'Removed' in out.getvalue()
+        response = api_client.get(reverse('Products-changes'), {'since': since})
+        assert response.status_code == status.HTTP_410_GONE
+        compacted = response.data['compacted_through']
+        models.Product.objects.create(name='New', type=product_type, price=1, ammount=1)
+        assert [change['op'] for change in self.feed(api_client, since=compacted)['results']] == ['create']
+
+    def test_invalid_since(self, api_client):
+        response = api_client.get(reverse('Products-changes'), {'since': 'yesterday'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestProductImport:
+    def test_import_command_reports_bad_rows(self, product_type, tmp_path, capsys):
+        path = tmp_path / 'feed.csv'
+        path.write_text(
+            'name,description,type,price,ammount\n'
+            f'Phone,Smart phone,{product_type.id},300,4\n'
+            f'Broken,,{product_type.id},-1,4\n'
+            f'Orphan,,999,10,1\n'
+        )
+        call_command('import_products', str(path), batch_size=2)
+        assert list(models.Product.objects.values_list('name', flat=True)) == ['Phone']
+        captured = capsys.readouterr()
+        assert 'Imported 1 products, 2 rows failed.' in captured.out
+        assert 'Price cannot be negative!' in captured.err
+
+    def test_import_jsonl_upserts_existing_rows(self, product):
+        rows = [
+            {'id': product.id, 'name': 'Laptop Pro', 'description': '', 'type': product.type_id, 'price': 1500, 'ammount': 3},
+            {'name': 'Mouse', 'type': product.type_id, 'price': 20, 'ammount': 100},
+            {'name': 'x' * 129, 'type': product.type_id, 'price': 1, 'ammount': 1},
+        ]
+        stream = io.StringIO('\n'.join(json.dumps(row) for row in rows) + '\nnot json\n')
+        report = import_products(stream, 'jsonl', batch_size=2)
+        assert report['imported'] == 2
+        assert [error['line'] for error in report['errors']] == [3, 4]
+        assert 'Product name is too long!' in report['errors'][0]['errors']['name']
+        product.refresh_from_db()
+        assert product.name == 'Laptop Pro'
+        assert models.Product.objects.count() == 2
+
+    def test_import_rejects_values_the_serializer_would(self, product_type):
+        rows = [
+            {'name': ['a'], 'type': product_type.id, 'price': 1, 'ammount': 1},
+            {'name': 'Half', 'type': product_type.id, 'price': 1.5, 'ammount': 1},
+            {'name': 'Flag', 'type': True, 'price': 1, 'ammount': False},
+            {'name': 'Whole', 'type': str(product_type.id), 'price': 2.0, 'ammount': '3'},
+        ]
+        report = import_products(io.StringIO('\n'.join(json.dumps(row) for row in rows)), 'jsonl')
+        assert report['imported'] == 1
+        assert [sorted(error['errors']) for error in report['errors']] == [['name'], ['price'], ['ammount', 'type']]
+        assert models.Product.objects.values_list('name', 'price', 'ammount').get() == ('Whole', 2, 3)
+
+    def test_invalid_utf8_is_reported_per_row(self, api_client, customer_user, product_type, tmp_path, capsys):
+        content = (f'name,type,price,ammount\nChair,{product_type.id},50,2\n'.encode()
+                   + f'Caf\xe9,{product_type.id},5,1\n'.encode('latin-1')
+                   + f'Desk,{product_type.id},80,1\n'.encode())
+        customer_user.is_staff = True
+        customer_user.save()
+        response = api_client.post(reverse('Products-bulk-import'),
+                               {'file': SimpleUploadedFile('feed.csv', content)}, format='multipart')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'imported': 2, 'failed': 1,
+                                 'errors': [{'line': 3, 'errors': {'row': ['Row is not valid UTF-8.']}}]}
+
+        path = tmp_path / 'feed.jsonl'
+        path.write_bytes(b'{"name": "Caf\xe9"}\n')
+        call_command('import_products', str(path))
+        assert 'Row is not valid UTF-8.' in capsys.readouterr().err
+
+    def test_import_keeps_a_bounded_error_list(self, product_type):
+        stream = io.StringIO(''.join(f'{{"name": "Bad {i}", "type": 999}}\n' for i in range(10)))
+        streamed = []
+        report = import_products(stream, 'jsonl', batch_size=4, max_errors=3, on_error=streamed.append)
+        assert report['failed'] == 10
+        assert [error['line'] for error in report['errors']] == [1, 2, 3]
+        assert len(streamed) == 10
+
+    def test_import_endpoint_is_staff_only(self, api_client, customer_user, product_type):
+        url = reverse('Products-bulk-import')
+        upload = SimpleUploadedFile('feed.csv', f'name,type,price,ammount\nChair,{product_type.id},50,2\n'.encode())
+        response = api_client.post(url, {'file': upload}, format='multipart')
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+        customer_user.is_staff = True
+        customer_user.save()
+        upload.seek(0)
+        response = api_client.post(url, {'file': upload}, format='multipart')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'imported': 1, 'failed': 0, 'errors': []}
+        assert models.Product.objects.get().name == 'Chair'
+
+
+@pytest.mark.django_db
+class TestCatalogSnapshots:
+    @pytest.fixture(autouse=True)
+    def snapshot_settings(self, settings, tmp_path):
+        settings.CATALOG_SNAPSHOTS = {'ROOT': tmp_path, 'BASE_URL': 'http://testserver', 'REBUILD_ON_WRITE': False}
+        return settings.CATALOG_SNAPSHOTS
+
+    @pytest.fixture
+    def catalog(self, product_type):
+        other_type = models.ProductType.objects.create(name='Furniture')
+        models.Product.objects.bulk_create(
+            models.Product(name=f'Item {i}', type=product_type if i % 2 else other_type, price=i, ammount=1)
+            for i in range(130))
+        return product_type
+
+    def test_pages_match_live_listing(self, api_client, catalog):
+        built = build_snapshots()
+        assert built[catalog.id] == 2
+        url = reverse('ProductSnapshots') + f'?type={catalog.id}'
+        ids = []
+        while url:
+            response = api_client.get(url)
+            assert response['X-Catalog-Snapshot'] == 'hit'
+            live = api_client.get(url.replace(reverse('ProductSnapshots'), reverse('Products-list')))
+            assert json.loads(response.content)['results'] == live.data['results']
+            ids.extend(item['id'] for item in json.loads(response.content)['results'])
+            url = json.loads(response.content)['next']
+        assert ids == list(models.Product.objects.filter(type=catalog).order_by('id').values_list('id', flat=True))
+
+    def test_hit_does_no_queries_and_serves_gzip(self, api_client, catalog, django_assert_num_queries):
+        build_snapshots()
+        url = reverse('ProductSnapshots')
+        plain = api_client.get(url, {'type': catalog.id})
+        with django_assert_num_queries(0):
+            response = api_client.get(url, {'type': catalog.id}, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        assert response['Content-Encoding'] == 'gzip'
+        assert response['Vary'] == 'Accept-Encoding'
+        assert gzip.decompress(response.content) == plain.content
+
+    def test_etag_revalidation(self, api_client, catalog):
+        build_snapshots()
+        url = reverse('ProductSnapshots')
+        etag = api_client.get(url, {'type': catalog.id})['ETag']
+        response = api_client.get(url, {'type': catalog.id}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_write_marks_snapshot_stale(self, api_client, catalog, django_capture_on_commit_callbacks):
+        build_snapshots()
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(reverse('Products-list'), {'name': 'Fresh', 'description': '', 'type': catalog.id,
+                                                                  'price': 1, 'ammount': 1}, format='json')
+        response = api_client.get(reverse('ProductSnapshots'), {'type': catalog.id})
+        assert response['X-Catalog-Snapshot'] == 'miss'
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_write_schedules_one_rebuild_of_changed_types(self, api_client, catalog, snapshot_settings,
+                                                          django_capture_on_commit_callbacks, monkeypatch):
+        snapshot_settings['REBUILD_ON_WRITE'] = True
+        build_snapshots()
+        other = models.ProductType.objects.get(name='Furniture')
+        other_build = read_manifest(other.id)['build']
+        scheduled = []
+        monkeypatch.setattr(snapshot_rebuilder, 'schedule', lambda: scheduled.append(True))
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.patch(reverse('Products-detail', args=[catalog.product_set.earliest('id').id]),
+                             {'name': 'Renamed'}, format='json')
+        assert scheduled == [True]
+        assert set(rebuild_changed_snapshots()) == {catalog.id}
+        response = api_client.get(reverse('ProductSnapshots'), {'type': catalog.id})
+        assert response['X-Catalog-Snapshot'] == 'hit'
+        assert json.loads(response.content)['results'][0]['name'] == 'Renamed'
+        assert api_client.get(reverse('ProductSnapshots'), {'type': other.id})['X-Catalog-Snapshot'] == 'hit'
+        assert read_manifest(other.id)['build'] == other_build
+
+    def test_moves_and_deletes_rebuild_the_old_type(self, api_client, catalog):
+        build_snapshots()
+        other = models.ProductType.objects.get(name='Furniture')
+        moved, deleted = catalog.product_set.order_by('id')[:2]
+        models.Product.objects.filter(pk=moved.pk).update(type=other)
+        assert set(rebuild_changed_snapshots()) == {catalog.id, other.id}
+        third = models.ProductType.objects.create(name='Garden')
+        assert set(rebuild_changed_snapshots()) == {third.id}
+        deleted.delete()
+        assert set(rebuild_changed_snapshots()) == {catalog.id}
+        assert rebuild_changed_snapshots() == {}
+
+    def test_rebuilds_are_debounced(self, snapshot_settings):
+        snapshot_settings['REBUILD_DELAY'] = 60
+        rebuilder = SnapshotRebuilder()
+        try:
+            rebuilder.schedule()
+            timer = rebuilder._timer
+            rebuilder.schedule()
+            assert rebuilder._timer is timer
+        finally:
+            assert rebuilder.cancel()
+        assert not rebuilder.cancel()
+
+    def test_other_params_fall_back_to_live(self, api_client, catalog):
+        build_snapshots()
+        response = api_client.get(reverse('ProductSnapshots'), {'type': catalog.id, 'ordering': '-price'})
+        assert response['X-Catalog-Snapshot'] == 'miss'
+        assert response.data['results'][0]['price'] == 129
+
+
+@pytest.mark.django_db
+class TestProductSearch:
+    @pytest.fixture
+    def catalog(self, product_type):
+        return models.Product.objects.bulk_create([
+            models.Product(name='Wireless mouse', description='Ergonomic wireless mouse', type=product_type, price=20, ammount=5),
+            models.Product(name='USB cable', description='Braided cable for a wireless charger', type=product_type, price=5, ammount=5),
+            models.Product(name='Desk lamp', description='Warm light', type=product_type, price=30, ammount=5),
+        ])
+
+    def test_search_ranks_matches(self, api_client, catalog):
+        response = api_client.get(reverse('Products-search'), {'q': 'wireless'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 2
+        assert [item['name'] for item in response.data['results']] == ['Wireless mouse', 'USB cable']
+
+    def test_search_prefix_for_autocomplete(self, api_client, catalog):
+        response = api_client.get(reverse('Products-search'), {'q': 'desk la'})
+        assert [item['name'] for item in response.data['results']] == ['Desk lamp']
+
+    def test_search_is_paginated(self, api_client, catalog):
+        response = api_client.get(reverse('Products-search'), {'q': 'wireless', 'page_size': 1})
+        assert len(response.data['results']) == 1
+        assert response.data['next'] is not None
+
+    def test_search_index_follows_writes(self, api_client, catalog):
+        lamp = models.Product.objects.get(name='Desk lamp')
+        lamp.name = 'Wireless lamp'
+        lamp.save()
+        models.Product.objects.filter(name='USB cable').delete()
+        response = api_client.get(reverse('Products-search'), {'q': 'wireless'})
+        assert {item['name'] for item in response.data['results']} == {'Wireless mouse', 'Wireless lamp'}
+
+    def test_search_ignores_fts_syntax(self, api_client, catalog):
+        response = api_client.get(reverse('Products-search'), {'q': 'mouse" OR NEAR('})
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_search_requires_query(self, api_client):
+        response = api_client.get(reverse('Products-search'), {'q': '  '})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
 
 @pytest.mark.django_db
 class TestCartViewSet:
@@ -163,6 +868,433 @@ class TestCartViewSet:
         assert response.status_code == status.HTTP_204_NO_CONTENT
         assert models.Cart.objects.count() == 0
 
+    def test_cart_details_nests_items_and_totals(self, api_client, cart, cart_item, product_type):
+        mouse = models.Product.objects.create(name='Mouse', type=product_type, price=25, ammount=10)
+        models.CartItem.objects.create(cart=cart, product=mouse, ammount=4)
+        refresh_cart_totals(models.Cart.objects.filter(pk=cart.pk))
+        response = api_client.get(reverse('Cart-details', args=[cart.id]))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['item_count'] == 5
+        assert response.data['total'] == 1000 + 4 * 25
+        assert [item['product_name'] for item in response.data['items']] == ['Laptop', 'Mouse']
+        assert response.data['items'][1]['line_total'] == 100
+
+    def test_cart_details_empty_cart(self, api_client, cart):
+        response = api_client.get(reverse('Cart-details', args=[cart.id]))
+        assert response.data['items'] == []
+        assert response.data['total'] == 0
+
+    @pytest.mark.parametrize('item_count', [1, 25])
+    def test_cart_details_query_count_is_constant(self, api_client, cart, product_type, item_count,
+                                                   django_assert_num_queries):
+        products = models.Product.objects.bulk_create([
+            models.Product(name=f'Product {i}', type=product_type, price=i, ammount=10) for i in range(item_count)
+        ])
+        models.CartItem.objects.bulk_create([
+            models.CartItem(cart=cart, product=product, ammount=1) for product in products
+        ])
+        with django_assert_num_queries(2):
+            response = api_client.get(reverse('Cart-details', args=[cart.id]))
+        assert len(response.data['items']) == item_count
+
+    def test_batch_applies_all_operations(self, api_client, cart, cart_item, product, product_type):
+        mouse = models.Product.objects.create(name='Mouse', type=product_type, price=25, ammount=10)
+        removed = models.CartItem.objects.create(cart=cart, product=mouse, ammount=1)
+        refresh_cart_totals(models.Cart.objects.filter(pk=cart.pk))
+        data = {'operations': [
+            {'op': 'add', 'product': mouse.id, 'ammount': 2},
+            {'op': 'update', 'item': cart_item.id, 'ammount': 3},
+            {'op': 'remove', 'item': removed.id},
+        ]}
+        response = api_client.post(reverse('Cart-batch', args=[cart.id]), data, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['total'] == 3 * 1000 + 2 * 25
+        assert sorted(models.CartItem.objects.values_list('product__name', 'ammount')) == [('Laptop', 3), ('Mouse', 2)]
+
+    def test_batch_is_all_or_nothing(self, api_client, cart, cart_item, product):
+        data = {'operations': [
+            {'op': 'update', 'item': cart_item.id, 'ammount': 7},
+            {'op': 'add', 'product': 999, 'ammount': 1},
+        ]}
+        response = api_client.post(reverse('Cart-batch', args=[cart.id]), data, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 1 in response.data['operations']
+        cart_item.refresh_from_db()
+        assert cart_item.ammount == 1
+
+    def test_batch_rejects_other_users_cart(self, api_client, product):
+        other = models.CustomerUser.objects.create_user(username='other', password='otherpassword')
+        other_cart = models.Cart.objects.create(user=other)
+        api_client.force_authenticate(user=models.CustomerUser.objects.create_user(username='me', password='x'))
+        data = {'operations': [{'op': 'add', 'product': product.id, 'ammount': 1}]}
+        response = api_client.post(reverse('Cart-batch', args=[other_cart.id]), data, format='json')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert models.CartItem.objects.count() == 0
+
+
+@pytest.mark.django_db
+class TestCheckout:
+    def test_checkout_creates_order_and_takes_stock(self, api_client, cart, cart_item, product):
+        response = api_client.post(reverse('Cart-checkout', args=[cart.id]))
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['total'] == 1000
+        assert response.data['lines'][0]['name'] == 'Laptop'
+        product.refresh_from_db()
+        assert product.ammount == 9
+        assert models.CartItem.objects.count() == 0
+
+    def test_checkout_insufficient_stock_rolls_back(self, api_client, cart, product, product_type):
+        mouse = models.Product.objects.create(name='Mouse', type=product_type, price=25, ammount=10)
+        models.CartItem.objects.create(cart=cart, product=mouse, ammount=2)
+        models.CartItem.objects.create(cart=cart, product=product, ammount=11)
+        response = api_client.post(reverse('Cart-checkout', args=[cart.id]))
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['product'] == str(product.id)
+        mouse.refresh_from_db()
+        assert mouse.ammount == 10
+        assert models.Order.objects.count() == 0
+        assert models.CartItem.objects.count() == 2
+
+    def test_checkout_empty_cart(self, api_client, cart):
+        response = api_client.post(reverse('Cart-checkout', args=[cart.id]))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_checkouts_never_oversell(product_type):
+    stock, buyers = 10, 24
+    product = models.Product.objects.create(name='Console', type=product_type, price=400, ammount=stock)
+    carts = []
+    for i in range(buyers):
+        buyer = models.CustomerUser.objects.create(username=f'buyer{i}')
+        cart = models.Cart.objects.create(user=buyer)
+        models.CartItem.objects.create(cart=cart, product=product, ammount=1)
+        carts.append(cart)
+
+    barrier = threading.Barrier(buyers)
+    outcomes = []
+
+    def buy(cart):
+        try:
+            barrier.wait()
+            checkout_cart(cart)
+            outcomes.append('ok')
+        except InsufficientStock:
+            outcomes.append('short')
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    product.refresh_from_db()
+    assert outcomes.count('ok') == stock
+    assert outcomes.count('short') == buyers - stock
+    assert product.ammount == 0
+    assert models.OrderLine.objects.filter(product=product).count() == stock
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bench_async_runs_without_the_catalog_cache():
+    out = io.StringIO()
+    call_command('bench_async', rows=20, requests=20, concurrency=4, stdout=out)
+    assert out.getvalue().count('throughput=') == 2
+    assert catalog_cache_stats.snapshot()['hits'] == 0
+    assert not models.Product.objects.exists()
+    assert not models.CatalogChange.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bench_checkout_reports_throughput():
+    out = io.StringIO()
+    call_command('bench_checkout', buyers=24, products=2, stock=5, threads=8, stdout=out)
+    throughput = float(out.getvalue().split('throughput=')[1].split()[0])
+    assert throughput > 0
+    assert 'ok=10 short=14' in out.getvalue()
+    assert not models.CustomerUser.objects.exists()
+    assert not models.Product.objects.exists()
+    def test_adding_same_product_increments_line(self, api_client, cart, product):
+        url = reverse('CartItems-list')
+        first = api_client.post(url, {'cart': cart.id, 'product': product.id, 'ammount': 2}, format='json')
+        second = api_client.post(url, {'cart': cart.id, 'product': product.id, 'ammount': 3}, format='json')
+        assert second.status_code == status.HTTP_201_CREATED
+        assert second.data == {'id': first.data['id'], 'product': product.id, 'ammount': 5, 'cart': cart.id}
+        assert models.CartItem.objects.count() == 1
+        assert api_client.get(reverse('Cart-badge', args=[cart.id])).data['total'] == 5000
+
+    def test_moving_line_onto_existing_product_is_rejected(self, api_client, cart, cart_item, product_type):
+        mouse = models.Product.objects.create(name='Mouse', type=product_type, price=25, ammount=10)
+        other = api_client.post(reverse('CartItems-list'), {'cart': cart.id, 'product': mouse.id, 'ammount': 1},
+                                format='json').data
+        response = api_client.patch(reverse('CartItems-detail', args=[other['id']]), {'product': cart_item.product_id},
+                                    format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_batch_add_merges_into_existing_line(self, api_client, cart, cart_item, product):
+        data = {'operations': [{'op': 'add', 'product': product.id, 'ammount': 2},
+                               {'op': 'add', 'product': product.id, 'ammount': 1}]}
+        response = api_client.post(reverse('Cart-batch', args=[cart.id]), data, format='json')
+        assert [(item['id'], item['ammount']) for item in response.data['items']] == [(cart_item.id, 4)]
+        assert response.data['total'] == 4000
+
+
+@pytest.mark.django_db
+class TestCartTotals:
+    def badge(self, api_client, cart):
+        return api_client.get(reverse('Cart-badge', args=[cart.id])).data
+
+    def test_item_writes_maintain_totals(self, api_client, cart, product):
+        url = reverse('CartItems-list')
+        item = api_client.post(url, {'cart': cart.id, 'product': product.id, 'ammount': 2}, format='json').data
+        assert self.badge(api_client, cart) == {'id': cart.id, 'item_count': 2, 'total': 2000}
+        api_client.patch(reverse('CartItems-detail', args=[item['id']]), {'ammount': 5}, format='json')
+        assert self.badge(api_client, cart)['total'] == 5000
+        api_client.delete(reverse('CartItems-detail', args=[item['id']]))
+        assert self.badge(api_client, cart) == {'id': cart.id, 'item_count': 0, 'total': 0}
+
+    def test_totals_cannot_overflow(self, api_client, cart, cart_item, product):
+        models.Product.objects.filter(pk=product.pk).update(price=10**9)
+        models.Cart.objects.filter(pk=cart.pk).update(total=10**9)
+        url = reverse('CartItems-list')
+        response = api_client.post(url, {'cart': cart.id, 'product': product.id, 'ammount': 2}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'cart' in response.data
+        response = api_client.post(url, {'cart': cart.id, 'product': product.id, 'ammount': 10**20}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = api_client.patch(reverse('CartItems-detail', args=[cart_item.id]), {'ammount': 10**8},
+                                    format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = api_client.post(reverse('Cart-batch', args=[cart.id]),
+                                   {'operations': [{'op': 'add', 'product': product.id, 'ammount': 3}]}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        cart_item.refresh_from_db()
+        assert cart_item.ammount == 1
+        assert self.badge(api_client, cart) == {'id': cart.id, 'item_count': 1, 'total': 10**9}
+
+    def test_badge_is_a_single_query(self, api_client, cart, cart_item, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            assert self.badge(api_client, cart)['item_count'] == 1
+
+    def test_price_change_and_product_delete(self, api_client, cart, cart_item, product, product_type):
+        api_client.patch(reverse('Products-detail', args=[product.id]), {'price': 800}, format='json')
+        assert self.badge(api_client, cart)['total'] == 800
+        api_client.delete(reverse('Products-detail', args=[product.id]))
+        assert self.badge(api_client, cart) == {'id': cart.id, 'item_count': 0, 'total': 0}
+
+    def test_price_change_after_validation_does_not_drift(self, api_client, cart, cart_item, product, monkeypatch):
+        import backend.views as views
+
+        def add_after_price_change(cart_id, quantities):
+            # a price change that commits after the serializer read the product
+            with cart_totals_refreshed(models.CartItem.objects.filter(product=product)):
+                models.Product.objects.filter(pk=product.pk).update(price=2000)
+            return add_cart_items(cart_id, quantities)
+
+        monkeypatch.setattr(views, 'add_cart_items', add_after_price_change)
+        api_client.post(reverse('CartItems-list'), {'cart': cart.id, 'product': product.id, 'ammount': 2},
+                        format='json')
+        assert self.badge(api_client, cart) == {'id': cart.id, 'item_count': 3, 'total': 6000}
+        assert reconcile_cart_totals(fix=False)['drifted'] == []
+
+    def concurrent_add(self, cart, product, ammount):
+        # an add to the same line that commits after the request read it
+        add_cart_items(cart.id, {product.id: ammount})
+        adjust_cart_totals(cart.id, {product.id: ammount})
+
+    def test_update_interleaved_with_an_add_does_not_drift(self, api_client, cart, cart_item, product, monkeypatch):
+        import backend.views as views
+
+        def lock_after_add(item_ids):
+            self.concurrent_add(cart, product, 2)
+            return lock_cart_items(item_ids)
+
+        monkeypatch.setattr(views, 'lock_cart_items', lock_after_add)
+        api_client.patch(reverse('CartItems-detail', args=[cart_item.id]), {'ammount': 5}, format='json')
+        assert self.badge(api_client, cart) == {'id': cart.id, 'item_count': 5, 'total': 5000}
+        assert reconcile_cart_totals(fix=False)['drifted'] == []
+
+    def test_destroy_interleaved_with_an_add_does_not_drift(self, api_client, cart, cart_item, product, monkeypatch):
+        import backend.views as views
+
+        def delete_after_add(item_ids):
+            self.concurrent_add(cart, product, 2)
+            return delete_cart_items(item_ids)
+
+        monkeypatch.setattr(views, 'delete_cart_items', delete_after_add)
+        api_client.delete(reverse('CartItems-detail', args=[cart_item.id]))
+        assert self.badge(api_client, cart) == {'id': cart.id, 'item_count': 0, 'total': 0}
+        assert reconcile_cart_totals(fix=False)['drifted'] == []
+
+    def test_batch_interleaved_with_an_add_does_not_drift(self, api_client, cart, cart_item, product, monkeypatch):
+        import backend.carts as carts
+
+        def lock_after_add(item_ids):
+            self.concurrent_add(cart, product, 2)
+            return lock_cart_items(item_ids)
+
+        monkeypatch.setattr(carts, 'lock_cart_items', lock_after_add)
+        api_client.post(reverse('Cart-batch', args=[cart.id]), {'operations': [
+            {'op': 'update', 'item': cart_item.id, 'ammount': 4}]}, format='json')
+        assert self.badge(api_client, cart) == {'id': cart.id, 'item_count': 4, 'total': 4000}
+        assert reconcile_cart_totals(fix=False)['drifted'] == []
+
+    def test_checkout_and_guest_merge(self, api_client, cart, cart_item, customer_user):
+        api_client.post(reverse('Cart-checkout', args=[cart.id]))
+        assert self.badge(api_client, cart)['item_count'] == 0
+        guest_cart = GuestCart(items={cart_item.product_id: 3})
+        assert merge_guest_cart(guest_cart, customer_user) == cart
+        assert self.badge(api_client, cart) == {'id': cart.id, 'item_count': 3, 'total': 3000}
+
+    def test_reconcile_reports_and_fixes_drift(self, cart, cart_item, customer_user):
+        other = models.Cart.objects.create(user=customer_user)
+        models.Cart.objects.filter(pk=cart.pk).update(total=1)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('reconcile_cart_totals', '--dry-run', '--batch-size', '1', stdout=out, stderr=err)
+        assert 'Checked 2 carts, found drift in 1.' in out.getvalue()
+        assert json.loads(err.getvalue()) == {'cart': cart.id, 'item_count': 1, 'total': 1,
+                                              'expected_item_count': 1, 'expected_total': 1000}
+        call_command('reconcile_cart_totals', stdout=out, stderr=err)
+        assert models.Cart.objects.get(pk=cart.pk).total == 1000
+        assert models.Cart.objects.get(pk=other.pk).total == 0
+
+
+@pytest.mark.django_db
+class TestGuestCart:
+    def test_guest_cart_writes_nothing_to_the_database(self, api_client, product):
+        url = reverse('GuestCart-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.post(url, {'product': product.id, 'ammount': 2}, format='json')
+            assert response.status_code == status.HTTP_201_CREATED
+            api_client.post(url, {'product': product.id, 'ammount': 1}, format='json')
+            api_client.put(reverse('GuestCart-detail', args=[product.id]), {'ammount': 3}, format='json')
+            response = api_client.get(url)
+        assert response.data == {'items': [{'product': product.id, 'ammount': 3}], 'item_count': 3}
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        assert writes == []
+        assert not models.Cart.objects.exists()
+
+    def test_cache_storage_keeps_a_token_in_the_cookie(self, api_client, product, settings):
+        settings.GUEST_CARTS = {'CACHE': 'default'}
+        api_client.post(reverse('GuestCart-list'), {'product': product.id, 'ammount': 2}, format='json')
+        request = RequestFactory().get('/')
+        request.COOKIES['guest_cart'] = api_client.cookies['guest_cart'].value
+        token = GuestCart.token_from_request(request)
+        assert caches['default'].get(GuestCart.cache_key(token)) == {product.id: 2}
+        assert api_client.get(reverse('GuestCart-list')).data['item_count'] == 2
+
+    def test_concurrent_adds_are_not_lost(self, product, settings):
+        settings.GUEST_CARTS = {'CACHE': 'default'}  # threads in this process share a LocMemCache
+        response = HttpResponse()
+        GuestCart(items={product.id: 0}).save(response)
+        request = RequestFactory().get('/')
+        request.COOKIES['guest_cart'] = response.cookies['guest_cart'].value
+
+        def add():
+            with GuestCart.for_update(request) as guest_cart:
+                guest_cart.add(product.id, 1)
+                guest_cart.save(HttpResponse())
+
+        threads = [threading.Thread(target=add) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert GuestCart.from_request(request).items == {product.id: 20}
+
+    def test_locked_cart_returns_conflict(self, api_client, product, settings):
+        settings.GUEST_CARTS = {'CACHE': 'default'}
+        api_client.post(reverse('GuestCart-list'), {'product': product.id, 'ammount': 1}, format='json')
+        settings.GUEST_CARTS = {'CACHE': 'default', 'LOCK_WAIT': 0}
+        request = RequestFactory().get('/')
+        request.COOKIES['guest_cart'] = api_client.cookies['guest_cart'].value
+        token = GuestCart.token_from_request(request)
+        with cache_lock(GuestCart.cache(), GuestCart.cache_key(token) + ':lock', timeout=5):
+            response = api_client.post(reverse('GuestCart-list'), {'product': product.id, 'ammount': 1}, format='json')
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert api_client.get(reverse('GuestCart-list')).data['item_count'] == 1
+
+    def test_per_process_or_database_cache_fails_the_system_check(self, settings):
+        assert check_guest_cart_cache(None) == []
+        settings.GUEST_CARTS = {'CACHE': 'default'}
+        assert [error.id for error in check_guest_cart_cache(None)] == ['backend.E001']
+        settings.CACHES = {**settings.CACHES, 'guest_carts': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'backend_guest_carts'}}
+        settings.GUEST_CARTS = {'CACHE': 'guest_carts'}
+        assert [error.id for error in check_guest_cart_cache(None)] == ['backend.E001']
+
+    def test_update_and_remove(self, api_client, product):
+        api_client.post(reverse('GuestCart-list'), {'product': product.id, 'ammount': 2}, format='json')
+        url = reverse('GuestCart-detail', args=[product.id])
+        assert api_client.put(url, {'ammount': 5}, format='json').data['item_count'] == 5
+        assert api_client.delete(url).data['items'] == []
+        assert api_client.delete(url).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_quantity_is_capped(self, api_client, product, settings):
+        settings.GUEST_CARTS = {'MAX_QUANTITY': 10}
+        url = reverse('GuestCart-list')
+        assert api_client.post(url, {'product': product.id, 'ammount': 10**20}, format='json').status_code == 400
+        assert api_client.post(url, {'product': product.id, 'ammount': 6}, format='json').status_code == 201
+        assert api_client.post(url, {'product': product.id, 'ammount': 6}, format='json').status_code == 400
+        detail = reverse('GuestCart-detail', args=[product.id])
+        assert api_client.put(detail, {'ammount': 11}, format='json').status_code == 400
+        assert api_client.get(url).data['item_count'] == 6
+
+    def test_oversized_guest_cart_does_not_block_login(self, api_client, product, settings, monkeypatch):
+        import backend.views as views
+
+        user = models.CustomerUser.objects.create_user(username='shopper', password='shopperpassword')
+        response = HttpResponse()
+        GuestCart(items={product.id: 10**20}).save(response)  # saved before MAX_QUANTITY existed
+        api_client.cookies['guest_cart'] = response.cookies['guest_cart'].value
+        credentials = {'username': 'shopper', 'password': 'shopperpassword'}
+
+        response = api_client.post(reverse('User-login'), credentials, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        cart = models.Cart.objects.get(user=user)
+        assert list(cart.cartitem_set.values_list('product_id', 'ammount')) == [(product.id, 1000)]
+
+        def fail(guest_cart, user):
+            raise OverflowError('Python int too large to convert to SQLite INTEGER')
+
+        monkeypatch.setattr(views, 'merge_guest_cart', fail)
+        api_client.post(reverse('GuestCart-list'), {'product': product.id, 'ammount': 1}, format='json')
+        response = api_client.post(reverse('User-login'), credentials, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.cookies['guest_cart'].value == ''
+
+    def test_tampered_cookie_starts_an_empty_cart(self, api_client, product):
+        api_client.post(reverse('GuestCart-list'), {'product': product.id, 'ammount': 2}, format='json')
+        api_client.cookies['guest_cart'] = api_client.cookies['guest_cart'].value + 'x'
+        assert api_client.get(reverse('GuestCart-list')).data['items'] == []
+
+    def test_login_merges_into_existing_cart(self, api_client, product, product_type):
+        user = models.CustomerUser.objects.create_user(username='shopper', password='shopperpassword')
+        cart = models.Cart.objects.create(user=user)
+        models.CartItem.objects.create(cart=cart, product=product, ammount=1)
+        other = models.Product.objects.create(name='Mouse', description='', type=product_type, price=20, ammount=5)
+        api_client.post(reverse('GuestCart-list'), {'product': product.id, 'ammount': 2}, format='json')
+        api_client.post(reverse('GuestCart-list'), {'product': other.id, 'ammount': 1}, format='json')
+
+        response = api_client.post(reverse('User-login'), {'username': 'shopper', 'password': 'shopperpassword'},
+                                   format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.cookies['guest_cart'].value == ''
+        assert dict(cart.cartitem_set.values_list('product_id', 'ammount')) == {product.id: 3, other.id: 1}
+        assert api_client.get(reverse('GuestCart-list')).data['items'] == []
+
+    def test_register_creates_cart_from_guest_cart(self, api_client, product):
+        api_client.post(reverse('GuestCart-list'), {'product': product.id, 'ammount': 2}, format='json')
+        response = api_client.post(reverse('User-register'), {
+            'username': 'newshopper', 'email': 'new@example.com', 'password': 'newshopperpassword',
+            'first_name': 'New', 'last_name': 'Shopper'}, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        cart = models.Cart.objects.get(user__username='newshopper')
+        assert list(cart.cartitem_set.values_list('product_id', 'ammount')) == [(product.id, 2)]
+
 
 @pytest.mark.django_db
 class TestCartItemViewSet:  
@@ -294,4 +1426,519 @@ class TestUserViewSetAuth:
 
         response_data = response.json()
         assert 'token' in response_data
-        assert response_data['user']['username'] == customer_user.username
\ No newline at end of file
+        assert response_data['user']['username'] == customer_user.username
+
+
+REPLICA_ALIAS = 'replica_1'
+
+
+@pytest.fixture(scope='session')
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix, tmp_path_factory):
+    """
+    Adds a replica database backed by its own SQLite file, so routing tests see real
+    replica/primary divergence. It is only read from when a test lists it in REPLICA_DATABASES.
+    """
+    from django.conf import settings
+    directory = tmp_path_factory.mktemp('replica')
+    settings.DATABASES[REPLICA_ALIAS] = sqlite_database(
+        directory / 'replica.sqlite3', test_name=directory / 'test_replica.sqlite3')
+    connections.configure_settings(settings.DATABASES)
+
+
+@pytest.fixture
+def replica(settings):
+    settings.REPLICA_DATABASES = [REPLICA_ALIAS]
+    settings.REPLICATION = {'STICKY_SECONDS': 5, 'STICKY_COOKIE': 'db_primary', 'MAX_LAG_SECONDS': None,
+                            'LAG_CHECK_INTERVAL': 0}
+    lag_monitor.reset()
+    return REPLICA_ALIAS
+
+
+@pytest.mark.django_db(databases=['default', REPLICA_ALIAS])
+class TestReplicaRouting:
+    def test_catalog_reads_use_replica(self, api_client, replica, product):
+        response = api_client.get(reverse('Products-list'))
+        assert response.data['results'] == []
+
+    def test_cart_reads_stay_on_primary(self, api_client, replica, cart):
+        response = api_client.get(reverse('Cart-list'))
+        assert [item['id'] for item in response.data] == [cart.id]
+
+    def test_write_pins_client_to_primary(self, api_client, replica, product_type):
+        data = {'name': 'Tablet', 'description': '', 'type': product_type.id, 'price': 500, 'ammount': 5}
+        response = api_client.post(reverse('Products-list'), data, format='json')
+        assert response.cookies['db_primary'].value == '1'
+        response = api_client.get(reverse('Products-list'))
+        assert [item['name'] for item in response.data['results']] == ['Tablet']
+        get_catalog_cache().clear()
+        assert APIClient().get(reverse('Products-list')).data['results'] == []
+
+    def test_middleware_keeps_async_stack_async(self):
+        seen = []
+
+        async def view(request):
+            seen.append(routing_state.get())
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        assert iscoroutinefunction(middleware)
+        async_to_sync(middleware)(RequestFactory().get('/', HTTP_COOKIE='db_primary=1'))
+        assert seen[0].pinned
+        assert routing_state.get() is None
+
+    def replicate(self, replica, product, name='Replica laptop'):
+        models.ProductType.objects.using(replica).create(id=product.type_id, name=product.type.name)
+        models.Product.objects.using(replica).bulk_create([models.Product(
+            id=product.id, name=name, type_id=product.type_id, price=1, ammount=1)])
+        models.CatalogChange.objects.using(replica).all().delete()
+        models.CatalogChange.objects.using(replica).bulk_create(models.CatalogChange.objects.all())
+
+    def test_change_feed_reads_rows_from_primary(self, api_client, replica, product):
+        self.replicate(replica, product)
+        models.Product.objects.filter(pk=product.pk).update(name='Laptop 2')
+        response = api_client.get(reverse('Products-changes'))
+        assert response.data['results'][-1]['data']['name'] == 'Laptop 2'
+
+    def test_lagging_replica_falls_back_to_primary(self, api_client, replica, product, settings):
+        settings.REPLICATION = {**settings.REPLICATION, 'MAX_LAG_SECONDS': 2}
+        models.CatalogChange.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        response = api_client.get(reverse('Products-list'))
+        assert [item['name'] for item in response.data['results']] == ['Laptop']
+
+    def test_caught_up_replica_serves_reads_uncached(self, api_client, replica, product, settings):
+        settings.REPLICATION = {**settings.REPLICATION, 'MAX_LAG_SECONDS': 2}
+        self.replicate(replica, product)
+        for _ in range(2):
+            response = api_client.get(reverse('Products-list'))
+            assert [item['name'] for item in response.data['results']] == ['Replica laptop']
+            assert 'ETag' not in response
+        assert catalog_cache_stats.snapshot()['hits'] == 0
+
+    def test_missing_delete_counts_as_lag_and_bump_rechecks(self, api_client, replica, product, settings,
+                                                            django_capture_on_commit_callbacks):
+        settings.REPLICATION = {**settings.REPLICATION, 'MAX_LAG_SECONDS': 2, 'LAG_CHECK_INTERVAL': 60}
+        self.replicate(replica, product)
+        assert api_client.get(reverse('Products-list')).data['results'] != []
+        with django_capture_on_commit_callbacks(execute=True):
+            APIClient().delete(reverse('Products-detail', args=[product.id]))
+        models.CatalogChange.objects.filter(op=models.CatalogChange.DELETE).update(
+            created_at=timezone.now() - timedelta(hours=1))
+        assert api_client.get(reverse('Products-list')).data['results'] == []
+
+
+@pytest.mark.django_db
+class TestBenchEndpoints:
+    def run(self, tmp_path, **options):
+        output = tmp_path / 'bench.json'
+        call_command('bench_endpoints', **{'sizes': ['small'], 'repeat': 3, 'auth_repeat': 1, 'output': str(output),
+                                           **options})
+        return json.loads(output.read_text())
+
+    def test_writes_results_for_every_endpoint(self, tmp_path):
+        results = self.run(tmp_path)
+        assert set(results['small']) == {name for name, _, _ in BENCH_ENDPOINTS}
+        catalog = results['small']['products-list']
+        assert catalog['count'] == 3
+        assert catalog['queries'] > 0
+
+    def test_auth_endpoints_are_not_throttled(self, tmp_path, settings):
+        settings.AUTH_THROTTLE = {'RATES': {'register': {'ip': '1/min'}}}
+        results = self.run(tmp_path, endpoints=['user-register'], auth_repeat=3)
+        assert results['small']['user-register']['count'] == 3
+
+    def test_catalog_reads_are_not_served_from_cache(self, tmp_path):
+        self.run(tmp_path, endpoints=['products-list', 'product-types-detail'])
+        stats = catalog_cache_stats.snapshot()
+        assert stats['hits'] == 0
+        assert stats['misses'] == 8
+
+    def test_compare_flags_query_regressions(self, tmp_path):
+        baseline = self.run(tmp_path, endpoints=['products-detail'])
+        baseline['small']['products-detail']['queries'] -= 1
+        baseline_path = tmp_path / 'baseline.json'
+        baseline_path.write_text(json.dumps(baseline))
+        with pytest.raises(CommandError, match='1 regression'):
+            self.run(tmp_path, endpoints=['products-detail'], compare=str(baseline_path))
+
+
+class TestDatabaseProfiles:
+    def test_production_profile_applies_pragmas(self, tmp_path, django_db_blocker):
+        config = sqlite_database(tmp_path / 'tuned.sqlite3', 'production')
+        assert config['CONN_MAX_AGE'] == 600
+        assert config['CONN_HEALTH_CHECKS'] is True
+        handler = ConnectionHandler({'default': config})
+        with django_db_blocker.unblock():
+            with handler['default'].cursor() as cursor:
+                pragmas = {}
+                for pragma in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size'):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    pragmas[pragma] = cursor.fetchone()[0]
+            handler.close_all()
+        assert pragmas == {'journal_mode': 'wal', 'synchronous': 1, 'mmap_size': 256 * 1024 * 1024, 'cache_size': -65536}
+
+    def test_development_profile_is_untuned(self, tmp_path):
+        config = sqlite_database(tmp_path / 'plain.sqlite3')
+        assert 'init_command' not in config['OPTIONS']
+        assert config['CONN_MAX_AGE'] == 0
+
+    def test_unknown_profile(self, tmp_path):
+        with pytest.raises(ValueError):
+            sqlite_database(tmp_path / 'x.sqlite3', 'staging')
+
+
+@pytest.mark.django_db
+class TestRequestTimingMiddleware:
+    @pytest.fixture(autouse=True)
+    def enable_timing(self, settings):
+        settings.REQUEST_TIMING = {'ENABLED': True, 'SLOW_REQUEST_MS': 0, 'SLOWEST_QUERIES': 2}
+        route_histograms.reset()
+
+    def test_server_timing_header(self, api_client, product):
+        response = api_client.get(reverse('Products-detail', args=[product.id]))
+        timings = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        assert set(timings) == {'db', 'serializer', 'view', 'total'}
+        assert 'desc="2 queries"' in timings['db']
+
+    def test_slow_requests_are_logged(self, api_client, product, caplog):
+        with caplog.at_level(logging.WARNING, logger='backend.requests'):
+            api_client.get(reverse('Products-list'))
+        assert 'Slow request GET /products/' in caplog.text
+        assert 'SELECT' in caplog.text
+
+    @pytest.mark.django_db(databases=['default', REPLICA_ALIAS])
+    def test_replica_queries_are_counted(self, api_client, replica, product):
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections[replica]) as replica_queries:
+            response = api_client.get(reverse('Products-list'))
+        total = len(primary.captured_queries) + len(replica_queries.captured_queries)
+        assert replica_queries.captured_queries
+        assert f'desc="{total} queries"' in response['Server-Timing']
+
+    def test_streamed_queries_reach_histograms(self, api_client, product):
+        response = api_client.get(reverse('Products-export'))
+        assert 'GET Products-export' not in route_histograms.snapshot()
+        with CaptureQueriesContext(connection) as queries:
+            b''.join(response.streaming_content)
+        response.close()
+        assert queries.captured_queries
+        assert route_histograms.snapshot()['GET Products-export']['queries'] >= len(queries.captured_queries)
+
+    def test_metrics_endpoint_serves_route_histograms(self, api_client, customer_user, product):
+        api_client.get(reverse('Products-list'))
+        api_client.get(reverse('Products-list'))
+        assert api_client.get(reverse('Metrics-list')).status_code == status.HTTP_403_FORBIDDEN
+        customer_user.is_staff = True
+        customer_user.save()
+        histograms = api_client.get(reverse('Metrics-list')).data
+        assert histograms['GET Products-list']['count'] == 2
+        assert sum(histograms['GET Products-list']['buckets'].values()) == 2
+
+    def test_async_requests_are_timed(self, product):
+        async def view(request):
+            return HttpResponse()
+
+        assert iscoroutinefunction(RequestTimingMiddleware(view))
+        response = async_to_sync(AsyncClient().get)(reverse('AsyncProducts-list'))
+        assert 'desc="1 queries"' in response['Server-Timing']
+        assert route_histograms.snapshot()['GET AsyncProducts-list']['count'] == 1
+
+    def test_disabled_by_default(self, api_client, settings, product):
+        settings.REQUEST_TIMING = {'ENABLED': False}
+        response = APIClient().get(reverse('Products-list'))
+        assert 'Server-Timing' not in response
+
+
+@pytest.mark.django_db
+class TestCachedTokenAuthentication:
+    @pytest.fixture
+    def token_client(self):
+        user = models.CustomerUser.objects.create_user(username='tokenuser', password='tokenpassword')
+        token = Token.objects.create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client, user, token
+
+    def test_repeat_requests_skip_token_lookup(self, token_client, django_assert_num_queries):
+        client, user, _ = token_client
+        url = reverse('User-get-username')
+        with django_assert_num_queries(1):
+            assert client.get(url).data == {'username': 'tokenuser'}
+        with django_assert_num_queries(0):
+            assert client.get(url).data == {'username': 'tokenuser'}
+        assert token_cache.stats.snapshot()['hits'] == 1
+
+    def test_deactivation_invalidates(self, token_client):
+        client, user, _ = token_client
+        url = reverse('User-get-username')
+        assert client.get(url).status_code == status.HTTP_200_OK
+        user.is_active = False
+        user.save()
+        assert client.get(url).status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_token_deletion_invalidates(self, token_client):
+        client, _, token = token_client
+        url = reverse('User-get-username')
+        assert client.get(url).status_code == status.HTTP_200_OK
+        token.delete()
+        assert client.get(url).status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_change_password_invalidates(self, token_client):
+        client, _, _ = token_client
+        assert client.get(reverse('User-get-username')).status_code == status.HTTP_200_OK
+        data = {'old_password': 'tokenpassword', 'new_password': 'n3w-Passw0rd', 'confirm_new_password': 'n3w-Passw0rd'}
+        response = client.post(reverse('User-change-password'), data, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert len(token_cache) == 0
+
+    def test_shared_cache_invalidation_reaches_other_processes(self, token_client, settings):
+        _, _, token = token_client
+        settings.TOKEN_CACHE = {'SHARED_CACHE': 'default'}
+        worker, other_worker = TokenCache(), TokenCache()
+        worker.set(token.key, token)
+        assert other_worker.get(token.key) == token
+        worker.invalidate(token.key)
+        assert other_worker.get(token.key) is None
+        assert len(worker) == len(other_worker) == 0
+
+    def test_stats_endpoint_is_staff_only(self, token_client):
+        client, user, _ = token_client
+        url = reverse('User-auth-cache-stats')
+        assert client.get(url).status_code == status.HTTP_403_FORBIDDEN
+        user.is_staff = True
+        user.save()
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data) == {'hits', 'misses', 'hit_rate', 'size'}
+
+
+
+
+@pytest.mark.django_db
+class TestAuthThrottling:
+    @pytest.fixture(autouse=True)
+    def rates(self, settings):
+        caches['default'].clear()
+        settings.AUTH_THROTTLE = {'RATES': {'login': {'ip': '3/min', 'username': '2/min'}}}
+        return settings.AUTH_THROTTLE
+
+    @pytest.fixture
+    def hashes(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr('backend.views.authenticate', lambda request, **credentials: calls.append(credentials))
+        return calls
+
+    def login(self, api_client, username, ip='10.0.0.1'):
+        return api_client.post(reverse('User-login'), {'username': username, 'password': 'wrong'},
+                               format='json', REMOTE_ADDR=ip)
+
+    def test_ip_bucket_returns_429_before_hashing(self, api_client, hashes, django_assert_num_queries):
+        for i in range(3):
+            assert self.login(api_client, f'user{i}').status_code == status.HTTP_401_UNAUTHORIZED
+        with django_assert_num_queries(0):
+            response = self.login(api_client, 'user3')
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert 1 <= int(response['Retry-After']) <= 20
+        assert len(hashes) == 3
+        assert self.login(api_client, 'user3', ip='10.0.0.2').status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_multiple_workers_need_a_shared_bucket_cache(self, settings, rates):
+        assert check_auth_throttle_cache(None) == []
+        settings.WORKER_PROCESSES = 4
+        assert [error.id for error in check_auth_throttle_cache(None)] == ['backend.E002']
+        settings.AUTH_THROTTLE = {**rates, 'SHARED_CACHE': 'default'}  # LocMemCache is per process
+        assert [error.id for error in check_auth_throttle_cache(None)] == ['backend.E002']
+        settings.CACHES = {**settings.CACHES, 'shared': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}}
+        settings.AUTH_THROTTLE = {**rates, 'SHARED_CACHE': 'shared'}
+        assert check_auth_throttle_cache(None) == []
+
+    def test_username_bucket_spans_ips(self, api_client, hashes):
+        assert self.login(api_client, 'Victim', ip='10.0.0.1').status_code == status.HTTP_401_UNAUTHORIZED
+        assert self.login(api_client, 'victim', ip='10.0.0.2').status_code == status.HTTP_401_UNAUTHORIZED
+        assert self.login(api_client, 'victim', ip='10.0.0.3').status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    def test_forwarded_for_is_only_trusted_behind_proxies(self, api_client, hashes, rates):
+        rates['RATES'] = {'login': {'ip': '1/min'}}
+        codes = [api_client.post(reverse('User-login'), {'username': 'u', 'password': 'p'}, format='json',
+                                 HTTP_X_FORWARDED_FOR=f'10.9.9.{i}').status_code for i in range(2)]
+        assert codes == [status.HTTP_401_UNAUTHORIZED, status.HTTP_429_TOO_MANY_REQUESTS]
+        rates['NUM_PROXIES'] = 1
+        forwarded = [api_client.post(reverse('User-login'), {'username': 'u', 'password': 'p'}, format='json',
+                                     HTTP_X_FORWARDED_FOR=f'10.9.9.9, 10.8.8.{i}').status_code for i in range(2)]
+        assert forwarded == [status.HTTP_401_UNAUTHORIZED] * 2
+
+    def test_authenticated_bucket_ignores_submitted_username(self, rates, customer_user):
+        rates['RATES'] = {'change_password': {'username': '2/min'}}
+        client = APIClient()
+        client.force_authenticate(customer_user)
+        codes = [client.post(reverse('User-change-password'), {'username': f'decoy{i}'}, format='json',
+                             REMOTE_ADDR=f'10.0.0.{i}').status_code for i in range(3)]
+        assert codes == [status.HTTP_400_BAD_REQUEST] * 2 + [status.HTTP_429_TOO_MANY_REQUESTS]
+
+    def test_unconfigured_actions_are_not_throttled(self, api_client, hashes):
+        for i in range(5):
+            response = api_client.post(reverse('User-register'), {'username': f'new{i}'}, format='json')
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_shared_cache_holds_buckets(self, api_client, hashes, rates):
+        rates['SHARED_CACHE'] = 'default'
+        for _ in range(2):
+            self.login(api_client, 'shared')
+        assert self.login(api_client, 'shared').status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert len(token_buckets) == 0
+
+    def test_contended_shared_lock_denies(self, rates):
+        rates.update(SHARED_CACHE='default', LOCK_WAIT=0.02)
+        caches['default'].add('throttle:test:lock', 1)
+        try:
+            assert token_buckets.take('throttle:test', 1, 1.0) == (False, 1)
+            assert len(token_buckets) == 0
+        finally:
+            caches['default'].delete('throttle:test:lock')
+        assert token_buckets.take('throttle:test', 1, 1.0) == (True, 0.0)
+
+    def test_bucket_refills_over_time(self):
+        state, allowed, _ = take_token(None, 0.0, 2, 0.5)
+        state, allowed, _ = take_token(state, 0.0, 2, 0.5)
+        state, allowed, wait = take_token(state, 0.0, 2, 0.5)
+        assert not allowed and wait == 2.0
+        _, allowed, _ = take_token(state, 2.0, 2, 0.5)
+        assert allowed
+
+def make_budget_data(api_client, size):
+    user = models.CustomerUser.objects.create_user(
+        username='budgetuser', email='budget@example.com', password='budgetpassword', is_staff=True)
+    api_client.force_authenticate(user=user)
+    product_type = models.ProductType.objects.create(name='Budget')
+    products = models.Product.objects.bulk_create([
+        models.Product(name=f'Budget product {i}', description='budget', type=product_type, price=i, ammount=100)
+        for i in range(size)
+    ])
+    cart = models.Cart.objects.create(user=user)
+    items = models.CartItem.objects.bulk_create([
+        models.CartItem(cart=cart, product=product, ammount=1) for product in products
+    ])
+    refresh_cart_totals(models.Cart.objects.filter(pk=cart.pk))
+    return {'user': user, 'product_type': product_type, 'products': products, 'cart': cart, 'items': items}
+
+
+def upload(rows):
+    return SimpleUploadedFile('feed.jsonl', '\n'.join(json.dumps(row) for row in rows).encode())
+
+
+def with_guest_cart(client, products):
+    guest_cart = GuestCart(items={product.id: 1 for product in products})
+    response = HttpResponse()
+    guest_cart.save(response)
+    client.cookies.update(response.cookies)
+    return client
+
+
+QUERY_BUDGET_SCENARIOS = {
+    ('ProductTypeViewSet', 'list'): lambda c, d: c.get(reverse('ProductTypes-list')),
+    ('ProductTypeViewSet', 'create'): lambda c, d: c.post(reverse('ProductTypes-list'), {'name': 'New'}, format='json'),
+    ('ProductTypeViewSet', 'retrieve'): lambda c, d: c.get(reverse('ProductTypes-detail', args=[d['product_type'].id])),
+    ('ProductTypeViewSet', 'update'): lambda c, d: c.put(
+        reverse('ProductTypes-detail', args=[d['product_type'].id]), {'name': 'Renamed'}, format='json'),
+    ('ProductTypeViewSet', 'partial_update'): lambda c, d: c.patch(
+        reverse('ProductTypes-detail', args=[d['product_type'].id]), {'name': 'Renamed'}, format='json'),
+    ('ProductTypeViewSet', 'destroy'): lambda c, d: c.delete(reverse('ProductTypes-detail', args=[d['product_type'].id])),
+    ('ProductViewSet', 'list'): lambda c, d: c.get(reverse('Products-list')),
+    ('ProductViewSet', 'create'): lambda c, d: c.post(reverse('Products-list'), {
+        'name': 'New', 'description': '', 'type': d['product_type'].id, 'price': 1, 'ammount': 1}, format='json'),
+    ('ProductViewSet', 'retrieve'): lambda c, d: c.get(reverse('Products-detail', args=[d['products'][0].id])),
+    ('ProductViewSet', 'update'): lambda c, d: c.put(reverse('Products-detail', args=[d['products'][0].id]), {
+        'name': 'Renamed', 'description': '', 'type': d['product_type'].id, 'price': 1, 'ammount': 1}, format='json'),
+    ('ProductViewSet', 'partial_update'): lambda c, d: c.patch(
+        reverse('Products-detail', args=[d['products'][0].id]), {'price': 2}, format='json'),
+    ('ProductViewSet', 'destroy'): lambda c, d: c.delete(reverse('Products-detail', args=[d['products'][0].id])),
+    ('ProductViewSet', 'search'): lambda c, d: c.get(reverse('Products-search'), {'q': 'budget'}),
+    ('ProductViewSet', 'changes'): lambda c, d: c.get(reverse('Products-changes')),
+    ('ProductViewSet', 'export'): lambda c, d: c.get(reverse('Products-export')),
+    ('ProductViewSet', 'bulk_import'): lambda c, d: c.post(reverse('Products-bulk-import'), {'file': upload([
+        {'name': f'Imported {i}', 'type': d['product_type'].id, 'price': i, 'ammount': 1}
+        for i in range(len(d['products']))])}, format='multipart'),
+    ('ProductViewSet', 'cache_stats'): lambda c, d: c.get(reverse('Products-cache-stats')),
+    ('CartViewSet', 'list'): lambda c, d: c.get(reverse('Cart-list')),
+    ('CartViewSet', 'create'): lambda c, d: c.post(reverse('Cart-list'), {'user': d['user'].id}, format='json'),
+    ('CartViewSet', 'retrieve'): lambda c, d: c.get(reverse('Cart-detail', args=[d['cart'].id])),
+    ('CartViewSet', 'update'): lambda c, d: c.put(
+        reverse('Cart-detail', args=[d['cart'].id]), {'user': d['user'].id}, format='json'),
+    ('CartViewSet', 'partial_update'): lambda c, d: c.patch(
+        reverse('Cart-detail', args=[d['cart'].id]), {'user': d['user'].id}, format='json'),
+    ('CartViewSet', 'destroy'): lambda c, d: c.delete(reverse('Cart-detail', args=[d['cart'].id])),
+    ('CartViewSet', 'details'): lambda c, d: c.get(reverse('Cart-details', args=[d['cart'].id])),
+    ('CartViewSet', 'badge'): lambda c, d: c.get(reverse('Cart-badge', args=[d['cart'].id])),
+    ('CartViewSet', 'batch'): lambda c, d: c.post(reverse('Cart-batch', args=[d['cart'].id]), {'operations': [
+        {'op': 'update', 'item': item.id, 'ammount': 2} for item in d['items'][:10]
+    ] + [{'op': 'remove', 'item': item.id} for item in d['items'][10:]] + [
+        {'op': 'add', 'product': product.id, 'ammount': 1} for product in d['products'][10:]
+    ]}, format='json'),
+    ('CartViewSet', 'checkout'): lambda c, d: c.post(reverse('Cart-checkout', args=[d['cart'].id])),
+    ('CartItemViewSet', 'list'): lambda c, d: c.get(reverse('CartItems-list')),
+    ('CartItemViewSet', 'create'): lambda c, d: c.post(reverse('CartItems-list'), {
+        'cart': d['cart'].id, 'product': d['products'][0].id, 'ammount': 1}, format='json'),
+    ('CartItemViewSet', 'retrieve'): lambda c, d: c.get(reverse('CartItems-detail', args=[d['items'][0].id])),
+    ('CartItemViewSet', 'update'): lambda c, d: c.put(reverse('CartItems-detail', args=[d['items'][0].id]), {
+        'cart': d['cart'].id, 'product': d['products'][0].id, 'ammount': 3}, format='json'),
+    ('CartItemViewSet', 'partial_update'): lambda c, d: c.patch(
+        reverse('CartItems-detail', args=[d['items'][0].id]), {'ammount': 3}, format='json'),
+    ('CartItemViewSet', 'destroy'): lambda c, d: c.delete(reverse('CartItems-detail', args=[d['items'][0].id])),
+    ('UserViewSet', 'list'): lambda c, d: c.get(reverse('User-list')),
+    ('UserViewSet', 'create'): lambda c, d: c.post(reverse('User-list'), {
+        'username': 'created', 'email': 'created@example.com'}, format='json'),
+    ('UserViewSet', 'retrieve'): lambda c, d: c.get(reverse('User-detail', args=[d['user'].id])),
+    ('UserViewSet', 'update'): lambda c, d: c.put(reverse('User-detail', args=[d['user'].id]), {
+        'username': 'budgetuser', 'email': 'budget@example.com', 'first_name': 'B'}, format='json'),
+    ('UserViewSet', 'partial_update'): lambda c, d: c.patch(
+        reverse('User-detail', args=[d['user'].id]), {'first_name': 'B'}, format='json'),
+    ('UserViewSet', 'destroy'): lambda c, d: c.delete(reverse('User-detail', args=[d['user'].id])),
+    ('UserViewSet', 'register'): lambda c, d: c.post(reverse('User-register'), {
+        'username': 'registered', 'email': 'registered@example.com', 'password': 'registerpassword',
+        'first_name': 'R', 'last_name': 'U'}, format='json'),
+    ('UserViewSet', 'login'): lambda c, d: c.post(
+        reverse('User-login'), {'username': 'budgetuser', 'password': 'budgetpassword'}, format='json'),
+    ('UserViewSet', 'change_password'): lambda c, d: c.post(reverse('User-change-password'), {
+        'old_password': 'budgetpassword', 'new_password': 'n3w-Budget', 'confirm_new_password': 'n3w-Budget'},
+        format='json'),
+    ('UserViewSet', 'auth_cache_stats'): lambda c, d: c.get(reverse('User-auth-cache-stats')),
+    ('UserViewSet', 'get_username'): lambda c, d: c.get(reverse('User-get-username')),
+    ('MetricsViewSet', 'list'): lambda c, d: c.get(reverse('Metrics-list')),
+    ('GuestCartViewSet', 'list'): lambda c, d: with_guest_cart(c, d['products']).get(reverse('GuestCart-list')),
+    ('GuestCartViewSet', 'create'): lambda c, d: c.post(reverse('GuestCart-list'), {
+        'product': d['products'][0].id, 'ammount': 1}, format='json'),
+    ('GuestCartViewSet', 'update'): lambda c, d: with_guest_cart(c, d['products']).put(
+        reverse('GuestCart-detail', args=[d['products'][0].id]), {'ammount': 3}, format='json'),
+    ('GuestCartViewSet', 'destroy'): lambda c, d: with_guest_cart(c, d['products']).delete(
+        reverse('GuestCart-detail', args=[d['products'][0].id])),
+}
+
+
+def test_every_routed_action_has_a_query_budget():
+    routed = set()
+    for _, viewset, _ in router.registry:
+        actions = {name for name in ('list', 'create', 'retrieve', 'update', 'partial_update', 'destroy')
+                   if hasattr(viewset, name)}
+        actions |= {extra.__name__ for extra in viewset.get_extra_actions()}
+        routed |= {(viewset.__name__, name) for name in actions}
+    budgeted = {(viewset, name) for viewset, actions in QUERY_BUDGETS.items() for name in actions}
+    assert routed == budgeted
+    assert routed == set(QUERY_BUDGET_SCENARIOS)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('viewset, action', sorted(QUERY_BUDGET_SCENARIOS))
+def test_action_within_query_budget(query_budget, settings, viewset, action):
+    executed = {}
+    for size in QUERY_BUDGET_DATA_SIZES:
+        with rollback():
+            clear_process_caches()
+            api_client = APIClient()
+            data = make_budget_data(api_client, size)
+            with query_budget(viewset, action, size) as captured:
+                response = QUERY_BUDGET_SCENARIOS[(viewset, action)](api_client, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            assert response.status_code < 400, response.content
+            executed[size] = len(captured)
+    if not budget_scales_with_data(viewset, action):
+        assert len(set(executed.values())) == 1, f'{viewset}.{action} queries grow with data size: {executed}'
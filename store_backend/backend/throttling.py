@@ -0,0 +1,179 @@
+"""
+Token-bucket throttling for the password-hashing auth actions.
+
+Every configured action (AUTH_THROTTLE['RATES']) gets one bucket per client IP and one per
+account: the submitted username for login and register, the authenticated user otherwise. A
+bucket holds up to N tokens and refills at N per period; each request takes a token, and an
+empty bucket means 429 with Retry-After. DRF checks throttles in `initial()`, before the action
+runs, so throttled requests never reach the hasher.
+
+Buckets live in the AUTH_THROTTLE['SHARED_CACHE'] alias when one is configured, so all workers
+share them; the `backend.E002` system check requires one when WORKER_PROCESSES is above 1.
+Updates take a short owner-checked lock (`cache_lock`), waiting up to AUTH_THROTTLE['LOCK_WAIT']
+seconds for it; a request that still cannot get it is throttled. Only when the cache itself is
+unavailable does the bucket in the local in-process store decide instead.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .cache import CacheLockTimeout, cache_lock
+
+
+AUTH_THROTTLE_DEFAULTS = {
+    'SHARED_CACHE': None,
+    'MAX_ENTRIES': 100_000,
+    'LOCK_TIMEOUT': 1,
+    'LOCK_WAIT': 0.1,
+    'NUM_PROXIES': 0,
+    'RATES': {},
+}
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# Actions whose request body names the account being authenticated.
+CREDENTIAL_ACTIONS = frozenset({'login', 'register'})
+
+
+def get_auth_throttle_setting(name):
+    return getattr(settings, 'AUTH_THROTTLE', {}).get(name, AUTH_THROTTLE_DEFAULTS[name])
+
+
+def parse_rate(rate):
+    """
+    Parses 'N/period' (period: s, sec, m, min, h, hour, d, day) into (capacity, tokens per second).
+    """
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def take_token(state, now, capacity, refill_rate):
+    """
+    Refills the bucket `state` ((tokens, updated_at) or None for a full one) up to `now` and
+    tries to take a token. Returns (new_state, allowed, wait_seconds).
+    """
+    tokens, updated_at = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), True, 0.0
+    return (tokens, now), False, (1 - tokens) / refill_rate
+
+
+class TokenBuckets:
+    """
+    Token buckets keyed by string, in the shared cache if configured, else in a thread-safe
+    in-process LRU capped at AUTH_THROTTLE['MAX_ENTRIES'].
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def shared_cache(self):
+        alias = get_auth_throttle_setting('SHARED_CACHE')
+        return caches[alias] if alias else None
+
+    def take(self, key, capacity, refill_rate):
+        """
+        Takes a token from bucket `key`. Returns (allowed, wait_seconds).
+        """
+        shared = self.shared_cache()
+        if shared is not None:
+            result = self._take_shared(shared, key, capacity, refill_rate)
+            if result is not None:
+                return result
+        return self._take_local(key, capacity, refill_rate)
+
+    def _take_local(self, key, capacity, refill_rate):
+        with self._lock:
+            state, allowed, wait = take_token(self._buckets.get(key), time.monotonic(), capacity, refill_rate)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > get_auth_throttle_setting('MAX_ENTRIES'):
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+    def _take_shared(self, cache, key, capacity, refill_rate):
+        lock_timeout = get_auth_throttle_setting('LOCK_TIMEOUT')
+        try:
+            with cache_lock(cache, f'{key}:lock', lock_timeout, wait=get_auth_throttle_setting('LOCK_WAIT')):
+                state, allowed, wait = take_token(cache.get(key), time.time(), capacity, refill_rate)
+                cache.set(key, state, timeout=math.ceil(capacity / refill_rate) + 1)
+        except CacheLockTimeout:
+            # a per-process fallback would multiply the limit by the number of workers
+            return False, lock_timeout
+        except Exception:  # an unreachable cache must not take logins down with it
+            return None
+        return allowed, wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+token_buckets = TokenBuckets()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Applies the per-IP and per-username buckets configured for the view's action.
+    Actions without an entry in AUTH_THROTTLE['RATES'] are not throttled.
+    """
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_ident(self, request):
+        """
+        Returns the client IP. X-Forwarded-For is only consulted behind AUTH_THROTTLE['NUM_PROXIES']
+        trusted proxies, taking the address the outermost of them saw; otherwise a client could
+        pick a fresh identity per request by sending the header itself.
+        """
+        num_proxies = get_auth_throttle_setting('NUM_PROXIES')
+        forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if num_proxies and forwarded_for:
+            addrs = [addr.strip() for addr in forwarded_for.split(',')]
+            return addrs[-min(num_proxies, len(addrs))]
+        return request.META.get('REMOTE_ADDR')
+
+    def get_username(self, request, view):
+        """
+        Returns the account the request acts on: the submitted username for the credential
+        actions, else the authenticated user. Request data is never trusted for authenticated
+        actions, or a caller could dodge the bucket by sending a new username each time.
+        """
+        if view.action not in CREDENTIAL_ACTIONS:
+            return f'pk:{request.user.pk}' if request.user and request.user.is_authenticated else None
+        data = request.data
+        username = data.get('username') if hasattr(data, 'get') else None
+        return str(username).strip().lower() if username else None
+
+    def allow_request(self, request, view):
+        limits = get_auth_throttle_setting('RATES').get(view.action)
+        if not limits:
+            return True
+        idents = {'ip': self.get_ident(request), 'username': self.get_username(request, view)}
+        waits = []
+        for dimension, rate in limits.items():
+            ident = idents[dimension]
+            if ident is None:
+                continue
+            digest = hashlib.sha1(ident.encode()).hexdigest()
+            allowed, wait = token_buckets.take(f'throttle:{view.action}:{dimension}:{digest}', *parse_rate(rate))
+            if not allowed:
+                waits.append(wait)
+        if waits:
+            self.wait_seconds = max(waits)
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
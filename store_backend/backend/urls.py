@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductTypeViewSet, ProductViewSet, CartViewSet, CartItemViewSet, UserViewSet
+from .views import (ProductTypeViewSet, ProductViewSet, CartViewSet, CartItemViewSet, UserViewSet, MetricsViewSet,
+                    GuestCartViewSet)
+from . import async_views, snapshots
 
 
 router = DefaultRouter()
@@ -8,4 +10,19 @@ router.register(r'product-types', ProductTypeViewSet, basename='ProductTypes')
 router.register(r'products', ProductViewSet, basename='Products')
 router.register(r'cart', CartViewSet, basename='Cart')
 router.register(r'cart-items', CartItemViewSet, basename='CartItems')
+router.register(r'guest-cart', GuestCartViewSet, basename='GuestCart')
 router.register(r'user', UserViewSet, basename='User')
+router.register(r'metrics', MetricsViewSet, basename='Metrics')
+
+
+async_urlpatterns = [
+    path('async/product-types/', async_views.product_type_list, name='AsyncProductTypes-list'),
+    path('async/product-types/<int:pk>/', async_views.product_type_detail, name='AsyncProductTypes-detail'),
+    path('async/products/', async_views.product_list, name='AsyncProducts-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='AsyncProducts-detail'),
+]
+
+
+snapshot_urlpatterns = [
+    path('snapshots/products/', snapshots.product_snapshot, name='ProductSnapshots'),
+]
@@ -1,23 +1,54 @@
+import logging
+
 from rest_framework import viewsets, mixins, permissions
 from .models import ProductType, Product, Cart, CartItem
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from django.contrib.auth import authenticate, login
 from rest_framework.authtoken.models import Token
 from rest_framework import permissions
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import update_session_auth_hash
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.http import StreamingHttpResponse
 
 import backend.serializers as serializers
 from .models import CustomerUser
 from .serializers import UserSerializer
 from .permissions import IsAdminOrSelf
+from .pagination import CatalogCursorPagination, SearchPagination
+from .search import build_match_query, search_products
+from .filters import CatalogOrderingFilter, ProductFilterBackend
+from .carts import (add_cart_items, adjust_cart_totals, apply_cart_operations, cart_totals_refreshed,
+                    delete_cart_items, lock_cart_items)
+from .checkout import checkout_cart
+from .authentication import token_cache
+from .export import EXPORT_FORMATS, stream_products
+from .instrumentation import route_histograms
+from .cache import CachedCatalogMixin, catalog_cache_stats
+from .conditional import ConditionalCatalogMixin
+from .importing import detect_format, import_products, open_text
+from .db_router import ReplicaReadsMixin
+from .fast_serializers import FastListMixin
+from .fieldsets import SparseFieldsetViewMixin
+from .guest_carts import GuestCart, GuestCartBusy, merge_guest_cart
+from .changes import ChangesCompacted, change_feed_page, get_change_feed_setting
+from .throttling import TokenBucketThrottle
+
 
+logger = logging.getLogger('backend.guest_carts')
 
 
-class ProductTypeViewSet(mixins.CreateModelMixin,
+class ProductTypeViewSet(ReplicaReadsMixin,
+                         SparseFieldsetViewMixin,
+                         ConditionalCatalogMixin,
+                         CachedCatalogMixin,
+                         FastListMixin,
+                         mixins.CreateModelMixin,
                          mixins.RetrieveModelMixin,
                          mixins.UpdateModelMixin,
                          mixins.DestroyModelMixin,
@@ -25,9 +56,19 @@ class ProductTypeViewSet(mixins.CreateModelMixin,
                          viewsets.GenericViewSet):
     queryset = ProductType.objects.all()
     serializer_class = serializers.ProductTypeSerializer
+    pagination_class = CatalogCursorPagination
 
+    def perform_destroy(self, instance):
+        with transaction.atomic(), cart_totals_refreshed(CartItem.objects.filter(product__type=instance)):
+            super().perform_destroy(instance)
 
-class ProductViewSet(mixins.CreateModelMixin,
+
+class ProductViewSet(ReplicaReadsMixin,
+                     SparseFieldsetViewMixin,
+                     ConditionalCatalogMixin,
+                     CachedCatalogMixin,
+                     FastListMixin,
+                     mixins.CreateModelMixin,
                      mixins.RetrieveModelMixin,
                      mixins.UpdateModelMixin,
                      mixins.DestroyModelMixin,
@@ -35,6 +76,95 @@ class ProductViewSet(mixins.CreateModelMixin,
                      viewsets.GenericViewSet):
     queryset = Product.objects.all()
     serializer_class = serializers.ProductSerializer
+    pagination_class = CatalogCursorPagination
+    filter_backends = [ProductFilterBackend, CatalogOrderingFilter]
+    # the change log is read from the primary, so the rows it points at must be too
+    primary_read_actions = ('changes',)
+    ordering_fields = ['id', 'price']
+    ordering = ['id']
+
+    def perform_update(self, serializer):
+        product = serializer.instance
+        if serializer.validated_data.get('price', product.price) == product.price:
+            return super().perform_update(serializer)
+        with transaction.atomic(), cart_totals_refreshed(CartItem.objects.filter(product=product)):
+            super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(), cart_totals_refreshed(CartItem.objects.filter(product=instance)):
+            super().perform_destroy(instance)
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Full-text search over product name and description, ranked by relevance.
+        """
+        match_query = build_match_query(request.query_params.get('q', ''))
+        if match_query is None:
+            return Response({'q': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(search_products(match_query), request, view=self)
+        serializer = self.get_serializer([hit.product for hit in page], many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='changes')
+    def changes(self, request):
+        """
+        Catalog change feed for delta sync: changes after ?since=<seq> in bounded pages.
+        Responds 410 if that position has been compacted away and the consumer must resync.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', get_change_feed_setting('PAGE_SIZE')))
+        except ValueError:
+            return Response({'detail': 'since and limit must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0 or limit < 1:
+            return Response({'detail': 'since must be >= 0 and limit >= 1.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = change_feed_page(since, min(limit, get_change_feed_setting('MAX_PAGE_SIZE')))
+        except ChangesCompacted as exc:
+            return Response({'detail': f'Changes up to {exc.args[0]} have been compacted; resync from /products/.',
+                             'compacted_through': exc.args[0]}, status=status.HTTP_410_GONE)
+        return Response(page, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Streams the (optionally filtered) catalog as NDJSON or CSV, gzip-compressed on the fly
+        with ?gzip=1.
+        """
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'export_format': [f"Expected one of: {', '.join(EXPORT_FORMATS)}."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+        queryset = self.filter_queryset(self.get_queryset())
+        body = stream_products(queryset, export_format, compress, self.get_sparse_fields())
+        response = StreamingHttpResponse(body, content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{export_format}"'
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[permissions.IsAdminUser],
+            parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Streams an uploaded CSV/JSONL file into the catalog and returns a per-row error report
+        (the first DEFAULT_MAX_ERRORS failures; `failed` counts them all).
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.query_params.get('input_format') or detect_format(upload.name)
+        if fmt not in ('csv', 'jsonl'):
+            return Response({'format': ['Expected csv or jsonl.']}, status=status.HTTP_400_BAD_REQUEST)
+        report = import_products(open_text(upload.file), fmt)
+        return Response(report, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        return Response(catalog_cache_stats.snapshot(), status=status.HTTP_200_OK)
 
 
 class CartViewSet(mixins.CreateModelMixin,
@@ -50,7 +180,18 @@ class CartViewSet(mixins.CreateModelMixin,
         Returns the carts that belong to the current user.
         """
         user = self.request.user.id
-        return Cart.objects.filter(user=user)
+        queryset = Cart.objects.filter(user=user)
+        if self.action == 'details':
+            queryset = self.with_details(queryset)
+        return queryset
+
+    def with_details(self, queryset):
+        """
+        Prefetches the carts' items with their products and line totals.
+        """
+        items = CartItem.objects.select_related('product').annotate(
+            line_total=F('ammount') * F('product__price')).order_by('id')
+        return queryset.prefetch_related(Prefetch('cartitem_set', queryset=items))
 
     def perform_create(self, serializer):
         """
@@ -60,8 +201,96 @@ class CartViewSet(mixins.CreateModelMixin,
         user_obj = CustomerUser.objects.get(pk=user_id)
         serializer.save(user=user_obj)
 
+    @action(detail=True, methods=['get'], url_path='details', url_name='details')
+    def details(self, request, pk=None):
+        """
+        Returns the cart with nested items, product name/price, line totals and the cart total
+        in two queries regardless of how many items the cart holds.
+        """
+        cart = self.get_object()
+        return Response(serializers.CartDetailSerializer(cart).data, status=status.HTTP_200_OK)
 
-class CartItemViewSet(mixins.CreateModelMixin,
+    @action(detail=True, methods=['get'], url_path='badge', url_name='badge')
+    def badge(self, request, pk=None):
+        """
+        Item count and total for the cart badge, read from the cart row alone.
+        """
+        cart = self.get_object()
+        return Response(serializers.CartBadgeSerializer(cart).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], url_path='batch', url_name='batch')
+    def batch(self, request, pk=None):
+        """
+        Applies a list of add/update/remove item operations to the cart in one transaction
+        and returns the resulting cart details.
+        """
+        cart = self.get_object()
+        serializer = serializers.CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        apply_cart_operations(cart, serializer.validated_data['operations'])
+        cart = self.with_details(Cart.objects.filter(pk=cart.pk)).get()
+        return Response(serializers.CartDetailSerializer(cart).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], url_path='checkout', url_name='checkout')
+    def checkout(self, request, pk=None):
+        """
+        Places an order for everything in the cart, taking stock atomically.
+        Responds 409 if any product does not have enough stock left.
+        """
+        order = checkout_cart(self.get_object())
+        return Response(serializers.OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+
+class GuestCartViewSet(viewsets.ViewSet):
+    """
+    Cart for anonymous shoppers, kept in a signed cookie or a shared cache (no database writes).
+    Items are addressed by product id and merged into the user's cart at login/register.
+    Writes load, change and save the cart through GuestCart.for_update.
+    """
+    permission_classes = [permissions.AllowAny]
+    lookup_value_regex = r'\d+'
+
+    def respond(self, guest_cart, status_code=status.HTTP_200_OK):
+        response = Response(guest_cart.as_dict(), status=status_code)
+        if guest_cart.modified:
+            guest_cart.save(response)
+        return response
+
+    def list(self, request):
+        return self.respond(GuestCart.from_request(request))
+
+    def create(self, request):
+        serializer = serializers.GuestCartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product_id = serializer.validated_data['product'].id
+        with GuestCart.for_update(request) as guest_cart:
+            if guest_cart.is_full(product_id):
+                return Response({'product': ['The cart is full.']}, status=status.HTTP_400_BAD_REQUEST)
+            if guest_cart.exceeds_max_quantity(product_id, serializer.validated_data['ammount']):
+                return Response({'ammount': ['The cart already holds the maximum quantity of this product.']},
+                                status=status.HTTP_400_BAD_REQUEST)
+            guest_cart.add(product_id, serializer.validated_data['ammount'])
+            return self.respond(guest_cart, status.HTTP_201_CREATED)
+
+    def update(self, request, pk=None):
+        serializer = serializers.GuestCartItemUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with GuestCart.for_update(request) as guest_cart:
+            if int(pk) not in guest_cart.items:
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            guest_cart.set(int(pk), serializer.validated_data['ammount'])
+            return self.respond(guest_cart)
+
+    def destroy(self, request, pk=None):
+        with GuestCart.for_update(request) as guest_cart:
+            if int(pk) not in guest_cart.items:
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            guest_cart.set(int(pk), 0)
+            return self.respond(guest_cart)
+
+
+class CartItemViewSet(SparseFieldsetViewMixin,
+                      mixins.CreateModelMixin,
                       mixins.RetrieveModelMixin,
                       mixins.UpdateModelMixin,
                       mixins.DestroyModelMixin,
@@ -74,26 +303,59 @@ class CartItemViewSet(mixins.CreateModelMixin,
         Returns the cart items that belong to the current user's carts.
         """
         user = self.request.user.id
-        return CartItem.objects.filter(cart__user=user)
+        queryset = CartItem.objects.filter(cart__user=user)
+        if self.action in ('update', 'partial_update', 'destroy'):
+            queryset = queryset.select_related('product', 'cart')
+        return queryset
 
-    def perform_create(self, serializer):
+    def create(self, request, *args, **kwargs):
         """
-        Saves the cart item with a check to ensure the cart belongs to the current user.
+        Adds a product to one of the current user's carts. If the cart already has a line for the
+        product, its ammount is incremented by the same atomic upsert instead of adding a line.
         """
+        serializer = serializers.CartItemAddSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
         cart = serializer.validated_data['cart']
-        if cart.user.id != self.request.user.id:
+        if cart.user_id != self.request.user.id:
             raise PermissionDenied("You do not have permission to add items to this cart.")
-        serializer.save()
+        product, ammount = serializer.validated_data['product'], serializer.validated_data['ammount']
+        with transaction.atomic():
+            [item] = add_cart_items(cart.pk, {product.pk: ammount})
+            adjust_cart_totals(cart.pk, {product.pk: ammount})
+        return Response(serializers.CartItemSerializer(item).data, status=status.HTTP_201_CREATED)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # The line as it is now, write-locked, not as get_object() read it: a concurrent add
+            # may have changed its ammount since.
+            locked = lock_cart_items([serializer.instance.pk])
+            if not locked:
+                raise NotFound()
+            cart_id, product_id, ammount = locked[serializer.instance.pk]
+            item = serializer.save()
+            if item.cart_id == cart_id:
+                deltas = {product_id: -ammount}
+                deltas[item.product_id] = deltas.get(item.product_id, 0) + item.ammount
+                adjust_cart_totals(cart_id, deltas)
+            else:
+                adjust_cart_totals(cart_id, {product_id: -ammount})
+                adjust_cart_totals(item.cart_id, {item.product_id: item.ammount})
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            for cart_id, product_id, ammount in delete_cart_items([instance.pk]):
+                adjust_cart_totals(cart_id, {product_id: -ammount})
 
-class UserViewSet(viewsets.ModelViewSet):
+
+class UserViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = CustomerUser.objects.all()
     serializer_class = UserSerializer
+    throttle_classes = [TokenBucketThrottle]
 
     def get_permissions(self):
         if self.action in ['create', 'login', 'register']:
             return [permissions.AllowAny()]
-        elif self.action == 'list':
+        elif self.action in ['list', 'auth_cache_stats']:
             return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated(), IsAdminOrSelf()]
 
@@ -113,16 +375,35 @@ class UserViewSet(viewsets.ModelViewSet):
         self.perform_update(serializer)
         return Response(serializer.data)
 
+    def adopt_guest_cart(self, request, user, response):
+        """
+        Merges the request's guest cart (if any) into the user's cart and clears it. If the guest
+        cart is locked by another request it is left alone, and if it cannot be merged it is
+        dropped, rather than failing the login.
+        """
+        try:
+            with GuestCart.for_update(request) as guest_cart:
+                if guest_cart.found:
+                    try:
+                        merge_guest_cart(guest_cart, user)
+                    except Exception:  # a bad guest cart must not block authentication
+                        logger.exception('Dropping guest cart that could not be merged for user %s', user.pk)
+                    guest_cart.discard(response)
+        except GuestCartBusy:
+            pass
+        return response
+
     @action(detail=False, methods=['post'], url_path='register')
     def register(self, request):
         serializer = serializers.UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
             token, _ = Token.objects.get_or_create(user=user)
-            return Response({
+            response = Response({
                 'user': UserSerializer(user).data,
                 'token': token.key
             }, status=status.HTTP_201_CREATED)
+            return self.adopt_guest_cart(request, user, response)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['post'], url_path='login')
@@ -135,10 +416,11 @@ class UserViewSet(viewsets.ModelViewSet):
             if user is not None:
                 login(request, user)
                 token, _ = Token.objects.get_or_create(user=user)
-                return Response({
+                response = Response({
                     'user': UserSerializer(user).data,
                     'token': token.key
                 }, status=status.HTTP_200_OK)
+                return self.adopt_guest_cart(request, user, response)
             return Response({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -153,6 +435,23 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response({'status': 'password_changed'}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'], url_path='auth-cache-stats')
+    def auth_cache_stats(self, request):
+        stats = token_cache.stats.snapshot()
+        stats['size'] = len(token_cache)
+        return Response(stats, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'], url_path='username')
     def get_username(self, request):
         return Response({'username': request.user.username}, status=status.HTTP_200_OK)
+
+
+
+class MetricsViewSet(viewsets.ViewSet):
+    """
+    Per-route request histograms collected by RequestTimingMiddleware (staff only).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        return Response(route_histograms.snapshot(), status=status.HTTP_200_OK)
@@ -2,6 +2,7 @@
 ASGI config for store_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Catalog reads under ``/async/`` (see ``backend.async_views``) run natively on the event loop.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
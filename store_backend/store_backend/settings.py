@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import sqlite_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.instrumentation.RequestTimingMiddleware',
+    'backend.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,13 +80,71 @@ WSGI_APPLICATION = 'store_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# STORE_DB_PROFILE selects the SQLite tuning profile ('development' or 'production'),
+# see store_backend/database.py.
+# The test database is file-backed rather than in-memory so that multi-threaded tests
+# (e.g. concurrent checkouts) get real SQLite locking instead of shared-cache table locks.
+
+DB_PROFILE = os.environ.get('STORE_DB_PROFILE', 'development')
+
 DATABASES = {
+    'default': sqlite_database(BASE_DIR / 'db.sqlite3', DB_PROFILE, test_name=BASE_DIR / 'test_db.sqlite3'),
+}
+
+# Catalog read replicas: STORE_DB_REPLICAS is a comma-separated list of SQLite files kept in
+# sync with the primary by external replication. Reads from the product and product-type
+# viewsets are spread over them; see backend/db_router.py.
+
+REPLICA_DATABASES = []
+
+for index, replica_path in enumerate(filter(None, os.environ.get('STORE_DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = sqlite_database(replica_path.strip(), DB_PROFILE)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['backend.db_router.CatalogReplicaRouter']
+
+REPLICATION = {
+    'STICKY_SECONDS': 5,
+    'STICKY_COOKIE': 'db_primary',
+    'MAX_LAG_SECONDS': 2,
+    'LAG_CHECK_INTERVAL': 1,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The catalog cache holds rendered product/product-type responses. Entries expire after TIMEOUT
+# seconds and the least recently used ones are culled once MAX_ENTRIES is reached. It is per
+# process, and so is the version key that writes bump to invalidate it unless
+# CATALOG_VERSION_CACHE names a shared alias: with more than one process and no shared alias, the
+# other processes serve stale responses for up to TIMEOUT seconds after a write.
+# Setting STORE_REDIS_URL adds the shared Redis alias 'shared', used for the version key and
+# guest carts.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
 }
 
+if os.environ.get('STORE_REDIS_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['STORE_REDIS_URL'],
+    }
+
+CATALOG_VERSION_CACHE = 'shared' if 'shared' in CACHES else None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -105,6 +168,118 @@ AUTH_PASSWORD_VALIDATORS = [
 AUTH_USER_MODEL = "backend.CustomerUser" 
 
 
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+# Token auth goes through an in-process LRU (see TOKEN_CACHE) so repeat requests skip the
+# token+user query. With more than one process, set SHARED_CACHE to a shared CACHES alias; it
+# replaces the LRU so invalidations reach every process. Bulk `update()`s of users skip the
+# invalidation signals, so their tokens stay cached for up to TTL seconds.
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'backend.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+
+TOKEN_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60,
+    'SHARED_CACHE': None,
+}
+
+# Login, register and password changes each run a full password hash. Requests beyond these
+# token-bucket rates (N requests, refilled over the period) get a 429 with Retry-After before
+# any hashing. SHARED_CACHE is the CACHES alias that shares buckets between processes (the
+# 'shared' Redis alias when STORE_REDIS_URL is set); without one each process keeps its own
+# buckets, which the backend.E002 system check rejects when WORKER_PROCESSES is above 1. Set
+# NUM_PROXIES to the number of trusted proxies in front of the app (X-Forwarded-For is ignored at 0).
+
+# Number of worker processes serving the app; WEB_CONCURRENCY is also read by gunicorn.
+WORKER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+AUTH_THROTTLE = {
+    'SHARED_CACHE': 'shared' if 'shared' in CACHES else None,
+    'MAX_ENTRIES': 100000,
+    'LOCK_TIMEOUT': 1,
+    'LOCK_WAIT': 0.1,
+    'NUM_PROXIES': 0,
+    'RATES': {
+        'login': {'ip': '20/min', 'username': '5/min'},
+        'register': {'ip': '10/min'},
+        'change_password': {'ip': '10/min', 'username': '5/min'},
+    },
+}
+
+
+# Request instrumentation
+# When enabled, every response carries a Server-Timing header (db, serializer, view, total),
+# requests slower than SLOW_REQUEST_MS are logged to 'backend.requests' with their slowest
+# queries, and per-route histograms are served to staff at /metrics/.
+
+REQUEST_TIMING = {
+    'ENABLED': False,
+    'SLOW_REQUEST_MS': 500,
+    'SLOWEST_QUERIES': 3,
+}
+
+
+# Catalog listings (products, product types) use keyset pagination on the primary key.
+# Clients may ask for a smaller or larger page with ?page_size=, capped at CATALOG_MAX_PAGE_SIZE.
+
+CATALOG_PAGE_SIZE = 50
+
+CATALOG_MAX_PAGE_SIZE = 200
+
+
+# Catalog change feed
+# Product and product-type writes are logged by database triggers and served at
+# /products/changes/?since=<seq> in pages of PAGE_SIZE (up to MAX_PAGE_SIZE with ?limit=).
+# `manage.py compact_catalog_changes` trims entries older than RETENTION_DAYS.
+
+CHANGE_FEED = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 1000,
+    'RETENTION_DAYS': 30,
+}
+
+
+# Guest carts
+# Anonymous shoppers' carts live in a signed COOKIE (no database writes), expire after TTL seconds
+# of inactivity, and are merged into the user's cart at login/register. Set CACHE to a CACHES alias
+# shared by every process (Redis or Memcached, enforced by the backend.E001 system check) to keep
+# the contents there instead; each write then holds a per-cart lock (expiring after LOCK_TIMEOUT
+# seconds), and a request that cannot get it within LOCK_WAIT seconds gets a 409. A cart holds at
+# most MAX_ITEMS products and MAX_QUANTITY of each.
+
+GUEST_CARTS = {
+    'CACHE': 'shared' if 'shared' in CACHES else None,
+    'COOKIE': 'guest_cart',
+    'TTL': 7 * 24 * 60 * 60,
+    'MAX_ITEMS': 100,
+    'MAX_QUANTITY': 1000,
+    'LOCK_TIMEOUT': 5,
+    'LOCK_WAIT': 2,
+}
+
+
+# Catalog snapshots
+# `manage.py build_catalog_snapshots` writes the product listing per product type (plus gzip and,
+# when the brotli package is installed, brotli variants) under ROOT, served at /snapshots/products/.
+# Pagination links inside the files use BASE_URL. Every committed catalog write marks them stale
+# (requests fall back to the live listing). Run `build_catalog_snapshots --changed` periodically to
+# rebuild just the changed product types, or set REBUILD_ON_WRITE to do that on a background
+# thread REBUILD_DELAY seconds after the first of a burst of writes.
+
+CATALOG_SNAPSHOTS = {
+    'ROOT': BASE_DIR / 'snapshots',
+    'BASE_URL': 'http://localhost:8000',
+    'REBUILD_ON_WRITE': False,
+    'REBUILD_DELAY': 5,
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -1,6 +1,8 @@
 from django.urls import path, include
-from backend.urls import router as backend_router
+from backend.urls import router as backend_router, async_urlpatterns, snapshot_urlpatterns
 
 urlpatterns = [
+    path('', include(async_urlpatterns)),
+    path('', include(snapshot_urlpatterns)),
     path('', include(backend_router.urls)),
 ]
\ No newline at end of file